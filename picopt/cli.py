@@ -8,11 +8,21 @@ from confuse.exceptions import ConfigError
 from termcolor import colored, cprint
 
 from picopt import PROGRAM_NAME, walk
-from picopt.config import ALL_FORMAT_STRS, DEFAULT_HANDLERS, get_config
+from picopt.config import (
+    ALL_FORMAT_STRS,
+    DECODE_MEMORY_AUTO,
+    DEFAULT_HANDLERS,
+    EXECUTORS,
+    TASK_ORDERS,
+    TIMESTAMPS_BACKENDS,
+    VERIFY_MODES,
+    get_config,
+)
 from picopt.exceptions import PicoptError
 from picopt.handlers.png import Png
 from picopt.handlers.webp import WebPLossless
 from picopt.handlers.zip import Cbr, Rar
+from picopt.priority import IONICE_CLASSES
 
 _DEFAULT_FORMAT_STRS = frozenset(
     [handler_cls.OUTPUT_FORMAT_STR for handler_cls in DEFAULT_HANDLERS]
@@ -39,6 +49,199 @@ def _comma_join(formats: frozenset[str]) -> str:
     return ", ".join(sorted(formats))
 
 
+def _add_cache_arguments(parser: ArgumentParser) -> None:
+    """Add the options for caches kept between runs."""
+    parser.add_argument(
+        "--output-cache",
+        type=str,
+        action="store",
+        dest="output_cache",
+        metavar="PATH",
+        help="Cache optimized images in the directory at PATH and reuse them "
+        "for identical input with the same settings and programs. Several "
+        "picopt processes may share the cache.",
+    )
+    parser.add_argument(
+        "--output-cache-size",
+        type=int,
+        action="store",
+        dest="output_cache_size",
+        metavar="MB",
+        help="Megabytes to keep in the --output-cache. The least recently used "
+        "entries are removed first. Defaults to 1024.",
+    )
+    parser.add_argument(
+        "--format-cache",
+        type=str,
+        action="store",
+        dest="format_cache",
+        metavar="PATH",
+        help="Remember the formats and metadata of files in a SQLite file at "
+        "PATH so unchanged files aren't opened again to identify them.",
+    )
+    parser.add_argument(
+        "--ledger",
+        type=str,
+        action="store",
+        dest="ledger",
+        metavar="PATH",
+        help="Keep a ledger of content hashes in a SQLite file at PATH and "
+        "skip files whose content was already optimized or gained nothing "
+        "with the same settings and programs, wherever the file is.",
+    )
+
+
+def _add_jobs_arguments(parser: ArgumentParser) -> None:
+    """Add the options for parallel jobs."""
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        action="store",
+        dest="jobs",
+        help="Number of parallel jobs to run simultaneously. Defaults "
+        "to number of available cores, respecting CPU affinity and cgroup CPU "
+        "quotas.",
+    )
+    _add_memory_arguments(parser)
+    parser.add_argument(
+        "--adaptive-jobs",
+        action="store_true",
+        dest="adaptive_jobs",
+        help="Adjust the number of running jobs between --min-jobs and --jobs "
+        "while running, by measuring throughput, iowait and load. Adjustments "
+        "are printed with -vv.",
+    )
+    parser.add_argument(
+        "--min-jobs",
+        type=int,
+        action="store",
+        dest="min_jobs",
+        metavar="N",
+        help="The fewest jobs --adaptive-jobs runs. Defaults to 1.",
+    )
+
+
+def _add_priority_arguments(parser: ArgumentParser) -> None:
+    """Add the options for running in the background."""
+    parser.add_argument(
+        "--cpu-affinity",
+        type=str,
+        action="store",
+        dest="cpu_affinity",
+        metavar="CPUS",
+        help="Run picopt, its jobs and the programs they run only on these "
+        "cpus, as a list like 0-3,8. Jobs default to the number of these cpus.",
+    )
+    parser.add_argument(
+        "--nice",
+        type=int,
+        action="store",
+        dest="nice",
+        metavar="N",
+        help="Run picopt, its jobs and the programs they run at this nice "
+        "level. 19 is the lowest priority.",
+    )
+    parser.add_argument(
+        "--ionice-class",
+        choices=IONICE_CLASSES,
+        action="store",
+        dest="ionice_class",
+        help="Run picopt, its jobs and the programs they run in this Linux io "
+        "scheduling class. Idle only uses the disks when nothing else does.",
+    )
+    parser.add_argument(
+        "--ionice-level",
+        type=int,
+        action="store",
+        dest="ionice_level",
+        metavar="N",
+        help="Priority within the realtime or best-effort --ionice-class from "
+        "0, the highest, to 7. Defaults to 4.",
+    )
+
+
+def _add_io_limit_arguments(parser: ArgumentParser) -> None:
+    """Add the options that limit disk io."""
+    parser.add_argument(
+        "--read-mbps",
+        type=float,
+        action="store",
+        dest="read_mbps",
+        metavar="MB",
+        help="Megabytes per second read from files by picopt and all its jobs. "
+        "0 is unlimited. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--read-iops",
+        type=float,
+        action="store",
+        dest="read_iops",
+        metavar="N",
+        help="Operations per second read from files by picopt and all its jobs. "
+        "0 is unlimited. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--write-mbps",
+        type=float,
+        action="store",
+        dest="write_mbps",
+        metavar="MB",
+        help="Megabytes per second written to files by picopt and all its jobs. "
+        "0 is unlimited. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--write-iops",
+        type=float,
+        action="store",
+        dest="write_iops",
+        metavar="N",
+        help="Operations per second written to files by picopt and all its jobs. "
+        "0 is unlimited. Defaults to 0.",
+    )
+
+
+def _decode_memory(value: str) -> int | str:
+    """Parse megabytes or auto."""
+    return value if value == DECODE_MEMORY_AUTO else int(value)
+
+
+def _add_memory_arguments(parser: ArgumentParser) -> None:
+    """Add the options that bound memory use."""
+    parser.add_argument(
+        "--container-memory",
+        type=int,
+        action="store",
+        dest="container_memory",
+        metavar="MB",
+        help="Megabytes of optimized contents all open containers may hold in "
+        "memory before spilling to disk. Containers larger than this are "
+        "repacked into a working file instead of memory. Defaults to 256.",
+    )
+    parser.add_argument(
+        "--queue-memory",
+        type=int,
+        action="store",
+        dest="queue_memory",
+        metavar="MB",
+        help="Megabytes of file data allowed in tasks sent to the parallel jobs "
+        "before waiting for some to finish. 0 is unlimited. Defaults to 1024.",
+    )
+    parser.add_argument(
+        "--decode-memory",
+        type=_decode_memory,
+        action="store",
+        dest="decode_memory",
+        metavar="MB",
+        help="Megabytes of decoded images allowed in tasks sent to the parallel "
+        "jobs, estimated from their headers, before waiting for some to finish. "
+        "Images bigger than this run one at a time beside the others. "
+        f"{DECODE_MEMORY_AUTO} uses half of a cgroup memory limit if there is "
+        "one. Each file's header is read to estimate it while walking. "
+        "0 is unlimited. Defaults to 0.",
+    )
+
+
 def get_arguments(params: tuple[str, ...] | None = None) -> Namespace:
     """Parse the command line."""
     description = "Losslessly optimizes and optionally converts images."
@@ -161,6 +364,15 @@ def get_arguments(params: tuple[str, ...] | None = None) -> Namespace:
         default=True,
         help="Do not compare program config options with loaded timestamps.",
     )
+    parser.add_argument(
+        "--timestamps-backend",
+        choices=TIMESTAMPS_BACKENDS,
+        action="store",
+        dest="timestamps_backend",
+        help="Store timestamps in a yaml file or an indexed SQLite database. "
+        "SQLite loads nothing up front and commits as it goes, which suits "
+        "trees with millions of files. Defaults to yaml.",
+    )
     parser.add_argument(
         "-A",
         "--after",
@@ -192,13 +404,99 @@ def get_arguments(params: tuple[str, ...] | None = None) -> Namespace:
         help="Strip metadata like EXIF, XMP and ICC Profiles",
     )
     parser.add_argument(
-        "-j",
-        "--jobs",
+        "--verify",
+        choices=VERIFY_MODES,
+        action="store",
+        dest="verify",
+        help="How images are checked before optimizing. Full runs Pillow's "
+        "verify, header only opens the image without verifying it and none "
+        "trusts the format read from the first bytes of the file when that "
+        "is enough. Defaults to full.",
+    )
+    _add_jobs_arguments(parser)
+    _add_priority_arguments(parser)
+    _add_io_limit_arguments(parser)
+    parser.add_argument(
+        "--order",
+        choices=TASK_ORDERS,
+        action="store",
+        dest="order",
+        help="Order to send files to the parallel jobs: path, largest first or "
+        "newest first. Largest first keeps one big file from finishing last. "
+        "Defaults to path.",
+    )
+    parser.add_argument(
+        "--journal",
+        action="store_true",
+        dest="journal",
+        help="Keep a journal of finished files in each top path to resume an "
+        "interrupted run from. Interrupted runs finish the running tasks and "
+        "save timestamps either way.",
+    )
+    parser.add_argument(
+        "--no-duplicates",
+        action="store_false",
+        dest="duplicates",
+        help="Don't compare files of the same size and type while they're "
+        "being optimized. Identical files are each optimized on their own.",
+    )
+    parser.add_argument(
+        "--hardlink-duplicates",
+        action="store_true",
+        dest="hardlink_duplicates",
+        help="Identical files found while the first is being optimized are "
+        "optimized once. With this option the copies become hardlinks to the "
+        "optimized file instead of copies of it. Hardlinks share the optimized "
+        "file's permissions and times.",
+    )
+    _add_cache_arguments(parser)
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        action="store",
+        dest="executor",
+        help="Run the parallel jobs in processes, threads or both. Hybrid runs "
+        "files optimized by external programs in threads and files optimized "
+        "by Pillow in processes. Defaults to auto, which uses threads on free "
+        "threaded python builds and processes otherwise.",
+    )
+    parser.add_argument(
+        "--tool-jobs",
         type=int,
         action="store",
-        dest="jobs",
-        help="Number of parallel jobs to run simultaneously. Defaults "
-        "to number of available cores.",
+        dest="tool_jobs",
+        help="Number of copies of each external program a process may run at "
+        "once. Matters for the thread and hybrid executors. Defaults to the "
+        "number of available cores.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        dest="watch",
+        help="After optimizing the paths, keep running and optimize files as "
+        "they are added or changed. Uses inotify when available and polling "
+        "otherwise. Stop with Ctrl-C.",
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        action="store",
+        dest="queue",
+        metavar="PATH",
+        help="Send tasks to picopt workers through a SQLite work queue at "
+        "PATH, usually on a shared filesystem. The workers must see the files "
+        "at the same paths. --jobs limits tasks in flight across all workers. "
+        "Workers must run with the same optimization settings. Tasks name "
+        "files for the workers to overwrite, so the queue must be owned by "
+        "and only writable by your user. Workers stop if this picopt stops "
+        "updating the queue.",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        dest="worker",
+        help="Run tasks from the --queue of another picopt instead of walking "
+        "paths. Runs --jobs tasks at once until that picopt finishes.",
     )
     parser.add_argument(
         "-C",
@@ -235,7 +533,7 @@ def get_arguments(params: tuple[str, ...] | None = None) -> Namespace:
         "paths",
         metavar="path",
         type=str,
-        nargs="+",
+        nargs="*",
         help="File or directory paths to optimize",
     )
 
@@ -243,6 +541,8 @@ def get_arguments(params: tuple[str, ...] | None = None) -> Namespace:
         params = params[1:]
 
     pns = parser.parse_args(params)
+    if not pns.paths and not pns.worker:
+        parser.error("the following arguments are required: path")
 
     # increment verbose
     if pns.verbose is not None and pns.verbose > 0:
@@ -257,7 +557,10 @@ def main(args: tuple[str, ...] | None = None):
         arguments = get_arguments(args)
 
         config = get_config(arguments)
-        wob = walk.Walk(config)
+        if config.worker:
+            walk.Worker(config).run()
+            return
+        wob = walk.Watch(config) if config.watch else walk.Walk(config)
         totals = wob.run()
         totals.report()
     except ConfigError as err:
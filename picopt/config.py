@@ -1,11 +1,13 @@
 """Confuse config for picopt."""
 
+import json
 import shutil
 import subprocess
 import time
 from argparse import Namespace
 from collections.abc import ItemsView, Iterable
 from dataclasses import dataclass, fields
+from importlib.metadata import PackageNotFoundError, version
 from pathlib import Path
 from types import MappingProxyType
 
@@ -15,11 +17,14 @@ from confuse.templates import (
     Choice,
     Integer,
     MappingTemplate,
+    Number,
+    OneOf,
     Optional,
     Sequence,
 )
 from confuse.templates import Path as ConfusePath
 from dateutil.parser import parse
+from humanize import naturalsize
 from termcolor import cprint
 
 from picopt import PROGRAM_NAME
@@ -40,6 +45,8 @@ from picopt.handlers.svg import Svg
 from picopt.handlers.webp import WebPLossless
 from picopt.handlers.webp_animated import WebPAnimatedLossless
 from picopt.handlers.zip import Cbr, Cbz, EPub, Rar, Zip
+from picopt.priority import IONICE_CLASSES, parse_cpu_list
+from picopt.resources import detect_resources
 
 ###########################
 # Confuse Config Template #
@@ -84,37 +91,72 @@ ALL_FORMAT_STRS: frozenset[str] = (
     | _CONTAINER_CONVERTIBLE_FORMAT_STRS
     | {str(MPO_FILE_FORMAT.format_str)}
 )
+TASK_ORDERS = ("path", "largest", "newest")
+EXECUTORS = ("auto", "process", "thread", "hybrid")
+TIMESTAMPS_BACKENDS = ("yaml", "sqlite")
+VERIFY_MODES = ("full", "header", "none")
+DECODE_MEMORY_AUTO = "auto"
 TEMPLATE = MappingTemplate(
     {
         PROGRAM_NAME: MappingTemplate(
             {
+                "adaptive_jobs": bool,
                 "after": Optional(float),
                 "bigger": bool,
+                "container_memory": Integer(),
                 "convert_to": Optional(Sequence(Choice(_CONVERT_TO_FORMAT_STRS))),
+                "cpu_affinity": Optional(str),
+                "decode_memory": OneOf((Integer(), Choice((DECODE_MEMORY_AUTO,)))),
                 "disable_programs": Sequence(str),
+                "duplicates": bool,
+                "executor": Choice(EXECUTORS),
                 "extra_formats": Optional(Sequence(Choice(ALL_FORMAT_STRS))),
+                "format_cache": Optional(ConfusePath()),
                 "formats": Sequence(Choice(ALL_FORMAT_STRS)),
+                "hardlink_duplicates": bool,
                 "ignore": Sequence(str),
+                "ionice_class": Optional(Choice(IONICE_CLASSES)),
+                "ionice_level": Optional(Integer()),
                 "jobs": Integer(),
+                "journal": bool,
+                "order": Choice(TASK_ORDERS),
                 "keep_metadata": bool,
+                "ledger": Optional(ConfusePath()),
                 "list_only": bool,
+                "min_jobs": Integer(),
                 "near_lossless": bool,
+                "nice": Optional(Integer()),
+                "output_cache": Optional(ConfusePath()),
+                "output_cache_size": Integer(),
                 "paths": Sequence(ConfusePath()),
                 "png_max": bool,
                 "preserve": bool,
+                "queue": Optional(ConfusePath()),
+                "queue_memory": Integer(),
+                "read_iops": Number(),
+                "read_mbps": Number(),
                 "recurse": bool,
                 "symlinks": bool,
                 "test": bool,
                 "timestamps": bool,
+                "timestamps_backend": Choice(TIMESTAMPS_BACKENDS),
                 "timestamps_check_config": bool,
+                "tool_jobs": Integer(),
                 "verbose": Integer(),
+                "verify": Choice(VERIFY_MODES),
+                "watch": bool,
+                "worker": bool,
+                "write_iops": Number(),
+                "write_mbps": Number(),
                 "computed": Optional(
                     MappingTemplate(
                         {
+                            "cpus": int,
                             "native_handlers": dict,
                             "convert_handlers": dict,
                             "handler_stages": dict,
                             "is_modern_cwebp": bool,
+                            "output_cache_keys": dict,
                         }
                     )
                 ),
@@ -132,9 +174,16 @@ TIMESTAMPS_CONFIG_KEYS = {
     "recurse",
     "symlinks",
 }
+# Settings besides TIMESTAMPS_CONFIG_KEYS that change optimized output.
+OUTPUT_CACHE_CONFIG_KEYS = frozenset({"png_max", "near_lossless"})
+# Packages that run internal stages.
+_OUTPUT_CACHE_PACKAGES = (PROGRAM_NAME, "pillow", "pyoxipng")
 # cwebp before this version only accepts PNG & WEBP
 MIN_CWEBP_VERSION = (1, 2, 3)
 _JPEG_PROGS = frozenset({"mozjpeg", "jpegtran"})
+# Share of a container's memory limit for decoding images in flight.
+_DECODE_MEMORY_LIMIT_FRACTION = 0.5
+_MB = 1024 * 1024
 
 
 ########################
@@ -423,6 +472,52 @@ def _set_format_handler_map(config: Subview) -> None:
 #########################
 # Other Computed Config #
 #########################
+def _get_package_version(package: str) -> str:
+    """Get an installed package version."""
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return ""
+
+
+def _get_program_fingerprint(exec_args: tuple[str, ...] | None) -> list:
+    """Identify a program's build without running it."""
+    if not exec_args:
+        return []
+    try:
+        stat = Path(exec_args[0]).stat()
+    except OSError:
+        return list(exec_args)
+    return [*exec_args, stat.st_size, stat.st_mtime_ns]
+
+
+def _set_output_cache_keys(config: Subview) -> None:
+    """Serialize everything that shapes each handler's output."""
+    output_cache_keys = {}
+    if config["output_cache"].get():
+        settings = {
+            key: config[key].get()
+            for key in sorted(TIMESTAMPS_CONFIG_KEYS | OUTPUT_CACHE_CONFIG_KEYS)
+        }
+        settings["versions"] = [
+            _get_package_version(package) for package in _OUTPUT_CACHE_PACKAGES
+        ]
+        handler_stages: dict = config["computed"]["handler_stages"].get(dict)  # type: ignore
+        for handler_class, stages in handler_stages.items():
+            handler_settings = {
+                **settings,
+                "handler": handler_class.__name__,
+                "stages": {
+                    func: _get_program_fingerprint(exec_args)
+                    for func, exec_args in stages.items()
+                },
+            }
+            output_cache_keys[handler_class] = json.dumps(
+                handler_settings, sort_keys=True, default=str
+            )
+    config["computed"]["output_cache_keys"].set(output_cache_keys)
+
+
 def _set_after(config: Subview) -> None:
     after = config["after"].get()
     if after is None:
@@ -478,6 +573,39 @@ def _set_timestamps(config: Subview) -> None:
         cprint(ts_str, "cyan")
 
 
+def _set_resources(config: Subview) -> None:
+    """Set default jobs and decode memory budget from the available resources."""
+    # The walk pins to the cpu list later so count it now.
+    cpu_affinity: str | None = config["cpu_affinity"].get()  # type: ignore
+    affinity = parse_cpu_list(cpu_affinity) if cpu_affinity else None
+    resources = detect_resources(affinity=affinity)
+    config["computed"]["cpus"].set(resources.cpus)
+    messages = []
+    if not config["jobs"].get(int):
+        config["jobs"].set(resources.cpus)
+        messages.append(
+            f"Running {resources.cpus} jobs from the {resources.cpu_source}."
+        )
+    if not config["tool_jobs"].get(int):
+        config["tool_jobs"].set(resources.cpus)
+    if config["decode_memory"].get() == DECODE_MEMORY_AUTO:
+        decode_memory = 0
+        if resources.memory_limit:
+            decode_memory = int(
+                resources.memory_limit * _DECODE_MEMORY_LIMIT_FRACTION // _MB
+            )
+            limit = naturalsize(resources.memory_limit, binary=True)
+            messages.append(
+                f"Decoding up to {decode_memory} MB of images at once, half the "
+                f"cgroup memory limit of {limit}."
+            )
+        config["decode_memory"].set(decode_memory)
+    verbose: int = config["verbose"].get(int)  # type: ignore
+    if verbose > 1:
+        for message in messages:
+            cprint(message, "cyan")
+
+
 def get_config(args: Namespace | None = None, modname=PROGRAM_NAME) -> AttrDict:
     """Get the config dict, layering env and args over defaults."""
     config = Configuration(PROGRAM_NAME, modname=modname, read=False)
@@ -489,9 +617,11 @@ def get_config(args: Namespace | None = None, modname=PROGRAM_NAME) -> AttrDict:
         config.set_args(args)
     config_program = config[PROGRAM_NAME]
     _set_format_handler_map(config_program)
+    _set_output_cache_keys(config_program)
     _set_after(config_program)
     _set_ignore(config_program)
     _set_timestamps(config_program)
+    _set_resources(config_program)
     ad = config.get(TEMPLATE)
     if not isinstance(ad, AttrDict):
         msg = "Not a valid config"
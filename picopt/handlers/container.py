@@ -1,9 +1,11 @@
 """Optimize comic archives."""
 
+import hashlib
+import shutil
 from abc import ABCMeta, abstractmethod
 from collections.abc import Generator, Mapping
-from io import BytesIO
-from multiprocessing.pool import ApplyResult
+from pathlib import Path
+from threading import Lock
 from typing import BinaryIO
 
 from confuse.templates import AttrDict
@@ -11,15 +13,46 @@ from termcolor import cprint
 
 from picopt.formats import FileFormat
 from picopt.handlers.handler import Handler
-from picopt.path import PathInfo
+from picopt.path import PathInfo, is_path_ignored
 from picopt.stats import ReportStats
 
 
+class _ContentsMemory:
+    """Optimized contents held in memory by every container in this process."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.used: int = 0
+        self._lock = Lock()
+
+    def reserve(self, size: int, budget: int) -> bool:
+        """Take memory for contents if it fits in the budget."""
+        with self._lock:
+            if self.used + size > budget:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size: int) -> None:
+        """Give back memory."""
+        with self._lock:
+            self.used -= size
+
+
+_contents_memory = _ContentsMemory()
+
+
+def get_contents_memory_used() -> int:
+    """Return the bytes of optimized contents all containers hold in memory."""
+    return _contents_memory.used
+
+
 class ContainerHandler(Handler, metaclass=ABCMeta):
     """Comic format class."""
 
     CONTAINER_DIR_SUFFIX: str = ".dir"
     CONVERT: bool = True
+    MB: int = 1024 * 1024
 
     @classmethod
     @abstractmethod
@@ -31,7 +64,7 @@ class ContainerHandler(Handler, metaclass=ABCMeta):
         """Unpack a container into a tmp dir to work on it's contents."""
 
     @abstractmethod
-    def pack_into(self) -> BytesIO:
+    def pack_into(self) -> BinaryIO:
         """Create a container from a tmp dir's contents."""
 
     def __init__(
@@ -49,8 +82,17 @@ class ContainerHandler(Handler, metaclass=ABCMeta):
             info,
         )
         self.comment: bytes | None = None
-        self._tasks: dict[PathInfo, ApplyResult] = {}
-        self._optimized_contents: dict[PathInfo, bytes] = {}
+        self._optimized_contents: dict[PathInfo, bytes | Path | None] = {}
+        # Contents over the memory budget shared by all containers spill to a
+        # scratch dir.
+        self._memory_budget: int = config.container_memory * self.MB
+        self._memory_used: int = 0
+        self._spill_dir: Path | None = None
+        self._spill_count: int = 0
+        # Members with the same data as an earlier member reuse its result.
+        self._originals: dict[tuple, list[PathInfo]] = {}
+        self._hashes: dict[PathInfo, str] = {}
+        self._duplicates: dict[PathInfo, list[PathInfo]] = {}
 
     def get_container_paths(self) -> tuple[str, ...]:
         """Create a container path for output."""
@@ -61,29 +103,155 @@ class ContainerHandler(Handler, metaclass=ABCMeta):
         if self.config.verbose:
             cprint(f"Unpacking {self.original_path}...", end="")
 
-        yield from self.unpack_into()
+        for path_info in self.unpack_into():
+            # Reserve the slot to keep the original order when repacking.
+            self._optimized_contents[path_info] = None
+            yield path_info
 
         if self.config.verbose:
             cprint("done")
 
-    def set_task(self, path_info: PathInfo, mp_result: ApplyResult | None) -> None:
-        """Store the mutiprocessing task."""
-        if mp_result is None:
-            # if not handled by picopt, place it in the results.
-            self._optimized_contents[path_info] = path_info.data()
-        else:
-            self._tasks[path_info] = mp_result
-
-    def optimize_contents(self) -> None:
-        """Store results from mutiprocessing task."""
-        for path_info in tuple(self._tasks):
-            mp_results = self._tasks.pop(path_info)
-            report = mp_results.get()
-            data = report.data if report.data else path_info.data()
-            # Clearing has to happen AFTER mp_results.get() or we risk not passing the data
+    @staticmethod
+    def _get_duplicate_key(path_info: PathInfo) -> tuple:
+        """Group members by suffix, size and a cheap checksum or hash."""
+        zipinfo = path_info.zipinfo
+        if path_info.is_lazy_member() and zipinfo:
+            # Archived members are only read to hash on a collision.
+            crc = getattr(zipinfo, "CRC", None)
+            return (path_info.suffix(), zipinfo.file_size, crc)
+        # Data in memory is cleared once optimized, so hash it now.
+        data = path_info.data()
+        digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        return (path_info.suffix(), len(data), digest)
+
+    def _get_hash(self, path_info: PathInfo) -> str:
+        """Hash an archived member's data."""
+        digest = self._hashes.get(path_info)
+        if digest is None:
+            data = path_info.data()
+            digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+            self._hashes[path_info] = digest
+            # The data can be read from the archive again.
             path_info.data_clear()
+        return digest
+
+    def _is_same_data(self, path_info: PathInfo, original: PathInfo) -> bool:
+        """Compare members with the same key."""
+        if not path_info.is_lazy_member():
+            # The key has the hash.
+            return True
+        return self._get_hash(path_info) == self._get_hash(original)
+
+    def _set_duplicate(self, path_info: PathInfo, original: PathInfo) -> None:
+        """Store the original's result for a duplicate member."""
+        if original.container_filename:
+            suffix = Path(original.container_filename).suffix
+            path_info.container_filename = str(
+                Path(path_info.name()).with_suffix(suffix)
+            )
+        data = self._optimized_contents[original]
+        if data is not None:
+            path_info.data_clear()
+        self._optimized_contents[path_info] = data
+
+    def add_member(self, path_info: PathInfo) -> bool:
+        """Group a member with identical earlier members.
+
+        Return whether it's a duplicate that will reuse the result of an
+        original instead of being optimized.
+        """
+        if is_path_ignored(self.config, Path(path_info.name())):
+            return False
+        key = self._get_duplicate_key(path_info)
+        originals = self._originals.setdefault(key, [])
+        for original in originals:
+            if self._is_same_data(path_info, original):
+                duplicates = self._duplicates.get(original)
+                if duplicates is None:
+                    self._set_duplicate(path_info, original)
+                else:
+                    duplicates.append(path_info)
+                return True
+        originals.append(path_info)
+        self._duplicates[path_info] = []
+        return False
+
+    def get_spill_path(self) -> Path:
+        """Return a new file path in the scratch dir."""
+        if not self._spill_dir:
+            self._spill_dir = self.get_working_path("contents")
+            self._spill_dir.mkdir(parents=True, exist_ok=True)
+        spill_path = self._spill_dir / str(self._spill_count)
+        self._spill_count += 1
+        return spill_path
+
+    def _spill(self, data: bytes) -> Path:
+        """Write contents data to the scratch dir."""
+        spill_path = self.get_spill_path()
+        spill_path.write_bytes(data)
+        return spill_path
+
+    def set_task(self, path_info: PathInfo, report: ReportStats | None) -> None:
+        """Store the result of a contents task.
+
+        Contents without new data are stored as None and their original data is
+        read when repacking. Contents over the memory budget are stored as a
+        path to a scratch file.
+        """
+        data = None
+        if report is not None and not report.exc:
+            if report.data:
+                data = report.data
+                # Clearing has to happen AFTER the task finished or we risk not passing the data
+                path_info.data_clear()
             path_info.container_filename = str(report.path)
-            self._optimized_contents[path_info] = data
+        if data is not None:
+            size = len(data)
+            if _contents_memory.reserve(size, self._memory_budget):
+                self._memory_used += size
+            else:
+                data = self._spill(data)
+        self._optimized_contents[path_info] = data
+        for duplicate in self._duplicates.pop(path_info, ()):
+            self._set_duplicate(duplicate, path_info)
+
+    @staticmethod
+    def get_contents_data(path_info: PathInfo, data: bytes | Path | None) -> bytes:
+        """Return the optimized data or the original data."""
+        if data is None:
+            return path_info.data()
+        if isinstance(data, Path):
+            # Duplicates share spill files. They're removed with the spill dir.
+            data = data.read_bytes()
+        return data
+
+    def get_memory_used(self) -> int:
+        """Return the bytes of optimized contents held in memory."""
+        return self._memory_used
+
+    def release_memory(self) -> None:
+        """Give the memory of contents no longer held back to the shared budget.
+
+        Called by the walker once the repacked or discarded container is done.
+        """
+        _contents_memory.release(self._memory_used)
+        self._memory_used = 0
+
+    def is_pack_to_file(self) -> bool:
+        """Whether to build the new container in a working file instead of memory."""
+        return bool(self.path_info.path) and (
+            self.path_info.bytes_in() > self._memory_budget
+        )
+
+    def _cleanup_spill(self) -> None:
+        """Remove the scratch dir."""
+        if self._spill_dir:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def discard(self) -> None:
+        """Drop the unpacked contents without repacking."""
+        self._cleanup_spill()
 
     def optimize(self) -> BinaryIO:
         """Run pack_into."""
@@ -94,7 +262,18 @@ class ContainerHandler(Handler, metaclass=ABCMeta):
         if self.config.verbose:
             cprint(f"Repacking {self.final_path}...", end="")
 
-        report_stats = self.optimize_wrapper()
+        try:
+            report_stats = self.optimize_wrapper()
+        finally:
+            self._cleanup_spill()
         if self.config.verbose:
             cprint("done")
         return report_stats
+
+    def error(self, exc: Exception) -> ReportStats:
+        """Clean up and return an error result."""
+        self._cleanup_spill()
+        if self.working_path not in (self.original_path, self.final_path):
+            # Partly packed.
+            self.working_path.unlink(missing_ok=True)
+        return super().error(exc)
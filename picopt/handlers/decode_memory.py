@@ -0,0 +1,111 @@
+"""Estimate the memory Pillow needs to decode an image from its header."""
+
+import warnings
+from io import BytesIO
+from struct import unpack_from
+from types import MappingProxyType
+
+from PIL import Image
+
+from picopt.handlers.sniff import HEADER_SIZE, WEBP_FORMAT_STR, sniff_format
+from picopt.path import PathInfo
+
+# Pillow keeps most modes in four bytes a pixel.
+_MODE_BYTES = MappingProxyType(
+    {
+        "1": 1,
+        "L": 1,
+        "P": 1,
+        "I;16": 2,
+        "I;16B": 2,
+        "I;16L": 2,
+        "I;16N": 2,
+        "BGR;15": 2,
+        "BGR;16": 2,
+        "BGR;24": 3,
+    }
+)
+_DEFAULT_MODE_BYTES = 4
+_VP8_START_CODE = b"\x9d\x01\x2a"
+_VP8L_SIGNATURE = 0x2F
+_VP8_DIMENSION_MASK = 0x3FFF
+_VP8L_DIMENSION_BITS = 14
+_WEBP_MIN_HEADER_SIZE = 30
+
+
+def _get_webp_size(header: bytes) -> tuple[int, int]:
+    """Read the canvas size from the first WebP chunk.
+
+    Pillow decodes the whole file to open a WebP.
+    """
+    if len(header) < _WEBP_MIN_HEADER_SIZE:
+        msg = "Short WebP header"
+        raise ValueError(msg)
+    chunk_type = header[12:16]
+    if chunk_type == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+    elif chunk_type == b"VP8L" and header[20] == _VP8L_SIGNATURE:
+        (bits,) = unpack_from("<I", header, 21)
+        width = (bits & _VP8_DIMENSION_MASK) + 1
+        height = ((bits >> _VP8L_DIMENSION_BITS) & _VP8_DIMENSION_MASK) + 1
+    elif chunk_type == b"VP8 " and header[23:26] == _VP8_START_CODE:
+        width, height = unpack_from("<HH", header, 26)
+        width &= _VP8_DIMENSION_MASK
+        height &= _VP8_DIMENSION_MASK
+    else:
+        msg = f"Unknown WebP chunk {chunk_type!r}"
+        raise ValueError(msg)
+    return width, height
+
+
+def _get_size_and_mode_bytes(header: bytes, format_str: str) -> tuple[int, int, int]:
+    """Get the dimensions and bytes per pixel from the header alone."""
+    if format_str == WEBP_FORMAT_STR:
+        return *_get_webp_size(header), _DEFAULT_MODE_BYTES
+    with warnings.catch_warnings():
+        # The worker warns about decompression bombs if it matters.
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        with Image.open(BytesIO(header), formats=(format_str,)) as image:
+            width, height = image.size
+            mode_bytes = _MODE_BYTES.get(image.mode, _DEFAULT_MODE_BYTES)
+    return width, height, mode_bytes
+
+
+def _estimate_unsniffed(path_info: PathInfo) -> int:
+    """Open a format the sniffer doesn't know with Pillow without decoding it.
+
+    Pillow only reads as far as the header it needs, which for TIFF may be
+    past the first block.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        with path_info.fp_or_buffer() as fp, Image.open(fp) as image:
+            width, height = image.size
+            mode_bytes = _MODE_BYTES.get(image.mode, _DEFAULT_MODE_BYTES)
+            frames = 2 if getattr(image, "is_animated", False) else 1
+    return width * height * mode_bytes * (frames + 1)
+
+
+def estimate_decode_memory(path_info: PathInfo) -> int:
+    """Estimate the bytes of pixels a handler holds at once.
+
+    Reads one header sized block and never seeks through the frames. Still
+    images are held decoded and converted. Animated images are repacked from
+    every decoded frame plus the canvas, counted from the header when it
+    holds the frame count. Formats the sniffer doesn't know are opened with
+    Pillow without decoding. Returns 0 for files that can't be read.
+    """
+    try:
+        with path_info.fp_or_buffer() as fp:
+            header = fp.read(HEADER_SIZE)
+        sniffed = sniff_format(BytesIO(header))
+        if not sniffed:
+            return _estimate_unsniffed(path_info)
+        if not sniffed.is_image:
+            return 0
+        width, height, mode_bytes = _get_size_and_mode_bytes(header, sniffed.format_str)
+    except Exception:
+        return 0
+    frames = sniffed.n_frames or (2 if sniffed.animated else 1)
+    return width * height * mode_bytes * (frames + 1)
@@ -0,0 +1,85 @@
+"""Run external programs on a shared asyncio event loop."""
+
+import asyncio
+import os
+import subprocess
+from collections.abc import Coroutine
+from threading import Lock, Thread
+from typing import Any
+
+
+class ExtRunner:
+    """Drive every external program of a process from one event loop thread.
+
+    Stages block on their own program while the loop feeds stdin and drains
+    stdout for all of them. Each program has its own concurrency limit.
+    """
+
+    def __init__(self, limit: int):
+        """Start the event loop thread."""
+        self._limit = max(1, limit)
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(
+            target=self._loop.run_forever, name="picopt-ext-runner", daemon=True
+        )
+        self._thread.start()
+
+    def _get_semaphore(self, program: str) -> asyncio.Semaphore:
+        """Get the program's semaphore. Only called on the loop."""
+        semaphore = self._semaphores.get(program)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._limit)
+            self._semaphores[program] = semaphore
+        return semaphore
+
+    async def _run_pipe(self, args: tuple[str, ...], input_data: bytes) -> bytes:
+        """Pipe data through a program."""
+        async with self._get_semaphore(args[0]):
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            stdout, _ = await proc.communicate(input_data)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, args, stdout)
+        return stdout
+
+    async def _run_fs(self, args: tuple[str, ...]) -> None:
+        """Run a program that reads and writes files."""
+        async with self._get_semaphore(args[0]):
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            _, stderr = await proc.communicate()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(
+                proc.returncode, args, stderr=stderr.decode(errors="replace")
+            )
+
+    def _wait(self, coro: Coroutine) -> Any:
+        """Run a coroutine on the loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def run_pipe(self, args: tuple[str, ...], input_data: bytes) -> bytes:
+        """Pipe data through a program and return its output."""
+        return self._wait(self._run_pipe(args, input_data))
+
+    def run_fs(self, args: tuple[str, ...]) -> None:
+        """Run a program that reads and writes files."""
+        self._wait(self._run_fs(args))
+
+
+_runner: ExtRunner | None = None
+_runner_pid: int = 0
+_runner_lock = Lock()
+
+
+def get_ext_runner(limit: int) -> ExtRunner:
+    """Get this process's runner, starting it with the limit if needed."""
+    global _runner, _runner_pid  # noqa: PLW0603
+    with _runner_lock:
+        # A forked worker inherits the object but not the loop thread.
+        if _runner is None or _runner_pid != os.getpid():
+            _runner = ExtRunner(limit or os.cpu_count() or 1)
+            _runner_pid = os.getpid()
+        return _runner
@@ -11,11 +11,19 @@ from termcolor import cprint
 
 from picopt.formats import (
     LOSSLESS_FORMAT_STRS,
+    SVG_FORMAT_STR,
     TIFF_LOSSLESS_COMPRESSION,
     FileFormat,
 )
+from picopt.handlers.format_cache import get_format_cache
 from picopt.handlers.handler import Handler
 from picopt.handlers.non_pil import NonPILIdentifier
+from picopt.handlers.sniff import (
+    RAR_FORMAT_STR,
+    ZIP_FORMAT_STR,
+    Sniffed,
+    sniff_format,
+)
 from picopt.handlers.svg import Svg
 from picopt.handlers.webp import WebPLossless
 from picopt.handlers.zip import Cbr, Cbz, EPub, Rar, Zip
@@ -33,25 +41,53 @@ _NON_PIL_HANDLERS: tuple[type[NonPILIdentifier], ...] = (
     Rar,
     EPub,
 )
+# Containers and svgs with a recognized header only differ by suffix.
+_SNIFFED_NON_PIL_HANDLERS: Mapping[str, tuple[type[NonPILIdentifier], ...]] = {
+    SVG_FORMAT_STR: (Svg,),
+    ZIP_FORMAT_STR: (Cbz, Zip, EPub),
+    RAR_FORMAT_STR: (Cbr, Rar),
+}
+
+
+def _sniff(path_info: PathInfo) -> Sniffed | None:
+    """Read the header once to guess the format."""
+    with path_info.fp_or_buffer() as fp:
+        return sniff_format(fp)
+
+
+def _verify_image(path_info: PathInfo, formats: tuple[str, ...] | None) -> None:
+    """Check the whole image for corruption."""
+    fp = path_info.path_or_buffer()
+    with Image.open(fp, formats=formats) as image:
+        image.verify()
+    image.close()  # for animated images
+    with suppress(AttributeError):
+        fp.close()  # type: ignore
 
 
 def _extract_image_info(
-    path_info: PathInfo, keep_metadata: bool
+    path_info: PathInfo, keep_metadata: bool, verify: str, sniffed: Sniffed | None
 ) -> tuple[str | None, dict[str, Any]]:
     """Get image format and info from a file."""
     image_format_str = None
     info = {}
     n_frames = 1
     animated = False
+    # Only try the plugin for the sniffed format.
+    formats = (sniffed.format_str,) if sniffed else None
     try:
+        if verify == "full":
+            _verify_image(path_info, formats)
+        if (
+            verify != "header"
+            and sniffed
+            and sniffed.is_complete()
+            and not keep_metadata
+        ):
+            # The header had everything, skip opening it again.
+            return sniffed.format_str, sniffed.get_info()
         fp = path_info.path_or_buffer()
-        with Image.open(fp) as image:
-            image.verify()
-        image.close()  # for animated images
-        with suppress(AttributeError):
-            fp.close()  # type: ignore
-        fp = path_info.path_or_buffer()
-        with Image.open(fp) as image:
+        with Image.open(fp, formats=formats) as image:
             image_format_str = image.format
             if image_format_str:
                 # It's a rare thing if an info key is an int tuple?
@@ -87,14 +123,19 @@ def _is_lossless(
 
 
 def _get_image_format(
-    path_info: PathInfo, keep_metadata: bool
+    config: AttrDict, path_info: PathInfo, sniffed: Sniffed | None
 ) -> tuple[FileFormat | None, Mapping[str, Any]]:
     """Construct the image format with PIL."""
-    image_format_str, info = _extract_image_info(path_info, keep_metadata)
+    image_format_str, info = _extract_image_info(
+        path_info, config.keep_metadata, config.verify, sniffed
+    )
 
     file_format = None
     if image_format_str:
-        lossless = _is_lossless(image_format_str, path_info, info)
+        if sniffed and image_format_str == sniffed.format_str:
+            lossless = sniffed.lossless
+        else:
+            lossless = _is_lossless(image_format_str, path_info, info)
         file_format = FileFormat(
             image_format_str, lossless, info.get("animated", False)
         )
@@ -113,11 +154,26 @@ def _get_non_pil_format(path_info: PathInfo) -> FileFormat | None:
     return file_format
 
 
+def _get_sniffed_non_pil_format(
+    path_info: PathInfo, sniffed: Sniffed
+) -> FileFormat | None:
+    """Get the container format from the handlers for the sniffed header."""
+    file_format = None
+    for handler in _SNIFFED_NON_PIL_HANDLERS[sniffed.format_str]:
+        file_format = handler.identify_suffix(path_info)
+        if file_format is not None:
+            break
+    return file_format
+
+
 def _create_handler_get_format(
     config: AttrDict, path_info: PathInfo
 ) -> tuple[FileFormat | None, Mapping[str, Any]]:
-    file_format, info = _get_image_format(path_info, config.keep_metadata)
-    if not file_format:
+    sniffed = _sniff(path_info)
+    if sniffed and not sniffed.is_image:
+        return _get_sniffed_non_pil_format(path_info, sniffed), {}
+    file_format, info = _get_image_format(config, path_info, sniffed)
+    if not file_format and not sniffed:
         file_format = _get_non_pil_format(path_info)
     return file_format, info
 
@@ -170,14 +226,37 @@ def _create_handler_no_handler_class(
         cprint(".", "white", attrs=["dark"], end="")
 
 
+def _create_handler_get_format_and_class(
+    config: AttrDict, path_info: PathInfo
+) -> tuple[FileFormat | None, Mapping[str, Any], type[Handler] | None]:
+    """Get the format from the cache or by identifying the file."""
+    format_cache = get_format_cache(config)
+    cached = (
+        format_cache.get(path_info, config.verify, config.keep_metadata)
+        if format_cache
+        else None
+    )
+    if cached:
+        file_format, info = cached
+    else:
+        file_format, info = _create_handler_get_format(config, path_info)
+        if format_cache:
+            format_cache.put(
+                path_info, config.verify, file_format, info, config.keep_metadata
+            )
+    handler_cls = _create_handler_get_handler_class(
+        config, path_info.convert, file_format
+    )
+    return file_format, info, handler_cls
+
+
 def create_handler(config: AttrDict, path_info: PathInfo) -> Handler | None:
     """Get the image format."""
     # This is the consumer of config._format_handlers
     handler_cls: type[Handler] | None = None
     try:
-        file_format, info = _create_handler_get_format(config, path_info)
-        handler_cls = _create_handler_get_handler_class(
-            config, path_info.convert, file_format
+        file_format, info, handler_cls = _create_handler_get_format_and_class(
+            config, path_info
         )
     except OSError as exc:
         cprint(f"WARNING: getting handler {exc}", "yellow")
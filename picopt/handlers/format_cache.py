@@ -0,0 +1,174 @@
+"""Remember the formats of unchanged files between runs."""
+
+import json
+import os
+import sqlite3
+from base64 import b64decode, b64encode
+from collections.abc import Mapping
+from os import stat_result
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from confuse.templates import AttrDict
+from PIL.TiffImagePlugin import IFDRational
+
+from picopt.config import VERIFY_MODES
+from picopt.formats import FileFormat
+from picopt.path import PathInfo
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS formats (
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    suffix TEXT NOT NULL,
+    verify INTEGER NOT NULL,
+    format TEXT,
+    lossless INTEGER NOT NULL,
+    animated INTEGER NOT NULL,
+    metadata INTEGER NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (dev, inode)
+) WITHOUT ROWID;
+"""
+_UPSERT = "INSERT OR REPLACE INTO formats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def _encode(value: Any) -> Any:
+    """Tag the info values JSON can't hold."""
+    if value is None or isinstance(value, bool | int | float | str):
+        return value
+    if isinstance(value, bytes):
+        return {"b": b64encode(value).decode()}
+    if isinstance(value, IFDRational):
+        return {"r": [value.numerator, value.denominator]}
+    if isinstance(value, tuple):
+        return {"t": [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {"d": [[_encode(key), _encode(val)] for key, val in value.items()]}
+    msg = f"Can't cache {type(value).__name__} info"
+    raise TypeError(msg)
+
+
+def _decode(value: Any) -> Any:
+    """Rebuild tagged info values."""
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "b" in value:
+        return b64decode(value["b"])
+    if "r" in value:
+        return IFDRational(*value["r"])
+    if "t" in value:
+        return tuple(_decode(item) for item in value["t"])
+    return {_decode(key): _decode(val) for key, val in value["d"]}
+
+
+class FormatCache:
+    """Identified formats and image info by device and inode.
+
+    An entry is valid while the file's size, mtime and suffix are unchanged,
+    it was checked at least as thoroughly as the verify setting asks and its
+    info was read with the same keep metadata setting. The info is stored as
+    tagged JSON. Files with info that can't be stored aren't cached.
+    Unidentified files are stored without a format. Worker processes share
+    the database, so every write commits.
+    """
+
+    def __init__(self, path: Path | str):
+        """Open the database."""
+        self._lock = Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = self._conn.execute("PRAGMA table_info(formats)").fetchall()
+        if columns and "info" not in {column[1] for column in columns}:
+            # Written by an older version. It's only a cache.
+            self._conn.execute("DROP TABLE formats")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _get_key(path_info: PathInfo) -> tuple[int, int, int, int, str] | None:
+        """Get the signature of a file on disk."""
+        stat = path_info.stat()
+        if not isinstance(stat, stat_result):
+            return None
+        suffix = path_info.suffix().lower()
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, suffix)
+
+    def get(
+        self, path_info: PathInfo, verify: str, keep_metadata: bool
+    ) -> tuple[FileFormat | None, Mapping[str, Any]] | None:
+        """Get the format and info of an unchanged file."""
+        key = self._get_key(path_info)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, suffix, verify, format, lossless, "
+                "animated, metadata, info FROM formats WHERE dev = ? AND inode = ?",
+                key[:2],
+            ).fetchone()
+        if not row or tuple(row[:3]) != key[2:]:
+            return None
+        verified, format_str, lossless, animated, metadata, info = row[3:]
+        if verified > VERIFY_MODES.index(verify) or bool(metadata) != keep_metadata:
+            return None
+        if format_str is None:
+            return None, {}
+        file_format = FileFormat(format_str, bool(lossless), bool(animated))
+        return file_format, _decode(json.loads(info))
+
+    def put(
+        self,
+        path_info: PathInfo,
+        verify: str,
+        file_format: FileFormat | None,
+        info: Mapping[str, Any],
+        keep_metadata: bool,
+    ) -> None:
+        """Store a file's format and info."""
+        key = self._get_key(path_info)
+        if key is None:
+            return
+        try:
+            info_json = json.dumps(_encode(dict(info)))
+        except (TypeError, ValueError):
+            return
+        if file_format:
+            values = (
+                file_format.format_str,
+                file_format.lossless,
+                file_format.animated,
+            )
+        else:
+            values = (None, False, False)
+        with self._lock:
+            self._conn.execute(
+                _UPSERT,
+                (*key, VERIFY_MODES.index(verify), *values, keep_metadata, info_json),
+            )
+
+
+_caches: dict[tuple[int, Path], FormatCache] = {}
+
+
+def get_format_cache(config: AttrDict) -> FormatCache | None:
+    """Get this process's connection if a cache is configured."""
+    path = config.format_cache
+    if not path:
+        return None
+    # Forked workers open their own connection.
+    key = (os.getpid(), path)
+    cache = _caches.get(key)
+    if cache is None:
+        cache = FormatCache(path)
+        _caches[key] = cache
+    return cache
@@ -6,6 +6,7 @@ from typing import BinaryIO
 
 from PIL.GifImagePlugin import GifImageFile
 
+from picopt import thread_budget
 from picopt.formats import FileFormat
 from picopt.handlers.image import ImageHandler
 
@@ -20,16 +21,17 @@ class Gif(ImageHandler):
     PIL2_KWARGS = MappingProxyType({"optimize": True})
     _GIFSICLE_ARGS_PREFIX: tuple[str, ...] = (
         "--optimize=3",
-        "--threads",
         "--output",
         "-",
         "-",
     )
+    _GIFSICLE_THREADS = 4
 
     def gifsicle(self, exec_args: tuple[str, ...], input_buffer: BinaryIO) -> BytesIO:
         """Return gifsicle args."""
-        args = (*exec_args, *self._GIFSICLE_ARGS_PREFIX)
-        return self.run_ext(args, input_buffer)
+        with thread_budget.threads(self._GIFSICLE_THREADS) as threads:
+            args = (*exec_args, f"--threads={threads}", *self._GIFSICLE_ARGS_PREFIX)
+            return self.run_ext(args, input_buffer)
 
 
 class GifAnimated(Gif):
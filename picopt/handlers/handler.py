@@ -1,7 +1,6 @@
 """FileType abstract class for image and container formats."""
 
 import os
-import subprocess
 from abc import ABC, abstractmethod
 from collections.abc import Mapping
 from io import BufferedReader, BytesIO
@@ -16,6 +15,8 @@ from termcolor import cprint
 
 from picopt import PROGRAM_NAME
 from picopt.formats import PNGINFO_XMP_KEY, FileFormat
+from picopt.handlers.ext_runner import get_ext_runner
+from picopt.io_limit import limit_write
 from picopt.path import PathInfo
 from picopt.stats import ReportStats
 
@@ -53,8 +54,7 @@ class Handler(ABC):
     PROGRAMS: tuple[tuple[str, ...], ...] = ()
     WORKING_SUFFIX: str = f"{PROGRAM_NAME}-tmp"
 
-    @classmethod
-    def run_ext(cls, args: tuple[str, ...], input_buffer: BinaryIO) -> BytesIO:
+    def run_ext(self, args: tuple[str, ...], input_buffer: BinaryIO) -> BytesIO:
         """Run EXTERNAL program."""
         for arg in args:
             # Guarantee tuple[str]
@@ -63,13 +63,8 @@ class Handler(ABC):
                 raise ValueError(reason)
 
         input_buffer.seek(0)
-        result = subprocess.run(  # noqa: S603
-            args,
-            check=True,
-            input=input_buffer.read(),
-            stdout=subprocess.PIPE,
-        )
-        return BytesIO(result.stdout)
+        runner = get_ext_runner(self.config.tool_jobs)
+        return BytesIO(runner.run_pipe(args, input_buffer.read()))
 
     def get_working_path(self, identifier: str) -> Path:
         """Return a working path with a custom suffix."""
@@ -176,13 +171,7 @@ class Handler(ABC):
                 input_buffer.seek(0)
                 input_tmp_file.write(input_buffer.read())
 
-        subprocess.run(  # noqa S603
-            args,  # type: ignore
-            check=True,
-            text=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
-        )
+        get_ext_runner(self.config.tool_jobs).run_fs(args)  # type: ignore
 
         if input_path_tmp:
             input_path.unlink(missing_ok=True)
@@ -205,9 +194,13 @@ class Handler(ABC):
         if isinstance(final_data_buffer, BytesIO):
             with self.final_path.open("wb") as final_file, final_data_buffer:
                 final_data_buffer.seek(0)
-                final_file.write(final_data_buffer.read())
+                final_data = final_data_buffer.read()
+                limit_write(len(final_data))
+                final_file.write(final_data)
         else:
             final_data_buffer.close()
+            # The program already wrote it. Pay for it before the next write.
+            limit_write(self.working_path.stat().st_size)
             self.working_path.replace(self.final_path)
 
         ###########
@@ -295,6 +288,10 @@ class Handler(ABC):
     def optimize(self) -> BinaryIO:
         """Implement by subclasses."""
 
+    def is_threadable(self) -> bool:
+        """Whether optimizing spends most of its time outside the GIL."""
+        return False
+
     def error(self, exc: Exception) -> ReportStats:
         """Return an error result."""
         return ReportStats(self.original_path, exc=exc)
@@ -11,6 +11,7 @@ from PIL.PngImagePlugin import PngImageFile
 from termcolor import cprint
 
 from picopt.handlers.handler import Handler
+from picopt.handlers.output_cache import get_output_cache
 
 
 class ImageHandler(Handler, metaclass=ABCMeta):
@@ -19,6 +20,25 @@ class ImageHandler(Handler, metaclass=ABCMeta):
     PIL2_KWARGS: MappingProxyType[str, Any] = MappingProxyType({})
     PIL2PNG_KWARGS: MappingProxyType[str, Any] = MappingProxyType({"compress_level": 0})
     EMPTY_EXEC_ARGS: tuple[str, tuple[str, ...]] = ("", ())
+    # Internal stages that release the GIL while they work.
+    GIL_RELEASING_STAGES: frozenset[str] = frozenset({"internal_oxipng"})
+
+    def is_threadable(self) -> bool:
+        """Whether every stage runs an external program or releases the GIL.
+
+        PIL stages that don't need to convert the image return it untouched.
+        """
+        stages = self.config.computed.handler_stages.get(self.__class__, {})
+        for func, exec_args in stages.items():
+            if exec_args is not None or func in self.GIL_RELEASING_STAGES:
+                continue
+            if (
+                func.startswith("pil2")
+                and self.input_file_format in self._input_file_formats
+            ):
+                continue
+            return False
+        return True
 
     def optimize(self) -> BinaryIO:
         """Use the correct optimizing functions in sequence.
@@ -34,7 +54,33 @@ class ImageHandler(Handler, metaclass=ABCMeta):
             raise ValueError
 
         image_buffer: BinaryIO = self.path_info.fp_or_buffer()
+        cache = get_output_cache(self.config)
+        if not cache:
+            return self._run_stages(stages, image_buffer)
+
+        settings_key = self.config.computed.output_cache_keys[self.__class__]
+        key = cache.get_key(settings_key, image_buffer)
+        data = cache.get(key)
+        if data is not None:
+            if not data:
+                # Optimizing gained nothing.
+                data = image_buffer.read()
+            image_buffer.close()
+            return BytesIO(data)
+
+        image_buffer = self._run_stages(stages, image_buffer)
+        image_buffer.seek(0)
+        data = image_buffer.read()
+        image_buffer.seek(0)
+        if len(data) >= self.path_info.bytes_in() and not self.config.bigger:
+            data = b""
+        cache.put(key, data)
+        return image_buffer
 
+    def _run_stages(
+        self, stages: Mapping[str, Any], image_buffer: BinaryIO
+    ) -> BinaryIO:
+        """Run the stages in sequence."""
         for func, exec_args in stages.items():
             new_image_buffer: BinaryIO = getattr(self, func)(exec_args, image_buffer)
             if image_buffer != new_image_buffer:
@@ -79,7 +79,10 @@ class ImageAnimated(ContainerHandler, ABC):
     def pack_into(self) -> BytesIO:
         """Remux the optimized frames into an animated webp."""
         sorted_pairs = sorted(
-            self._optimized_contents.items(),
+            (
+                (path_info, self.get_contents_data(path_info, data))
+                for path_info, data in self._optimized_contents.items()
+            ),
             key=lambda pair: 0 if pair[0].frame is None else pair[0].frame,
         )
         head_image_data = sorted_pairs.pop()[1]
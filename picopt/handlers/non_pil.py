@@ -8,13 +8,18 @@ from picopt.path import PathInfo
 class NonPILIdentifier(Handler):
     """Methods for files that that can't be identified with PIL."""
 
+    @classmethod
+    def identify_suffix(cls, path_info: PathInfo) -> FileFormat | None:
+        """Return the format if the suffix matches, without reading the file."""
+        suffix = path_info.suffix().lower()
+        if suffix == cls.get_default_suffix():
+            return cls.OUTPUT_FILE_FORMAT
+        return None
+
     @classmethod
     def identify_format(
         cls,
         path_info: PathInfo,
     ) -> FileFormat | None:
         """Return the format if this handler can handle this path."""
-        suffix = path_info.suffix().lower()
-        if suffix == cls.get_default_suffix():
-            return cls.OUTPUT_FILE_FORMAT
-        return None
+        return cls.identify_suffix(path_info)
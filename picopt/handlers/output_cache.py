@@ -0,0 +1,119 @@
+"""A content addressed cache of optimized outputs shared between runs."""
+
+import hashlib
+import os
+from pathlib import Path
+from threading import get_ident
+from time import time
+from typing import BinaryIO
+
+from confuse.templates import AttrDict
+
+# Working files of crashed writers are removed after this long.
+_STALE_TMP_SECONDS = 3600
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class OutputCache:
+    """Optimized bytes keyed by input hash and everything that shapes the output.
+
+    Entries are written to a temporary file and renamed into place, so several
+    picopt processes can share a cache directory. Reading an entry touches its
+    mtime and eviction removes the least recently used entries first. An empty
+    entry means optimizing gained nothing.
+    """
+
+    # Fraction of the size limit a process writes between evictions.
+    EVICT_EVERY_FRACTION = 8
+
+    def __init__(self, path: Path, max_bytes: int):
+        """Initialize."""
+        self._path = path
+        self._max_bytes = max_bytes
+        self._written = 0
+
+    @staticmethod
+    def get_key(settings_key: str, input_buffer: BinaryIO) -> str:
+        """Hash the input with the settings."""
+        digest = hashlib.blake2b(settings_key.encode(), digest_size=24)
+        input_buffer.seek(0)
+        while chunk := input_buffer.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        input_buffer.seek(0)
+        return digest.hexdigest()
+
+    def _get_entry_path(self, key: str) -> Path:
+        """Shard entries by the first byte of the key."""
+        return self._path / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        """Read an entry and mark it recently used."""
+        entry_path = self._get_entry_path(key)
+        try:
+            data = entry_path.read_bytes()
+            os.utime(entry_path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Write an entry atomically."""
+        entry_path = self._get_entry_path(key)
+        tmp_path = entry_path.with_name(f".{key}.{os.getpid()}.{get_ident()}.tmp")
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(data)
+            tmp_path.replace(entry_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._written += len(data)
+        if self._written > self._max_bytes // self.EVICT_EVERY_FRACTION:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove least recently used entries over the size limit.
+
+        Return the number of bytes removed.
+        """
+        self._written = 0
+        entries = []
+        total = 0
+        now = time()
+        for shard in os.scandir(self._path) if self._path.is_dir() else ():
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.startswith("."):
+                    if now - stat.st_mtime > _STALE_TMP_SECONDS:
+                        Path(entry.path).unlink(missing_ok=True)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total - removed <= self._max_bytes:
+                break
+            Path(path).unlink(missing_ok=True)
+            removed += size
+        return removed
+
+
+_caches: dict[Path, OutputCache] = {}
+
+
+def get_output_cache(config: AttrDict) -> OutputCache | None:
+    """Get this process's cache if one is configured."""
+    path = config.output_cache
+    if not path:
+        return None
+    cache = _caches.get(path)
+    if cache is None:
+        cache = OutputCache(path, config.output_cache_size * 1024 * 1024)
+        _caches[path] = cache
+    return cache
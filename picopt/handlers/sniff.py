@@ -0,0 +1,205 @@
+"""Identify formats from their leading bytes before asking Pillow."""
+
+from dataclasses import dataclass
+from struct import unpack_from
+from typing import Any, BinaryIO
+
+from PIL.GifImagePlugin import GifImageFile
+from PIL.JpegImagePlugin import JpegImageFile
+from PIL.PngImagePlugin import PngImageFile
+from PIL.WebPImagePlugin import WebPImageFile
+
+from picopt.formats import SVG_FORMAT_STR
+
+HEADER_SIZE = 16 * 1024
+GIF_FORMAT_STR = str(GifImageFile.format)
+JPEG_FORMAT_STR = str(JpegImageFile.format)
+PNG_FORMAT_STR = str(PngImageFile.format)
+WEBP_FORMAT_STR = str(WebPImageFile.format)
+RAR_FORMAT_STR = "RAR"
+ZIP_FORMAT_STR = "ZIP"
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_JPEG_SIGNATURE = b"\xff\xd8\xff"
+_GIF_SIGNATURES = (b"GIF87a", b"GIF89a")
+_RAR_SIGNATURE = b"Rar!\x1a\x07"
+_ZIP_SIGNATURES = (b"PK\x03\x04", b"PK\x05\x06")
+_UTF8_BOM = b"\xef\xbb\xbf"
+_PNG_FIRST_IMAGE_CHUNKS = frozenset({b"IDAT", b"IEND"})
+_JPEG_MPF_APP2 = (0xE2, b"MPF\x00")
+_JPEG_SOS = 0xDA
+_JPEG_EOI = 0xD9
+_GIF_EXTENSION = 0x21
+_GIF_IMAGE = 0x2C
+_GIF_TRAILER = 0x3B
+_WEBP_ANIMATION_FLAG = 0x02
+_WEBP_ANMF_HEADER_SIZE = 16
+
+
+@dataclass(frozen=True)
+class Sniffed:
+    """A format read from a file header.
+
+    animated, or n_frames for an animated image, is None when the header
+    isn't enough to tell and Pillow has to look deeper.
+    """
+
+    format_str: str
+    lossless: bool = True
+    animated: bool | None = None
+    n_frames: int | None = None
+    is_image: bool = True
+
+    def is_complete(self) -> bool:
+        """Is everything the factory needs known without opening the image."""
+        return self.animated is not None and (
+            not self.animated or self.n_frames is not None
+        )
+
+    def get_info(self) -> dict[str, Any]:
+        """Return the image info the factory would have got from Pillow."""
+        info: dict[str, Any] = {"animated": self.animated}
+        if self.animated:
+            info["n_frames"] = self.n_frames
+        return info
+
+
+def _sniff_png(header: bytes) -> Sniffed:
+    """Find an animation control chunk before the image data."""
+    pos = len(_PNG_SIGNATURE)
+    while pos + 12 <= len(header):
+        length, chunk_type = unpack_from(">I4s", header, pos)
+        if chunk_type == b"acTL":
+            (n_frames,) = unpack_from(">I", header, pos + 8)
+            animated = n_frames > 1
+            return Sniffed(
+                PNG_FORMAT_STR, True, animated, n_frames if animated else None
+            )
+        if chunk_type in _PNG_FIRST_IMAGE_CHUNKS:
+            return Sniffed(PNG_FORMAT_STR, True, False)
+        pos += 12 + length
+    return Sniffed(PNG_FORMAT_STR)
+
+
+def _sniff_jpeg(header: bytes) -> Sniffed:
+    """Walk the markers before the scan looking for a multi picture segment."""
+    pos = 2
+    while pos + 4 <= len(header) and header[pos] == 0xFF:  # noqa: PLR2004
+        marker = header[pos + 1]
+        if marker == 0xFF:  # noqa: PLR2004
+            # Fill byte
+            pos += 1
+            continue
+        if marker in (_JPEG_SOS, _JPEG_EOI):
+            return Sniffed(JPEG_FORMAT_STR, False, False)
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # noqa: PLR2004
+            # Markers without a length
+            pos += 2
+            continue
+        if (marker, header[pos + 4 : pos + 8]) == _JPEG_MPF_APP2:
+            # Pillow decides if it's a JPEG or an MPO
+            break
+        (length,) = unpack_from(">H", header, pos + 2)
+        pos += 2 + length
+    return Sniffed(JPEG_FORMAT_STR, False)
+
+
+def _skip_gif_sub_blocks(header: bytes, pos: int) -> int:
+    """Return the position after a chain of data sub blocks."""
+    while pos < len(header) and (size := header[pos]):
+        pos += 1 + size
+    return pos + 1
+
+
+def _skip_gif_color_table(flags: int) -> int:
+    """Return the size of a color table from the packed flags."""
+    return 3 << ((flags & 0x07) + 1) if flags & 0x80 else 0
+
+
+def _sniff_gif(header: bytes) -> Sniffed:
+    """Count the image blocks in the header."""
+    if len(header) < 13:  # noqa: PLR2004
+        return Sniffed(GIF_FORMAT_STR)
+    pos = 13 + _skip_gif_color_table(header[10])
+    n_frames = 0
+    while pos < len(header):
+        block = header[pos]
+        if block == _GIF_TRAILER and n_frames:
+            animated = n_frames > 1
+            return Sniffed(
+                GIF_FORMAT_STR, True, animated, n_frames if animated else None
+            )
+        if block == _GIF_EXTENSION:
+            pos = _skip_gif_sub_blocks(header, pos + 2)
+        elif block == _GIF_IMAGE and pos + 10 <= len(header):
+            n_frames += 1
+            if n_frames > 1:
+                # Pillow counts the rest of the frames
+                return Sniffed(GIF_FORMAT_STR, True, True)
+            pos += 10 + _skip_gif_color_table(header[pos + 9])
+            # Skip the LZW minimum code size
+            pos = _skip_gif_sub_blocks(header, pos + 1)
+        else:
+            break
+    return Sniffed(GIF_FORMAT_STR)
+
+
+def _sniff_webp(fp: BinaryIO, header: bytes) -> Sniffed:
+    """Walk the RIFF chunks, seeking over their data."""
+    first_chunk = header[12:16]
+    if first_chunk == b"VP8 ":
+        return Sniffed(WEBP_FORMAT_STR, False, False)
+    if first_chunk == b"VP8L":
+        return Sniffed(WEBP_FORMAT_STR, True, False)
+    if first_chunk != b"VP8X" or len(header) < 21:  # noqa: PLR2004
+        return Sniffed(WEBP_FORMAT_STR, False)
+    has_animation = bool(header[20] & _WEBP_ANIMATION_FLAG)
+    lossless = False
+    n_frames = 0
+    pos = 12
+    while True:
+        fp.seek(pos)
+        chunk_header = fp.read(8)
+        if len(chunk_header) < 8:  # noqa: PLR2004
+            break
+        chunk_type, size = unpack_from("<4sI", chunk_header)
+        if chunk_type == b"VP8L":
+            lossless = True
+        elif chunk_type == b"ANMF":
+            n_frames += 1
+            fp.seek(pos + 8 + _WEBP_ANMF_HEADER_SIZE)
+            lossless |= fp.read(4) == b"VP8L"
+        pos += 8 + size + (size & 1)
+    if not has_animation:
+        return Sniffed(WEBP_FORMAT_STR, lossless, False)
+    if not n_frames:
+        return Sniffed(WEBP_FORMAT_STR, lossless)
+    animated = n_frames > 1
+    return Sniffed(WEBP_FORMAT_STR, lossless, animated, n_frames if animated else None)
+
+
+def _is_svg(header: bytes) -> bool:
+    """Check if the header looks like an svg document."""
+    text = header.removeprefix(_UTF8_BOM).lstrip()
+    return text.startswith(b"<") and b"<svg" in text
+
+
+def sniff_format(fp: BinaryIO) -> Sniffed | None:
+    """Identify the format from the first bytes of the file."""
+    header = fp.read(HEADER_SIZE)
+    sniffed = None
+    if header.startswith(_PNG_SIGNATURE):
+        sniffed = _sniff_png(header)
+    elif header.startswith(_JPEG_SIGNATURE):
+        sniffed = _sniff_jpeg(header)
+    elif header.startswith(_GIF_SIGNATURES):
+        sniffed = _sniff_gif(header)
+    elif header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        sniffed = _sniff_webp(fp, header)
+    elif header.startswith(_ZIP_SIGNATURES):
+        sniffed = Sniffed(ZIP_FORMAT_STR, is_image=False)
+    elif header.startswith(_RAR_SIGNATURE):
+        sniffed = Sniffed(RAR_FORMAT_STR, is_image=False)
+    elif _is_svg(header):
+        sniffed = Sniffed(SVG_FORMAT_STR, is_image=False)
+    return sniffed
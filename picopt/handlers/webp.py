@@ -9,6 +9,7 @@ from typing import TYPE_CHECKING, Any, BinaryIO
 from confuse import AttrDict
 from PIL.WebPImagePlugin import WebPImageFile
 
+from picopt import thread_budget
 from picopt.formats import MODERN_CWEBP_FORMATS, FileFormat
 from picopt.handlers.image import ImageHandler
 from picopt.handlers.png import Png
@@ -26,7 +27,6 @@ class WebPBase(ImageHandler, ABC):
     PROGRAMS = (("cwebp", "pil2native"),)
     # https://developers.google.com/speed/webp/docs/cwebp
     CWEBP_ARGS_PREFIX = (
-        "-mt",
         "-q",
         "100",
         "-m",
@@ -39,6 +39,8 @@ class WebPBase(ImageHandler, ABC):
         "-alpha_filter",
         "best",
     )
+    # -mt encodes with a second thread.
+    CWEBP_THREADS = 2
 
     def cwebp(
         self,
@@ -69,17 +71,20 @@ class WebPBase(ImageHandler, ABC):
 
         output_path = self.get_working_path("cwebp-output")
         output_path_tmp = bool(self.path_info.path)
-        args += [str(input_path), "-o", str(output_path)]
-        # XXX if python cwebp gains enough options to beat this or
-        #     or cwebp gains stdin or stdout powers we can not use this
-        return self.run_ext_fs(
-            tuple(args),
-            input_buffer,
-            input_path,
-            output_path,
-            input_path_tmp,
-            output_path_tmp,
-        )
+        with thread_budget.threads(self.CWEBP_THREADS) as threads:
+            if threads > 1:
+                args += ["-mt"]
+            args += [str(input_path), "-o", str(output_path)]
+            # XXX if python cwebp gains enough options to beat this or
+            #     or cwebp gains stdin or stdout powers we can not use this
+            return self.run_ext_fs(
+                tuple(args),
+                input_buffer,
+                input_path,
+                output_path,
+                input_path_tmp,
+                output_path_tmp,
+            )
 
 
 class WebPLossless(WebPBase):
@@ -1,17 +1,25 @@
 """Handler for zip files."""
 
-from collections.abc import Generator
+from collections.abc import Callable, Generator, Iterable
 from io import BytesIO
+from pathlib import Path
+from subprocess import DEVNULL, PIPE, Popen
+from typing import BinaryIO
 from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo, is_zipfile
+from zlib import crc32
 
-from rarfile import RarFile, RarInfo, is_rarfile
+from rarfile import RarFile, RarInfo, is_rarfile, tool_setup
 from termcolor import cprint
 
 from picopt.formats import FileFormat
 from picopt.handlers.container import ContainerHandler
 from picopt.handlers.non_pil import NonPILIdentifier
+from picopt.io_limit import limit_read
 from picopt.path import PathInfo
 
+# Solid archive members are copied to scratch files in chunks this size.
+SOLID_CHUNK_SIZE = 1024 * 1024
+
 
 class Zip(NonPILIdentifier, ContainerHandler):
     """Ziplike container."""
@@ -25,9 +33,13 @@ class Zip(NonPILIdentifier, ContainerHandler):
     def identify_format(cls, path_info: PathInfo) -> FileFormat | None:
         """Return the format if this handler can handle this path."""
         if is_zipfile(path_info.path_or_buffer()):
-            return super().identify_format(path_info)
+            return cls.identify_suffix(path_info)
         return None
 
+    def is_threadable(self) -> bool:
+        """Repacking is mostly zlib, which releases the GIL."""
+        return True
+
     def _get_archive(self) -> ZipFile:
         """Use the zipfile builtin for this archive."""
         if is_zipfile(self.original_path):
@@ -47,55 +59,87 @@ class Zip(NonPILIdentifier, ContainerHandler):
         """Convert archive info to zipinfo."""
         return archive_info
 
+    def _read_members(
+        self, archive: ZipFile
+    ) -> Generator[tuple[ZipInfo, Path | None], None, None]:
+        """List the members. Their data is left for the workers to read."""
+        for archive_info in archive.infolist():
+            zipinfo = self.to_zipinfo(archive_info)
+            if not zipinfo.is_dir():
+                yield zipinfo, None
+
     def unpack_into(self) -> Generator[PathInfo, None, None]:
         """Uncompress archive."""
         with self._get_archive() as archive:
             self._set_comment(archive.comment)
-            for archive_info in archive.infolist():
-                zipinfo = self.to_zipinfo(archive_info)
-                if zipinfo.is_dir():
-                    continue
+            for zipinfo, extracted_path in self._read_members(archive):
                 path_info = PathInfo(
                     self.path_info.top_path,
                     self.path_info.mtime(),
                     self.path_info.convert,
                     self.path_info.is_case_sensitive,
                     zipinfo=zipinfo,
-                    data=archive.read(zipinfo.filename),
                     container_paths=self.get_container_paths(),
+                    # Unextracted members are decompressed lazily by the workers.
+                    archive_path=self.original_path if not extracted_path else None,
+                    extracted_path=extracted_path,
                 )
                 yield path_info
 
-    def pack_into(self) -> BytesIO:
+    def _pack_member(
+        self,
+        archive: ZipFile,
+        new_zf: ZipFile,
+        path_info: PathInfo,
+        data: bytes | Path | None,
+    ) -> None:
+        """Write one member to the new archive."""
+        zipinfo = path_info.zipinfo
+        if not zipinfo:
+            return
+        if data is None and path_info.archive_path:
+            # Unoptimized members are copied from the original archive.
+            limit_read(zipinfo.compress_size)
+            data = archive.read(zipinfo.filename)
+        else:
+            data = self.get_contents_data(path_info, data)
+        if (
+            path_info.container_filename
+            and path_info.container_filename != zipinfo.filename
+        ):
+            zipinfo.filename = path_info.container_filename
+        if (
+            not self.config.keep_metadata
+            and zipinfo
+            and zipinfo.compress_type == ZIP_STORED
+        ):
+            zipinfo.compress_type = ZIP_DEFLATED
+        new_zf.writestr(zipinfo, data)
+        if self.config.verbose:
+            cprint(".", end="")
+
+    def pack_into(self) -> BinaryIO:
         """Zip up the files in the tempdir into the new filename."""
-        output_buffer = BytesIO()
-        with ZipFile(
-            output_buffer, "w", compression=ZIP_DEFLATED, compresslevel=9
-        ) as new_zf:
+        # Large archives stream into a working file instead of memory.
+        if self.is_pack_to_file():
+            self.working_path = self.get_working_path("repack")
+            output: BytesIO | Path = self.working_path
+        else:
+            output = BytesIO()
+        with (
+            self._get_archive() as archive,
+            ZipFile(output, "w", compression=ZIP_DEFLATED, compresslevel=9) as new_zf,
+        ):
             for path_info in tuple(self._optimized_contents):
                 data = self._optimized_contents.pop(path_info)
-                zipinfo = path_info.zipinfo
-                if not zipinfo:
-                    continue
-                if (
-                    path_info.container_filename
-                    and path_info.container_filename != zipinfo.filename
-                ):
-                    zipinfo.filename = path_info.container_filename
-                if (
-                    not self.config.keep_metadata
-                    and zipinfo
-                    and zipinfo.compress_type == ZIP_STORED
-                ):
-                    zipinfo.compress_type = ZIP_DEFLATED
-                new_zf.writestr(zipinfo, data)
-                if self.config.verbose:
-                    cprint(".", end="")
+                self._pack_member(archive, new_zf, path_info, data)
             if self.comment:
                 new_zf.comment = self.comment
                 if self.config.verbose:
                     cprint(".", end="")
-        return output_buffer
+        if isinstance(output, BytesIO):
+            return output
+        return output.open("rb")
 
 
 class Rar(Zip):
@@ -115,17 +159,85 @@ class Rar(Zip):
             zipinfo_kwargs["filename"] = archive_info.filename
         if archive_info.date_time:
             zipinfo_kwargs["date_time"] = archive_info.date_time
-        return ZipInfo(**zipinfo_kwargs)
+        zipinfo = ZipInfo(**zipinfo_kwargs)
+        zipinfo.file_size = archive_info.file_size or 0
+        zipinfo.compress_size = archive_info.compress_size or 0
+        zipinfo.CRC = archive_info.CRC or 0
+        return zipinfo
+
+    @staticmethod
+    def _extract_member(stream: BinaryIO, size: int, path: Path) -> int | None:
+        """Copy one member from the stream to a file. Return its CRC."""
+        crc = 0
+        with path.open("wb") as fp:
+            while size > 0:
+                chunk = stream.read(min(size, SOLID_CHUNK_SIZE))
+                if not chunk:
+                    break
+                fp.write(chunk)
+                crc = crc32(chunk, crc)
+                size -= len(chunk)
+        return None if size else crc
 
     @classmethod
-    def identify_format(cls, path_info: PathInfo) -> FileFormat | None:
-        """Return the format if this handler can handle this path."""
+    def split_members(
+        cls,
+        stream: BinaryIO,
+        archive_infos: Iterable[RarInfo],
+        get_path: Callable[[], Path],
+    ) -> Generator[tuple[ZipInfo, Path], None, None]:
+        """Split members printed one after another into files by their sizes."""
+        for archive_info in archive_infos:
+            zipinfo = cls.to_zipinfo(archive_info)
+            if zipinfo.is_dir():
+                continue
+            path = get_path()
+            crc = cls._extract_member(stream, zipinfo.file_size, path)
+            if crc is None or (archive_info.CRC and crc != archive_info.CRC):
+                msg = f"Could not read {zipinfo.filename} from solid archive."
+                raise ValueError(msg)
+            limit_read(zipinfo.compress_size)
+            yield zipinfo, path
+
+    def _read_solid_members(
+        self, archive_infos: Iterable[RarInfo]
+    ) -> Generator[tuple[ZipInfo, Path], None, None]:
+        """Extract every member of a solid archive in one run of the tool."""
+        # The tool prints every member in archive order without a filename.
+        # They're extracted to the scratch dir, which is removed with the handler.
+        cmd = tool_setup().open_cmdline(None, str(self.original_path))
+        with Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL) as proc:  # noqa: S603
+            yield from self.split_members(
+                proc.stdout,  # type: ignore
+                archive_infos,
+                self.get_spill_path,
+            )
+
+    def _read_members(  # type: ignore
+        self, archive: RarFile
+    ) -> Generator[tuple[ZipInfo, Path | None], None, None]:
+        """Read solid archives in one pass. Reading members alone restarts it."""
+        if archive.is_solid():
+            yield from self._read_solid_members(archive.infolist())
+        else:
+            yield from super()._read_members(archive)  # type: ignore
+
+    @classmethod
+    def identify_suffix(cls, path_info: PathInfo) -> FileFormat | None:
+        """Return the format if the suffix matches, without reading the file."""
         file_format = None
         suffix = path_info.suffix().lower()
-        if is_rarfile(path_info.path_or_buffer()) and suffix == cls.INPUT_SUFFIX:
+        if suffix == cls.INPUT_SUFFIX:
             file_format = cls.INPUT_FILE_FORMAT
         return file_format
 
+    @classmethod
+    def identify_format(cls, path_info: PathInfo) -> FileFormat | None:
+        """Return the format if this handler can handle this path."""
+        if is_rarfile(path_info.path_or_buffer()):
+            return cls.identify_suffix(path_info)
+        return None
+
     def _get_archive(self) -> RarFile:  # type: ignore
         """Use the zipfile builtin for this archive."""
         if is_rarfile(self.original_path):
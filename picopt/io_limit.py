@@ -0,0 +1,155 @@
+"""Share disk read and write rate limits between the workers."""
+
+from io import BufferedReader, FileIO
+from multiprocessing import Array
+from pathlib import Path
+from time import monotonic, sleep
+
+from confuse.templates import AttrDict
+from humanize import naturalsize
+from termcolor import cprint
+
+_MB = 1024 * 1024
+# Seconds of full rate a bucket may save up while idle.
+_BURST_SECONDS = 1.0
+
+
+class _TokenBucket:
+    """A token bucket in shared memory.
+
+    Takes may overdraw the bucket. The taker sleeps off the debt, so a read
+    larger than the burst still goes through at the average rate.
+    """
+
+    def __init__(self, rate: float):
+        """Start full."""
+        self._rate = rate
+        self._burst = rate * _BURST_SECONDS
+        # tokens, last refill
+        self._state = Array("d", (self._burst, monotonic()))
+
+    def take(self, amount: float) -> float:
+        """Take tokens, sleeping until they're paid for. Return the wait."""
+        with self._state.get_lock():
+            tokens, last = self._state[0], self._state[1]
+            now = monotonic()
+            tokens = min(self._burst, tokens + (now - last) * self._rate) - amount
+            self._state[0], self._state[1] = tokens, now
+        wait = -tokens / self._rate if tokens < 0 else 0.0
+        if wait:
+            sleep(wait)
+        return wait
+
+
+class IOLimiter:
+    """Limit the bytes and operations per second read and written.
+
+    Pool workers inherit the shared buckets so the limits hold for the whole
+    run. Time spent waiting is summed for the final report.
+    """
+
+    _READ = 0
+    _WRITE = 1
+
+    def __init__(
+        self,
+        read_mbps: float = 0,
+        write_mbps: float = 0,
+        read_iops: float = 0,
+        write_iops: float = 0,
+    ):
+        """Create a bucket for each limit set."""
+        self._byte_buckets = tuple(
+            _TokenBucket(mbps * _MB) if mbps else None
+            for mbps in (read_mbps, write_mbps)
+        )
+        self._op_buckets = tuple(
+            _TokenBucket(iops) if iops else None for iops in (read_iops, write_iops)
+        )
+        # throttled seconds, bytes for reads then writes
+        self._stats = Array("d", 4)
+
+    def _take(self, direction: int, size: int) -> None:
+        """Wait for a direction's byte and op buckets."""
+        wait = 0.0
+        if bucket := self._byte_buckets[direction]:
+            wait += bucket.take(size)
+        if bucket := self._op_buckets[direction]:
+            wait += bucket.take(1)
+        with self._stats.get_lock():
+            self._stats[direction * 2] += wait
+            self._stats[direction * 2 + 1] += size
+
+    def read(self, size: int) -> None:
+        """Account for a read."""
+        self._take(self._READ, size)
+
+    def write(self, size: int) -> None:
+        """Account for a write."""
+        self._take(self._WRITE, size)
+
+    def report(self) -> None:
+        """Print the time spent throttled."""
+        read_wait, read_bytes, write_wait, write_bytes = self._stats[:]
+        cprint(
+            f"Throttled reads {read_wait:.2f}s for {naturalsize(read_bytes)} and "
+            f"writes {write_wait:.2f}s for {naturalsize(write_bytes)}."
+        )
+
+
+def get_io_limiter(config: AttrDict) -> IOLimiter | None:
+    """Create a limiter if any limits are configured."""
+    limits = (
+        config.read_mbps,
+        config.write_mbps,
+        config.read_iops,
+        config.write_iops,
+    )
+    return IOLimiter(*limits) if any(limits) else None
+
+
+# The run's limiter. Set in each worker by set_io_limiter().
+_limiter: IOLimiter | None = None
+
+
+def set_io_limiter(limiter: IOLimiter | None) -> None:
+    """Use a limiter in this process."""
+    global _limiter  # noqa: PLW0603
+    _limiter = limiter
+
+
+def limit_read(size: int) -> None:
+    """Wait until a read fits under the limits."""
+    if _limiter:
+        _limiter.read(size)
+
+
+def limit_write(size: int) -> None:
+    """Wait until a write fits under the limits."""
+    if _limiter:
+        _limiter.write(size)
+
+
+class _LimitedFileIO(FileIO):
+    """A raw file that waits for the read limits."""
+
+    def readinto(self, buffer) -> int | None:
+        """Read then account for it."""
+        size = super().readinto(buffer)
+        if size:
+            limit_read(size)
+        return size
+
+    def readall(self) -> bytes:
+        """Read the rest then account for it."""
+        data = super().readall()
+        if data:
+            limit_read(len(data))
+        return data
+
+
+def open_read(path: Path) -> BufferedReader:
+    """Open a file for reading, metered if there's a limiter."""
+    if not _limiter:
+        return path.open("rb")
+    return BufferedReader(_LimitedFileIO(path, "r"))
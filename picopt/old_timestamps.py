@@ -2,13 +2,22 @@
 
 import os
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from confuse.templates import AttrDict
-from treestamps import Treestamps
+from termcolor import cprint
 
 from picopt.path import is_path_ignored
 
+if TYPE_CHECKING:
+    from treestamps import Treestamps
+
+    from picopt.walk.sqlite_timestamps import SQLiteTreestamps
+
 OLD_TIMESTAMPS_NAME = ".picopt_timestamp"
+# Recorded for the root's legacy path once imported. Far enough in the future
+# that compaction never removes it.
+IMPORTED_MTIME = 2.0**53
 
 
 class OldTimestamps:
@@ -34,29 +43,50 @@ class OldTimestamps:
         if path.parent != path:
             self._import_old_parent_timestamps(path.parent)
 
+    def _is_dir_skipped(self, path: Path) -> bool:
+        """Is the directory ignored or a symlink that shouldn't be followed."""
+        return is_path_ignored(self._config, path) or (
+            not self._config.symlinks and path.is_symlink()
+        )
+
     def _import_old_child_timestamps(self, path: Path) -> None:
-        if (
-            is_path_ignored(self._config, path)
-            or not self._config.symlinks
-            and path.is_symlink()
-        ):
+        """Find old timestamps below the path in one pass."""
+        if self._is_dir_skipped(path):
             return
-        for root, dirnames, filenames in os.walk(path):
-            root_path = Path(root)
-            if OLD_TIMESTAMPS_NAME in filenames:
-                old_timestamp_path = root_path / OLD_TIMESTAMPS_NAME
-                self._add_old_timestamp(old_timestamp_path)
-                # Picopt is the only program that used old treestamps
-                self._timestamps._consumed_paths.add(old_timestamp_path)  # noqa SLF001
-            for dirname in dirnames:
-                self._import_old_child_timestamps(root_path / dirname)
+        dir_paths = [path]
+        # Symlinked dirs can loop.
+        visited = set()
+        while dir_paths:
+            dir_path = dir_paths.pop()
+            try:
+                stat = dir_path.stat()
+                if (stat.st_dev, stat.st_ino) in visited:
+                    continue
+                visited.add((stat.st_dev, stat.st_ino))
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        entry_path = Path(entry.path)
+                        if entry.name == OLD_TIMESTAMPS_NAME:
+                            self._add_old_timestamp(entry_path)
+                            # Picopt is the only program that used old treestamps
+                            self._timestamps._consumed_paths.add(entry_path)  # noqa SLF001
+                        elif entry.is_dir() and not self._is_dir_skipped(entry_path):
+                            dir_paths.append(entry_path)
+            except OSError as exc:
+                cprint(f"WARNING: reading old timestamps: {exc}", "yellow")
 
     def import_old_timestamps(self) -> None:
-        """Import all old timestamps."""
-        self._import_old_parent_timestamps(self._timestamps.root_dir)
-        self._import_old_child_timestamps(self._timestamps.root_dir)
+        """Import all old timestamps once."""
+        root_dir = self._timestamps.root_dir
+        marker_path = root_dir / OLD_TIMESTAMPS_NAME
+        imported_mtime = self._timestamps.get(marker_path)
+        if imported_mtime is not None and imported_mtime >= IMPORTED_MTIME:
+            return
+        self._import_old_parent_timestamps(root_dir)
+        self._import_old_child_timestamps(root_dir)
+        self._timestamps.set(marker_path, IMPORTED_MTIME)
 
-    def __init__(self, config: AttrDict, timestamps: Treestamps):
+    def __init__(self, config: AttrDict, timestamps: "Treestamps | SQLiteTreestamps"):
         """Hold new timestamp object."""
         self._config = config
         self._timestamps = timestamps
@@ -1,16 +1,72 @@
 """Data classes."""
 
-from collections.abc import Sequence
+from collections import OrderedDict
+from collections.abc import Generator, Sequence
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from io import BufferedReader, BytesIO
 from os import stat_result
 from pathlib import Path
-from zipfile import ZipInfo
+from threading import Lock
+from zipfile import ZipFile, ZipInfo
 
 from confuse import AttrDict
+from rarfile import RarFile, is_rarfile
+
+from picopt.io_limit import limit_read, open_read
 
 TMP_DIR = Path("__picopt_tmp")
 CONTAINER_PATH_DELIMETER = " - "
+# Archives each process keeps open to read lazy members from.
+MAX_OPEN_ARCHIVES = 8
+
+
+class _OpenArchive:
+    """An open archive and the reads using it."""
+
+    __slots__ = ("archive", "evicted", "users")
+
+    def __init__(self, archive: ZipFile | RarFile) -> None:
+        """Initialize."""
+        self.archive = archive
+        self.users = 0
+        self.evicted = False
+
+
+_open_archives: OrderedDict[tuple, _OpenArchive] = OrderedDict()
+_open_archives_lock = Lock()
+
+
+@contextmanager
+def open_archive(archive_path: Path) -> Generator[ZipFile | RarFile, None, None]:
+    """Use an archive this process already opened or open it.
+
+    Keyed by inode, size and mtime so a repacked archive is opened again.
+    Archives evicted from the cache close when their last read finishes.
+    """
+    stat = archive_path.stat()
+    key = (archive_path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _open_archives_lock:
+        entry = _open_archives.get(key)
+        if entry:
+            _open_archives.move_to_end(key)
+        else:
+            archive_cls = RarFile if is_rarfile(archive_path) else ZipFile
+            entry = _OpenArchive(archive_cls(archive_path, "r"))
+            _open_archives[key] = entry
+            if len(_open_archives) > MAX_OPEN_ARCHIVES:
+                _, evicted = _open_archives.popitem(last=False)
+                evicted.evicted = True
+                if not evicted.users:
+                    evicted.archive.close()
+        entry.users += 1
+    try:
+        yield entry.archive
+    finally:
+        with _open_archives_lock:
+            entry.users -= 1
+            if entry.evicted and not entry.users:
+                entry.archive.close()
 
 
 class PathInfo:
@@ -27,6 +83,11 @@ class PathInfo:
         zipinfo: ZipInfo | None = None,
         data: bytes | None = None,
         container_paths: Sequence[str] | None = None,
+        stat: stat_result | None = None,
+        is_dir: bool | None = None,
+        is_symlink: bool | None = None,
+        archive_path: Path | None = None,
+        extracted_path: Path | None = None,
     ):
         """Initialize."""
         self.top_path: Path = top_path
@@ -42,6 +103,10 @@ class PathInfo:
         self.frame: int | None = frame
         # An archived file (in a container)
         self.zipinfo: ZipInfo | None = zipinfo
+        # The archive on disk to lazily read an archived file from
+        self.archive_path: Path | None = archive_path
+        # The scratch file a solid archive's member was extracted to
+        self.extracted_path: Path | None = extracted_path
         # The history of parent container names
         self.container_paths: tuple[str, ...] = (
             tuple(container_paths) if container_paths else ()
@@ -50,9 +115,10 @@ class PathInfo:
         # optionally computed
         self._data: bytes | None = data
 
-        # always computed
-        self._is_dir: bool | None = None
-        self._stat: stat_result | bool | None = None
+        # always computed, unless passed in by the walker
+        self._is_dir: bool | None = is_dir
+        self._is_symlink: bool | None = is_symlink
+        self._stat: stat_result | bool | None = stat
         self._bytes_in: int | None = None
         self._mtime: float | None = None
         self._name: str | None = None
@@ -72,6 +138,18 @@ class PathInfo:
 
         return self._is_dir
 
+    def is_symlink(self) -> bool:
+        """Is the file a symlink."""
+        if self._is_symlink is None:
+            self._is_symlink = bool(self.path) and self.path.is_symlink()  # type: ignore
+        return self._is_symlink
+
+    def exists(self) -> bool:
+        """Check if the file exists on the filesystem."""
+        if self._stat not in (None, False, True):
+            return True
+        return bool(self.path) and self.path.exists()  # type: ignore
+
     def is_container_child(self) -> bool:
         """Is this path inside a container."""
         if self._is_container_child is None:
@@ -80,19 +158,34 @@ class PathInfo:
             )
         return self._is_container_child
 
+    def is_lazy_member(self) -> bool:
+        """Is this an archived file the workers read the data for."""
+        return bool(self.zipinfo) and bool(self.archive_path or self.extracted_path)
+
     def stat(self) -> stat_result | bool:
         """Return fs_stat if possible."""
         if self._stat is None:
             self._stat = self.path.stat() if self.path else False
         return self._stat
 
+    def _read_archive_member(self) -> bytes:
+        """Decompress the data from the archive it lives in."""
+        limit_read(self.zipinfo.compress_size)  # type: ignore
+        with open_archive(self.archive_path) as archive:  # type: ignore
+            return archive.read(self.zipinfo.filename)  # type: ignore
+
     def data(self) -> bytes:
         """Get the data from the file."""
         if self._data is None:
-            if not self.path or self.path.is_dir():
+            if self.archive_path and self.zipinfo:
+                self._data = self._read_archive_member()
+            elif self.extracted_path:
+                with open_read(self.extracted_path) as fp:
+                    self._data = fp.read()
+            elif not self.path or self.path.is_dir():
                 self._data = b""
             else:
-                with self.path.open("rb") as fp:
+                with open_read(self.path) as fp:
                     self._data = fp.read()
         return self._data
 
@@ -111,7 +204,7 @@ class PathInfo:
     def fp_or_buffer(self) -> BufferedReader | BytesIO:
         """Return an file pointer for chunking or buffer."""
         if self.path:
-            return self.path.open("rb")
+            return open_read(self.path)
         return self._buffer()
 
     def bytes_in(self) -> int:
@@ -120,6 +213,9 @@ class PathInfo:
             stat = self.stat()
             if stat not in (False, True):
                 self._bytes_in = stat.st_size
+            elif self.is_lazy_member() and self._data is None:
+                # Don't decompress or read just to get the size.
+                self._bytes_in = self.zipinfo.file_size  # type: ignore
             else:
                 self._bytes_in = len(self.data())
         return self._bytes_in
@@ -0,0 +1,113 @@
+"""Lower picopt's cpu and io priority to run beside latency sensitive work."""
+
+import ctypes
+import os
+import platform
+import sys
+from types import MappingProxyType
+
+from confuse.templates import AttrDict
+from termcolor import cprint
+
+from picopt.exceptions import PicoptError
+
+IONICE_CLASSES = ("realtime", "best-effort", "idle")
+IONICE_LEVELS = range(8)
+_DEFAULT_IONICE_LEVEL = 4
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+# Linux has no libc wrapper for ioprio_set.
+_SYS_IOPRIO_SET = MappingProxyType(
+    {
+        "x86_64": 251,
+        "i386": 289,
+        "i686": 289,
+        "aarch64": 30,
+        "arm64": 30,
+        "riscv64": 30,
+        "armv7l": 314,
+        "ppc64": 273,
+        "ppc64le": 273,
+        "s390x": 282,
+    }
+)
+
+
+def parse_cpu_list(cpu_list: str) -> frozenset[int]:
+    """Parse a cpu list like 0-3,8 as used by taskset and cpusets."""
+    cpus = set()
+    msg = f"Bad cpu list: {cpu_list}"
+    for part in cpu_list.split(","):
+        first, sep, last = part.strip().partition("-")
+        try:
+            cpu_range = range(int(first), int(last if sep else first) + 1)
+        except ValueError as exc:
+            raise PicoptError(msg) from exc
+        if not cpu_range:
+            raise PicoptError(msg)
+        cpus.update(cpu_range)
+    return frozenset(cpus)
+
+
+def _set_ioprio(io_class: str, level: int) -> None:
+    """Set the io scheduling class and level with the ioprio_set syscall."""
+    number = _SYS_IOPRIO_SET.get(platform.machine())
+    if not sys.platform.startswith("linux") or not number:
+        msg = f"ioprio_set isn't available on {sys.platform} {platform.machine()}"
+        raise OSError(msg)
+    ioprio = (IONICE_CLASSES.index(io_class) + 1) << _IOPRIO_CLASS_SHIFT | level
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(number, _IOPRIO_WHO_PROCESS, 0, ioprio) < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def _set_affinity(cpu_affinity: str) -> None:
+    """Pin to a cpu list."""
+    if not hasattr(os, "sched_setaffinity"):
+        msg = f"cpu affinity isn't available on {sys.platform}"
+        raise OSError(msg)
+    os.sched_setaffinity(0, parse_cpu_list(cpu_affinity))
+
+
+def set_priority(
+    cpu_affinity: str | None,
+    nice: int | None,
+    ionice_class: str | None,
+    ionice_level: int | None,
+) -> list[str]:
+    """Set the affinity, nice and io priority. Return what was set.
+
+    Run before the workers start. Worker processes, threads and the external
+    programs they run inherit all three.
+    """
+    if ionice_level is None:
+        ionice_level = _DEFAULT_IONICE_LEVEL
+    if ionice_level not in IONICE_LEVELS:
+        msg = f"ionice level must be 0-7, not {ionice_level}"
+        raise PicoptError(msg)
+    done = []
+    try:
+        if cpu_affinity:
+            _set_affinity(cpu_affinity)
+            done.append(f"on cpus {cpu_affinity}")
+        if nice is not None:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+            done.append(f"at nice {nice}")
+        if ionice_class:
+            _set_ioprio(ionice_class, ionice_level)
+            level = "" if ionice_class == "idle" else f" {ionice_level}"
+            done.append(f"with io class {ionice_class}{level}")
+    except OSError as exc:
+        msg = f"Couldn't set the priority: {exc}"
+        raise PicoptError(msg) from exc
+    return done
+
+
+def set_config_priority(config: AttrDict) -> None:
+    """Set the configured priority before starting the workers."""
+    done = set_priority(
+        config.cpu_affinity, config.nice, config.ionice_class, config.ionice_level
+    )
+    if done and config.verbose > 1:
+        cprint(f"Running {', '.join(done)}.", "cyan")
@@ -0,0 +1,139 @@
+"""Detect the CPUs and memory picopt may use inside cgroup limits."""
+
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+PROC_CGROUP = Path("/proc/self/cgroup")
+_CGROUP_V2_UNLIMITED = "max"
+
+
+@dataclass(frozen=True)
+class Resources:
+    """The CPUs and memory limit available and where they came from."""
+
+    cpus: int
+    cpu_source: str
+    memory_limit: int | None = None
+
+
+def _read(path: Path) -> str:
+    """Read a small kernel file, empty if it's missing."""
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return ""
+
+
+def _get_cgroup_dirs(
+    controller: str, cgroup_root: Path, proc_cgroup: Path
+) -> list[Path]:
+    """Get this process's cgroup directories for a controller and their parents.
+
+    A parent's limit applies to its children so every level is checked.
+    Inside a container the path is often the host's and only the root exists.
+    """
+    dirs = []
+    for line in _read(proc_cgroup).splitlines():
+        parts = line.split(":", 2)
+        if len(parts) != 3:  # noqa: PLR2004
+            continue
+        _, controllers, rel_path = parts
+        if not controllers:
+            # cgroup v2, mounted beside v1 on hybrid systems.
+            base = cgroup_root
+            if not (base / "cgroup.controllers").exists():
+                base = cgroup_root / "unified"
+        elif controller in controllers.split(","):
+            base = cgroup_root / controllers
+            if not base.is_dir():
+                base = cgroup_root / controller
+        else:
+            continue
+        path = base / rel_path.strip("/")
+        while path != base and base in path.parents:
+            dirs.append(path)
+            path = path.parent
+        dirs.append(base)
+    return dirs
+
+
+def _get_cpu_quota(cgroup_dir: Path) -> float | None:
+    """Get the cores a cgroup may use from cgroup v2 or v1 files."""
+    if cpu_max := _read(cgroup_dir / "cpu.max"):
+        quota, _, period = cpu_max.partition(" ")
+    else:
+        quota = _read(cgroup_dir / "cpu.cfs_quota_us")
+        period = _read(cgroup_dir / "cpu.cfs_period_us")
+    try:
+        quota_us, period_us = int(quota), int(period)
+    except ValueError:
+        # unlimited or missing
+        return None
+    if quota_us <= 0 or period_us <= 0:
+        return None
+    return quota_us / period_us
+
+
+def _get_memory_limit(cgroup_dir: Path) -> int | None:
+    """Get a cgroup's memory limit from cgroup v2 or v1 files."""
+    limit = _read(cgroup_dir / "memory.max") or _read(
+        cgroup_dir / "memory.limit_in_bytes"
+    )
+    if not limit or limit == _CGROUP_V2_UNLIMITED:
+        return None
+    try:
+        return int(limit)
+    except ValueError:
+        return None
+
+
+def _get_physical_memory() -> int | None:
+    """Get the machine's memory."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _get_affinity_cpus(affinity: frozenset[int] | None) -> tuple[int, str]:
+    """Get the cores this process may be scheduled on."""
+    if affinity:
+        return len(affinity), "CPU affinity"
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)), "CPU affinity"
+    return os.cpu_count() or 1, "CPU count"
+
+
+def detect_resources(
+    cgroup_root: Path = CGROUP_ROOT,
+    proc_cgroup: Path = PROC_CGROUP,
+    affinity: frozenset[int] | None = None,
+) -> Resources:
+    """Detect the cores and memory limit for default jobs and memory budgets.
+
+    An affinity counts the cpus the process will be pinned to instead of
+    the ones it may use now.
+    """
+    cpus, cpu_source = _get_affinity_cpus(affinity)
+    quotas = [
+        quota
+        for cgroup_dir in _get_cgroup_dirs("cpu", cgroup_root, proc_cgroup)
+        if (quota := _get_cpu_quota(cgroup_dir))
+    ]
+    if quotas and (quota_cpus := math.ceil(min(quotas))) < cpus:
+        cpus, cpu_source = max(1, quota_cpus), "cgroup CPU quota"
+
+    limits = [
+        limit
+        for cgroup_dir in _get_cgroup_dirs("memory", cgroup_root, proc_cgroup)
+        if (limit := _get_memory_limit(cgroup_dir))
+    ]
+    memory_limit = min(limits) if limits else None
+    physical_memory = _get_physical_memory()
+    if memory_limit and physical_memory and memory_limit >= physical_memory:
+        # cgroup v1 reports no limit as a huge number.
+        memory_limit = None
+    return Resources(cpus, cpu_source, memory_limit)
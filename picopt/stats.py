@@ -14,6 +14,8 @@ from picopt.path import CONTAINER_PATH_DELIMETER, PathInfo
 if TYPE_CHECKING:
     from termcolor._types import Attribute, Color
 
+    from picopt.io_limit import IOLimiter
+
 
 @dataclass
 class ReportStatBase:
@@ -109,6 +111,41 @@ class ReportStats(ReportStatBase):
         cprint(report, color, attrs=attrs)
 
 
+@dataclass
+class QueueStats:
+    """Task queue statistics for the final report."""
+
+    tasks: int = 0
+    peak_depth: int = 0
+    peak_bytes: int = 0
+    blocked_seconds: float = 0.0
+    byte_blocks: int = 0
+    byte_blocked_seconds: float = 0.0
+    peak_memory: int = 0
+    oversized: int = 0
+    memory_blocks: int = 0
+    memory_blocked_seconds: float = 0.0
+
+    def report(self) -> None:
+        """Print the queue statistics."""
+        cprint(
+            f"Queued {self.tasks} tasks, peak depth {self.peak_depth}, "
+            f"peak {naturalsize(self.peak_bytes)} in flight."
+        )
+        cprint(
+            f"Waited {self.blocked_seconds:.2f}s for tasks to finish, "
+            f"{self.byte_blocked_seconds:.2f}s of it over the memory budget "
+            f"{self.byte_blocks} times."
+        )
+        if self.peak_memory or self.oversized:
+            cprint(
+                f"Peak {naturalsize(self.peak_memory)} estimated to decode images "
+                f"in flight, {self.oversized} oversized images ran one at a time. "
+                f"Waited {self.memory_blocked_seconds:.2f}s over the decode memory "
+                f"ceiling {self.memory_blocks} times."
+            )
+
+
 class Totals:
     """Totals for final report."""
 
@@ -117,6 +154,8 @@ class Totals:
         self.bytes_in: int = 0
         self.bytes_out: int = 0
         self.errors: list[ReportStats] = []
+        self.queue: QueueStats | None = None
+        self.io: IOLimiter | None = None
         self._config: AttrDict = config
 
     ##########
@@ -157,6 +196,11 @@ class Totals:
         elif self._config.verbose:
             cprint("Didn't optimize any files.")
 
+        if self.queue and self._config.verbose > 1:
+            self.queue.report()
+        if self.io and self._config.verbose:
+            self.io.report()
+
         if self.errors:
             cprint("Errors with the following files:", "red")
             for rs in self.errors:
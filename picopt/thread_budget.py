@@ -0,0 +1,66 @@
+"""Share CPU cores between the workers and their multithreaded tools."""
+
+import os
+from collections.abc import Generator
+from contextlib import contextmanager
+from multiprocessing import Value
+from multiprocessing.sharedctypes import Synchronized
+
+# Free cores shared by every worker. Set in each worker by init_worker().
+_free_threads: Synchronized | None = None
+
+
+def init_worker(free_threads: Synchronized, threads_per_job: int) -> None:
+    """Attach a pool worker to the parent's budget."""
+    global _free_threads  # noqa: PLW0603
+    _free_threads = free_threads
+    # oxipng's thread pool is sized once per process.
+    os.environ["RAYON_NUM_THREADS"] = str(threads_per_job)
+
+
+@contextmanager
+def threads(appetite: int) -> Generator[int, None, None]:
+    """Reserve up to appetite threads for a stage, always at least one.
+
+    The worker's own core is the first thread. Extra threads come from cores
+    with no busy worker. Outside of a budgeted pool the full appetite is granted.
+    """
+    free_threads = _free_threads
+    if free_threads is None:
+        yield max(1, appetite)
+        return
+    with free_threads.get_lock():
+        extra = max(0, min(appetite - 1, free_threads.value))
+        free_threads.value -= extra
+    try:
+        yield 1 + extra
+    finally:
+        with free_threads.get_lock():
+            free_threads.value += extra
+
+
+class ThreadBudget:
+    """Track the cores left free by idle workers in the main process."""
+
+    def __init__(self, jobs: int, cpus: int | None = None):
+        """Start with every core free."""
+        self._jobs = max(1, jobs)
+        cpus = cpus or os.cpu_count() or 1
+        self._free_threads: Synchronized = Value("i", cpus)
+        self._busy: int = 0
+        self.threads_per_job = max(1, cpus // self._jobs)
+
+    @property
+    def initargs(self) -> tuple[Synchronized, int]:
+        """Arguments for init_worker."""
+        return (self._free_threads, self.threads_per_job)
+
+    def set_in_flight(self, in_flight: int) -> None:
+        """Take or return the cores of busy workers."""
+        busy = min(in_flight, self._jobs)
+        delta = busy - self._busy
+        if not delta:
+            return
+        self._busy = busy
+        with self._free_threads.get_lock():
+            self._free_threads.value -= delta
@@ -0,0 +1,7 @@
+"""Walk the directory trees and files and call the optimizers."""
+
+from picopt.walk.distributed import Worker
+from picopt.walk.walk import Walk
+from picopt.walk.watch import Watch
+
+__all__ = ("Walk", "Watch", "Worker")
@@ -0,0 +1,138 @@
+"""Adjust the tasks in flight toward the best throughput while walking."""
+
+import os
+from pathlib import Path
+from time import monotonic
+
+from humanize import naturalsize
+from termcolor import cprint
+
+_PROC_STAT = Path("/proc/stat")
+_IOWAIT_FIELD = 4
+
+
+def _read_cpu_times() -> tuple[int, int] | None:
+    """Get the total and iowait jiffies of all cpus."""
+    try:
+        with _PROC_STAT.open() as stat_file:
+            fields = stat_file.readline().split()[1:]
+        times = tuple(int(field) for field in fields)
+        return sum(times), times[_IOWAIT_FIELD]
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _get_load() -> float | None:
+    """Get the one minute load average."""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+class ConcurrencyController:
+    """Hill climb the number of tasks in flight toward the best throughput.
+
+    Every interval the bytes and files finished per second are measured and
+    the slots move one step. The step reverses when throughput drops and at
+    the bounds. Slots shrink while the cpus are overloaded or mostly waiting
+    on io, since more tasks would only queue behind the others.
+    """
+
+    INTERVAL = 2.0
+    # Finished tasks per slot before an interval counts, to smooth noise.
+    MIN_TASKS_PER_SLOT = 2
+    # Drops in throughput smaller than this are noise.
+    TOLERANCE = 0.05
+    MAX_LOAD_PER_CPU = 1.5
+    MAX_IOWAIT = 0.5
+
+    def __init__(
+        self, min_slots: int, max_slots: int, cpus: int, verbose: int = 0
+    ) -> None:
+        """Start in the middle of the range, climbing."""
+        self._min_slots = max(1, min(min_slots, max_slots))
+        self._max_slots = max(1, max_slots)
+        self._cpus = max(1, cpus)
+        self._verbose = verbose
+        self.slots = (self._min_slots + self._max_slots + 1) // 2
+        self._direction = 1
+        self._last_score: float | None = None
+        self._start = monotonic()
+        self._files = 0
+        self._bytes = 0
+        self._cpu_times = _read_cpu_times()
+
+    def _get_iowait(self) -> float | None:
+        """Get the share of cpu time spent waiting on io since last time."""
+        cpu_times = _read_cpu_times()
+        last_cpu_times, self._cpu_times = self._cpu_times, cpu_times
+        if not cpu_times or not last_cpu_times:
+            return None
+        total = cpu_times[0] - last_cpu_times[0]
+        if total <= 0:
+            return None
+        return (cpu_times[1] - last_cpu_times[1]) / total
+
+    def _is_saturated(self, iowait: float | None, load: float | None) -> bool:
+        """Would more tasks only wait for cpu or io."""
+        return bool(
+            (load is not None and load / self._cpus > self.MAX_LOAD_PER_CPU)
+            or (iowait is not None and iowait > self.MAX_IOWAIT)
+        )
+
+    def _climb(self, score: float, saturated: bool) -> int:
+        """Take one step, reversing if the last one made things worse."""
+        if self._last_score is not None and score < self._last_score * (
+            1 - self.TOLERANCE
+        ):
+            self._direction = -self._direction
+        if saturated:
+            self._direction = -1
+        self._last_score = score
+        slots = min(max(self.slots + self._direction, self._min_slots), self._max_slots)
+        if slots == self.slots:
+            # At a bound, probe back the other way next time.
+            self._direction = -self._direction
+        return slots
+
+    def _log(
+        self,
+        slots: int,
+        files_per_second: float,
+        bytes_per_second: float,
+        iowait: float | None,
+        load: float | None,
+    ) -> None:
+        """Print an adjustment."""
+        iowait_str = "?" if iowait is None else f"{iowait:.0%}"
+        load_str = "?" if load is None else f"{load:.2f}"
+        cprint(
+            f"\nConcurrency {self.slots} -> {slots}: {files_per_second:.1f} files/s, "
+            f"{naturalsize(bytes_per_second)}/s, iowait {iowait_str}, "
+            f"load {load_str}",
+            "cyan",
+        )
+
+    def update(self, size: int) -> int:
+        """Record a finished task and return the slots to use."""
+        self._files += 1
+        self._bytes += size
+        elapsed = monotonic() - self._start
+        if (
+            elapsed < self.INTERVAL
+            or self._files < self.slots * self.MIN_TASKS_PER_SLOT
+        ):
+            return self.slots
+        files_per_second = self._files / elapsed
+        bytes_per_second = self._bytes / elapsed
+        iowait = self._get_iowait()
+        load = _get_load()
+        slots = self._climb(bytes_per_second, self._is_saturated(iowait, load))
+        if slots != self.slots and self._verbose > 1:
+            self._log(slots, files_per_second, bytes_per_second, iowait, load)
+        self.slots = slots
+        self._start = monotonic()
+        self._files = 0
+        self._bytes = 0
+        return slots
@@ -0,0 +1,522 @@
+"""Share a walk's tasks with worker nodes through a SQLite work queue."""
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+from base64 import b64decode, b64encode
+from collections.abc import Callable
+from multiprocessing.pool import Pool
+from pathlib import Path
+from stat import S_ISVTX, S_IWGRP, S_IWOTH
+from threading import Event, Lock, Thread
+from time import monotonic, sleep, time
+from typing import Any
+from zipfile import ZipInfo
+
+from confuse.templates import AttrDict
+from termcolor import cprint
+
+from picopt.exceptions import PicoptError
+from picopt.handlers.factory import create_handler
+from picopt.handlers.handler import Handler
+from picopt.io_limit import get_io_limiter, set_io_limiter
+from picopt.path import PathInfo
+from picopt.priority import set_config_priority
+from picopt.stats import ReportStats
+from picopt.thread_budget import ThreadBudget
+from picopt.walk.executor import Executor
+from picopt.walk.worker import init_pool_worker, optimize_contents, optimize_file
+
+# Task states
+QUEUED = 0
+LEASED = 1
+DONE = 2
+ERROR = 3
+
+# A leased task is requeued if its worker doesn't renew the lease in time.
+LEASE_SECONDS = 60.0
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+# Workers stop if the coordinator's heartbeat doesn't change for this long.
+COORDINATOR_TIMEOUT = LEASE_SECONDS
+POLL_SECONDS = 0.1
+_QUEUE_FILE_MODE = 0o600
+_OTHERS_WRITE = S_IWGRP | S_IWOTH
+# Settings that change what a worker does. Walk settings stay on the coordinator.
+_WORKER_CONFIG_KEYS = (
+    "bigger",
+    "container_memory",
+    "convert_to",
+    "formats",
+    "keep_metadata",
+    "list_only",
+    "near_lossless",
+    "png_max",
+    "preserve",
+    "test",
+)
+_ZIPINFO_ATTRS = ("file_size", "compress_size", "CRC", "compress_type")
+# Tasks the workers rebuild from plain data. The rest run on the coordinator.
+_QUEUE_TASKS: dict[Callable, str] = {
+    optimize_file: "file",
+    optimize_contents: "contents",
+}
+_TASK_FUNCS = {name: func for func, name in _QUEUE_TASKS.items()}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    state INTEGER NOT NULL,
+    payload BLOB,
+    result BLOB,
+    worker TEXT,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+def _check_trusted(path: Path) -> None:
+    """Refuse a queue that other users could write tasks into."""
+    if not hasattr(os, "getuid"):
+        return
+    dir_mode = path.parent.stat().st_mode
+    if dir_mode & _OTHERS_WRITE and not dir_mode & S_ISVTX:
+        msg = f"Queue directory {path.parent} is writable by other users."
+        raise PicoptError(msg)
+    if not path.exists():
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, _QUEUE_FILE_MODE))
+    stat = path.stat()
+    if stat.st_uid != os.getuid() or stat.st_mode & _OTHERS_WRITE:
+        msg = f"Queue {path} is owned or writable by another user."
+        raise PicoptError(msg)
+
+
+def get_config_fingerprint(config: AttrDict) -> str:
+    """Hash the settings and handler stages that shape a worker's results."""
+    settings = {key: config[key] for key in _WORKER_CONFIG_KEYS}
+    settings["stages"] = {
+        handler_class.__name__: sorted(stages)
+        for handler_class, stages in config.computed.handler_stages.items()
+    }
+    data = json.dumps(settings, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _encode_path(path: Path | None) -> str | None:
+    """Serialize an optional path."""
+    return str(path) if path else None
+
+
+def _decode_path(path: str | None) -> Path | None:
+    """Deserialize an optional path."""
+    return Path(path) if path else None
+
+
+def _encode_path_info(path_info: PathInfo) -> dict:
+    """Serialize a file on disk or an archived file for a worker."""
+    zipinfo = path_info.zipinfo
+    return {
+        "top_path": str(path_info.top_path),
+        "container_mtime": path_info.container_mtime,
+        "convert": path_info.convert,
+        "is_case_sensitive": path_info.is_case_sensitive,
+        "path": _encode_path(path_info.path),
+        "archive_path": _encode_path(path_info.archive_path),
+        "extracted_path": _encode_path(path_info.extracted_path),
+        "container_paths": list(path_info.container_paths),
+        "zipinfo": {
+            "filename": zipinfo.filename,
+            "date_time": zipinfo.date_time,
+            **{attr: getattr(zipinfo, attr) for attr in _ZIPINFO_ATTRS},
+        }
+        if zipinfo
+        else None,
+    }
+
+
+def _decode_zipinfo(data: dict | None) -> ZipInfo | None:
+    """Deserialize an archived file's info."""
+    if not data:
+        return None
+    zipinfo = ZipInfo(data["filename"], tuple(data["date_time"]))
+    for attr in _ZIPINFO_ATTRS:
+        setattr(zipinfo, attr, data[attr])
+    return zipinfo
+
+
+def _decode_path_info(data: dict) -> PathInfo:
+    """Deserialize a path info in a worker."""
+    return PathInfo(
+        Path(data["top_path"]),
+        data["container_mtime"],
+        data["convert"],
+        data["is_case_sensitive"],
+        path=_decode_path(data["path"]),
+        zipinfo=_decode_zipinfo(data["zipinfo"]),
+        container_paths=data["container_paths"],
+        archive_path=_decode_path(data["archive_path"]),
+        extracted_path=_decode_path(data["extracted_path"]),
+    )
+
+
+def _encode_result(result: ReportStats | Handler | None) -> dict:
+    """Serialize a task's result in a worker."""
+    if result is None:
+        return {"type": "none"}
+    if isinstance(result, Handler):
+        # Containers are walked by the coordinator.
+        return {"type": "handler"}
+    return {
+        "type": "report",
+        "path": _encode_path(result.path),
+        "bytes_in": result.bytes_in,
+        "bytes_out": result.bytes_out,
+        "data": b64encode(result.data).decode(),
+        "error": str(result.exc) if result.exc else None,
+    }
+
+
+def _decode_result(
+    config: AttrDict, path_info: PathInfo, result: dict
+) -> ReportStats | Handler | None:
+    """Deserialize a task's result for the coordinator's path info."""
+    result_type = result["type"]
+    if result_type == "none":
+        return None
+    if result_type == "handler":
+        # Identify it again here instead of shipping the handler.
+        return create_handler(config, path_info)
+    error = result["error"]
+    return ReportStats(
+        _decode_path(result["path"]),
+        bytes_in=result["bytes_in"],
+        bytes_out=result["bytes_out"],
+        exc=PicoptError(error) if error is not None else None,
+        data=b64decode(result["data"]),
+        config=config,
+        path_info=path_info,
+    )
+
+
+def _is_queueable(func: Callable, args: tuple, kwds: dict) -> bool:
+    """Can a worker rebuild this task from a path."""
+    if func not in _QUEUE_TASKS or kwds or len(args) < 2:  # noqa: PLR2004
+        return False
+    path_info: PathInfo = args[1]
+    return bool(path_info.path) or path_info.is_lazy_member()
+
+
+class WorkQueue:
+    """A task queue in a SQLite file that several hosts can open.
+
+    Tasks and results are JSON. Tasks name files for the workers to overwrite,
+    so the queue must be owned by and only writable by the user running
+    picopt. Each thread needs its own WorkQueue.
+    """
+
+    def __init__(self, path: Path | str, lease_seconds: float = LEASE_SECONDS):
+        """Open the queue, creating it if needed."""
+        _check_trusted(Path(path))
+        self._lease_seconds = lease_seconds
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.executescript(_SCHEMA)
+
+    def _set_closed(self, closed: bool) -> None:
+        """Mark whether the coordinator will add more tasks."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('closed', ?)",
+            (int(closed),),
+        )
+
+    def reset(self) -> None:
+        """Clear tasks from a previous run and open the queue."""
+        self._conn.execute("DELETE FROM tasks")
+        self._set_closed(False)
+        self.beat()
+
+    def beat(self) -> None:
+        """Show the workers the coordinator is alive."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('heartbeat', ?)",
+            (time(),),
+        )
+
+    def get_heartbeat(self) -> float | None:
+        """Get the coordinator's last heartbeat."""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'heartbeat'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        """Tell the workers no more tasks are coming."""
+        self._set_closed(True)
+        self._conn.close()
+
+    def is_closed(self) -> bool:
+        """Whether the coordinator has finished."""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'closed'"
+        ).fetchone()
+        return bool(row and row[0])
+
+    def put(self, payload: bytes) -> int:
+        """Queue a task and return its id."""
+        cursor = self._conn.execute(
+            "INSERT INTO tasks (state, payload) VALUES (?, ?)", (QUEUED, payload)
+        )
+        return cursor.lastrowid  # type: ignore
+
+    def lease(self, worker: str) -> tuple[int, bytes] | None:
+        """Lease the oldest queued task or one whose lease expired."""
+        now = time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT id, payload FROM tasks WHERE state = ? "
+                "OR (state = ? AND expires < ?) ORDER BY id LIMIT 1",
+                (QUEUED, LEASED, now),
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE tasks SET state = ?, worker = ?, expires = ? WHERE id = ?",
+                    (LEASED, worker, now + self._lease_seconds, row[0]),
+                )
+        finally:
+            self._conn.execute("COMMIT")
+        return row
+
+    def renew(self, task_id: int, worker: str) -> None:
+        """Extend a lease."""
+        self._conn.execute(
+            "UPDATE tasks SET expires = ? WHERE id = ? AND worker = ? AND state = ?",
+            (time() + self._lease_seconds, task_id, worker, LEASED),
+        )
+
+    def finish(self, task_id: int, worker: str, state: int, result: bytes) -> None:
+        """Store a result if the lease is still held."""
+        self._conn.execute(
+            "UPDATE tasks SET state = ?, result = ?, payload = NULL "
+            "WHERE id = ? AND worker = ? AND state = ?",
+            (state, result, task_id, worker, LEASED),
+        )
+
+    def take_finished(self) -> list[tuple[int, int, bytes]]:
+        """Remove and return finished tasks."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._conn.execute(
+                "SELECT id, state, result FROM tasks WHERE state >= ?", (DONE,)
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM tasks WHERE id = ?", ((row[0],) for row in rows)
+            )
+        finally:
+            self._conn.execute("COMMIT")
+        return rows
+
+
+class QueueExecutor:
+    """Publish tasks to a work queue and collect results from worker nodes.
+
+    Optimizing files is queued as paths for the workers. Tasks that need the
+    walk's state, like repacking containers, run in the local executor.
+    """
+
+    def __init__(self, config: AttrDict, local: Executor):
+        """Open and clear the queue."""
+        self._path = config.queue
+        self._fingerprint = get_config_fingerprint(config)
+        self._local = local
+        self._queue = WorkQueue(self._path)
+        self._queue.reset()
+        self._callbacks: dict[
+            int, tuple[AttrDict, PathInfo, Callable, Callable[[BaseException], None]]
+        ] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._collector = Thread(
+            target=self._collect, name="picopt-queue-results", daemon=True
+        )
+        self._collector.start()
+
+    def _dispatch_result(self, task_id: int, state: int, result: bytes) -> None:
+        """Run a finished task's callback."""
+        with self._lock:
+            config, path_info, callback, error_callback = self._callbacks.pop(task_id)
+        try:
+            value = json.loads(result)
+            decoded = (
+                None if state == ERROR else _decode_result(config, path_info, value)
+            )
+        except Exception as exc:
+            error_callback(exc)
+            return
+        if state == ERROR:
+            error_callback(PicoptError(value["error"]))
+        else:
+            callback(decoded)
+
+    def _collect(self) -> None:
+        """Poll for finished tasks and beat until closed."""
+        queue = WorkQueue(self._path)
+        last_beat = monotonic()
+        while not self._stop.is_set():
+            if monotonic() - last_beat >= HEARTBEAT_SECONDS:
+                queue.beat()
+                last_beat = monotonic()
+            rows = queue.take_finished()
+            for row in rows:
+                self._dispatch_result(*row)
+            if not rows:
+                self._stop.wait(POLL_SECONDS)
+
+    def apply_async(  # noqa: PLR0913
+        self,
+        func: Callable,
+        args: tuple,
+        kwds: dict,
+        callback: Callable[[Any], None],
+        error_callback: Callable[[BaseException], None],
+        *,
+        threaded: bool = False,
+    ) -> None:
+        """Queue a file for the workers or run another task locally."""
+        if not _is_queueable(func, args, kwds):
+            self._local.apply_async(
+                func, args, kwds, callback, error_callback, threaded=threaded
+            )
+            return
+        config, path_info = args[:2]
+        task = {
+            "config": self._fingerprint,
+            "task": _QUEUE_TASKS[func],
+            "path_info": _encode_path_info(path_info),
+        }
+        payload = json.dumps(task).encode()
+        with self._lock:
+            task_id = self._queue.put(payload)
+            self._callbacks[task_id] = (config, path_info, callback, error_callback)
+
+    def close(self) -> None:
+        """Tell the workers no more tasks are coming."""
+        self._stop.set()
+        self._local.close()
+
+    def join(self) -> None:
+        """Stop collecting results."""
+        self._collector.join()
+        self._queue.close()
+        self._local.join()
+
+
+def _heartbeat(path: Path | str, task_id: int, worker: str, done: Event) -> None:
+    """Renew a lease until the task is done."""
+    queue = WorkQueue(path)
+    while not done.wait(HEARTBEAT_SECONDS):
+        queue.renew(task_id, worker)
+
+
+def _load_task(fingerprint: str, payload: bytes) -> tuple[Callable, PathInfo]:
+    """Rebuild a task's function and path info."""
+    task = json.loads(payload)
+    if task["config"] != fingerprint:
+        msg = "Worker settings or programs differ from the coordinator's."
+        raise PicoptError(msg)
+    return _TASK_FUNCS[task["task"]], _decode_path_info(task["path_info"])
+
+
+def _run_task(config: AttrDict, fingerprint: str, payload: bytes) -> tuple[int, bytes]:
+    """Run a task with this worker's config and serialize its result."""
+    try:
+        func, path_info = _load_task(fingerprint, payload)
+        result = _encode_result(func(config, path_info))
+    except Exception as exc:
+        return ERROR, json.dumps({"error": str(exc)}).encode()
+    return DONE, json.dumps(result).encode()
+
+
+class _CoordinatorWatch:
+    """Notice a coordinator that stopped without closing the queue.
+
+    Compares heartbeats as they change instead of with this host's clock.
+    """
+
+    def __init__(self, queue: WorkQueue, timeout: float):
+        """Start watching."""
+        self._queue = queue
+        self._timeout = timeout
+        self._heartbeat = queue.get_heartbeat()
+        self._changed = monotonic()
+
+    def is_stale(self) -> bool:
+        """Whether the heartbeat hasn't changed for the timeout."""
+        heartbeat = self._queue.get_heartbeat()
+        if heartbeat != self._heartbeat:
+            self._heartbeat = heartbeat
+            self._changed = monotonic()
+        return monotonic() - self._changed > self._timeout
+
+
+def work(config: AttrDict, coordinator_timeout: float = COORDINATOR_TIMEOUT) -> int:
+    """Run leased tasks until the coordinator closes the queue or goes away."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    path = config.queue
+    fingerprint = get_config_fingerprint(config)
+    queue = WorkQueue(path)
+    coordinator = _CoordinatorWatch(queue, coordinator_timeout)
+    num_tasks = 0
+    while True:
+        task = queue.lease(worker)
+        if task is None:
+            if queue.is_closed():
+                return num_tasks
+            if coordinator.is_stale():
+                cprint(f"No coordinator heartbeat in {path}, stopping.", "yellow")
+                return num_tasks
+            sleep(POLL_SECONDS)
+            continue
+        task_id, payload = task
+        done = Event()
+        heartbeat = Thread(target=_heartbeat, args=(path, task_id, worker, done))
+        heartbeat.start()
+        try:
+            state, result = _run_task(config, fingerprint, payload)
+        finally:
+            done.set()
+            heartbeat.join()
+        queue.finish(task_id, worker, state, result)
+        num_tasks += 1
+
+
+class Worker:
+    """Run tasks from a coordinator's work queue on this host."""
+
+    def __init__(self, config: AttrDict):
+        """Initialize."""
+        if not config.queue:
+            msg = "--worker needs a --queue to take tasks from."
+            raise PicoptError(msg)
+        _check_trusted(Path(config.queue))
+        self._config = config
+        self._jobs = config.jobs or os.cpu_count() or 1
+
+    def run(self) -> int:
+        """Work until the coordinator finishes. Return the number of tasks run."""
+        set_config_priority(self._config)
+        thread_budget = ThreadBudget(self._jobs, self._config.computed.cpus)
+        # Every worker is always busy.
+        thread_budget.set_in_flight(self._jobs)
+        io_limiter = get_io_limiter(self._config)
+        set_io_limiter(io_limiter)
+        initargs = (thread_budget.initargs, io_limiter)
+        with Pool(self._jobs, init_pool_worker, initargs) as pool:
+            num_tasks = sum(pool.map(work, (self._config,) * self._jobs))
+        if self._config.verbose:
+            cprint(f"Worker ran {num_tasks} tasks.")
+            if io_limiter:
+                io_limiter.report()
+        return num_tasks
@@ -0,0 +1,228 @@
+"""Optimize identical loose files once."""
+
+import os
+import shutil
+from os import stat_result
+from pathlib import Path
+
+from confuse.templates import AttrDict
+
+from picopt.handlers.handler import Handler
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from picopt.walk.ledger import get_signature, hash_stream
+
+
+def _hash_unchanged(path: Path, signature: tuple[int, int, int]) -> str:
+    """Hash a file if it still has its original content, otherwise return ''."""
+    try:
+        with path.open("rb") as file:
+            if get_signature(os.fstat(file.fileno())) != signature:
+                return ""
+            content_hash = hash_stream(file)
+            # Rewritten in place while hashing.
+            if get_signature(os.fstat(file.fileno())) != signature:
+                return ""
+    except OSError:
+        return ""
+    return content_hash
+
+
+def hash_unchanged(
+    files: tuple[tuple[Path, tuple[int, int, int]], ...],
+) -> tuple[str, ...]:
+    """Hash files in a worker. Files rewritten since they were walked get ''."""
+    return tuple(_hash_unchanged(path, signature) for path, signature in files)
+
+
+class Original:
+    """The first file seen with some content and its result once finished."""
+
+    __slots__ = (
+        "content_hash",
+        "finished",
+        "group_key",
+        "hash_waiting",
+        "is_hashing",
+        "path",
+        "result",
+        "signature",
+        "waiting",
+    )
+
+    def __init__(
+        self,
+        path: Path,
+        signature: tuple[int, int, int],
+        content_hash: str | None,
+        group_key: tuple[int, str],
+    ):
+        """Initialize."""
+        self.path = path
+        self.signature = signature
+        self.group_key = group_key
+        # Hashed only when another file has the same size.
+        self.content_hash = content_hash
+        self.is_hashing = False
+        # Hashed files to match once this one's hash is known.
+        self.hash_waiting: list[tuple] = []
+        self.finished = False
+        # None if picopt doesn't handle the file.
+        self.result: ReportStats | None = None
+        # Duplicates found while the original runs.
+        self.waiting: list[tuple] = []
+
+
+class Duplicates:
+    """Group unfinished loose files by size and suffix, then by content hash.
+
+    The first unfinished file of a size and suffix isn't read. Later files
+    with the same size and suffix are hashed in the workers, along with the
+    first file if it isn't hashed yet, and matched when the hashes come
+    back. Originals are forgotten once finished, so memory follows the
+    files in flight and a copy found later is optimized on its own. An
+    original that was rewritten before it could be hashed can't be matched.
+    """
+
+    def __init__(self):
+        """Initialize."""
+        # Originals by content hash. The first of a size is keyed by None
+        # until another file of that size needs comparing to it.
+        self._originals: dict[tuple[int, str], dict[str | None, Original]] = {}
+
+    @staticmethod
+    def get_group_key(path_info: PathInfo) -> tuple[int, str] | None:
+        """Get the size and suffix of a loose file. None if it can't be grouped."""
+        path = path_info.path
+        stat = path_info.stat()
+        if not path or not isinstance(stat, stat_result):
+            return None
+        return (stat.st_size, path.suffix)
+
+    def add_first(
+        self, path_info: PathInfo, group_key: tuple[int, str]
+    ) -> Original | None:
+        """Add the first unfinished file of a size. None if there is one already."""
+        if self._originals.get(group_key):
+            return None
+        path: Path = path_info.path  # type: ignore
+        stat: stat_result = path_info.stat()  # type: ignore
+        original = Original(path, get_signature(stat), None, group_key)
+        self._originals[group_key] = {None: original}
+        return original
+
+    def get_unhashed(self, group_key: tuple[int, str]) -> Original | None:
+        """Get the size's first file to hash unless it's being hashed."""
+        original = self._originals.get(group_key, {}).get(None)
+        if not original or original.is_hashing:
+            return None
+        original.is_hashing = True
+        return original
+
+    def get_hashing(self, group_key: tuple[int, str]) -> Original | None:
+        """Get the size's first file if its hash hasn't come back yet."""
+        original = self._originals.get(group_key, {}).get(None)
+        return original if original and original.is_hashing else None
+
+    def set_hash(self, original: Original, content_hash: str) -> list[tuple]:
+        """Key the first file of a size by its hash. Return the files waiting on it."""
+        originals = self._originals.get(original.group_key)
+        if originals and originals.get(None) is original:
+            del originals[None]
+            if content_hash:
+                original.content_hash = content_hash
+                originals.setdefault(content_hash, original)
+            if not originals:
+                del self._originals[original.group_key]
+        original.is_hashing = False
+        waiting, original.hash_waiting = original.hash_waiting, []
+        return waiting
+
+    def match(
+        self, path_info: PathInfo, group_key: tuple[int, str], content_hash: str
+    ) -> tuple[Original, bool]:
+        """Return the hashed file's original and whether it's a duplicate of it."""
+        path: Path = path_info.path  # type: ignore
+        originals = self._originals.setdefault(group_key, {})
+        original = originals.get(content_hash)
+        if original and original.path != path:
+            return original, True
+        stat: stat_result = path_info.stat()  # type: ignore
+        original = Original(path, get_signature(stat), content_hash, group_key)
+        originals[content_hash] = original
+        return original, False
+
+    def finish(self, original: Original) -> None:
+        """Forget a finished original."""
+        originals = self._originals.get(original.group_key)
+        if not originals or originals.get(original.content_hash) is not original:
+            return
+        del originals[original.content_hash]
+        if not originals:
+            del self._originals[original.group_key]
+
+
+def _is_same_path(path: Path, other: Path, *, is_case_sensitive: bool) -> bool:
+    """Compare paths the way the filesystem does."""
+    if is_case_sensitive:
+        return path == other
+    return str(path).lower() == str(other).lower()
+
+
+def _write_duplicate(
+    config: AttrDict, path_info: PathInfo, source: Path, final_path: Path
+) -> None:
+    """Copy or hardlink the original's output over the duplicate."""
+    path: Path = path_info.path  # type: ignore
+    working_path = path.with_suffix(
+        f"{path.suffix}.{Handler.WORKING_SUFFIX}.dupe{final_path.suffix}"
+    )
+    working_path.unlink(missing_ok=True)
+    if config.hardlink_duplicates:
+        os.link(source, working_path)
+    else:
+        shutil.copyfile(source, working_path)
+    working_path.replace(final_path)
+    if not _is_same_path(
+        final_path, path, is_case_sensitive=path_info.is_case_sensitive
+    ):
+        path.unlink(missing_ok=True)
+    # A hardlink shares the original's metadata.
+    stat = path_info.stat()
+    if (
+        config.preserve
+        and not config.hardlink_duplicates
+        and isinstance(stat, stat_result)
+    ):
+        os.chown(final_path, stat.st_uid, stat.st_gid)
+        final_path.chmod(stat.st_mode)
+        os.utime(final_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def copy_result(
+    config: AttrDict, path_info: PathInfo, result: ReportStats
+) -> ReportStats:
+    """Give a duplicate its original's optimized output."""
+    path: Path = path_info.path  # type: ignore
+    try:
+        final_path = path.with_suffix(result.path.suffix) if result.path else path
+        bytes_in = path_info.bytes_in()
+        if (
+            not config.test
+            and result.path
+            and result.bytes_out > 0
+            and (result.bytes_out < result.bytes_in or config.bigger)
+        ):
+            _write_duplicate(config, path_info, result.path, final_path)
+        report = ReportStats(
+            final_path,
+            path_info=path_info,
+            config=config,
+            bytes_in=bytes_in,
+            bytes_out=result.bytes_out,
+        )
+    except Exception as exc:
+        report = ReportStats(path, exc=exc, config=config, path_info=path_info)
+    if config.verbose:
+        report.report()
+    return report
@@ -0,0 +1,135 @@
+"""Run tasks in a process pool, a thread pool or both."""
+
+import signal
+import sys
+from collections.abc import Callable
+from contextlib import nullcontext
+from multiprocessing import BoundedSemaphore
+from multiprocessing.pool import Pool, ThreadPool
+from multiprocessing.synchronize import BoundedSemaphore as BoundedSemaphoreType
+from typing import Any, Protocol
+
+# Limits running tasks across both pools of the hybrid backend.
+_slots: BoundedSemaphoreType | None = None
+
+
+def _init_worker(
+    slots: BoundedSemaphoreType | None,
+    initializer: Callable | None,
+    initargs: tuple,
+) -> None:
+    """Initialize a pool worker."""
+    global _slots  # noqa: PLW0603
+    _slots = slots
+    if initializer:
+        initializer(*initargs)
+
+
+def _init_process_worker(
+    slots: BoundedSemaphoreType | None,
+    initializer: Callable | None,
+    initargs: tuple,
+) -> None:
+    """Initialize a worker process. The main process handles interrupts."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(slots, initializer, initargs)
+
+
+def _run(func: Callable, args: tuple, kwds: dict) -> Any:
+    """Run a task once a slot is free."""
+    with _slots or nullcontext():
+        return func(*args, **kwds)
+
+
+def _is_gil_enabled() -> bool:
+    """Whether this python has a GIL."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled else True
+
+
+class TaskExecutor(Protocol):
+    """Runs the scheduler's tasks somewhere and calls back with the results."""
+
+    def apply_async(  # noqa: PLR0913
+        self,
+        func: Callable,
+        args: tuple,
+        kwds: dict,
+        callback: Callable[[Any], None],
+        error_callback: Callable[[BaseException], None],
+        *,
+        threaded: bool = False,
+    ) -> None:
+        """Run a task."""
+
+    def close(self) -> None:
+        """Stop accepting tasks."""
+
+    def join(self) -> None:
+        """Wait for the tasks to finish."""
+
+
+class Executor:
+    """Run tasks in a process pool, a thread pool or both.
+
+    Threaded tasks skip pickling and IPC. The hybrid backend runs tasks that
+    spend their time outside the GIL in threads and the rest in processes. The
+    auto backend uses threads on free threaded python builds.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        jobs: int,
+        initializer: Callable | None = None,
+        initargs: tuple = (),
+    ):
+        """Start the pools."""
+        if backend == "auto":
+            backend = "process" if _is_gil_enabled() else "thread"
+        self.backend = backend
+        slots = BoundedSemaphore(jobs) if backend == "hybrid" else None
+        pool_initargs = (slots, initializer, initargs)
+        self._process_pool: Pool | None = (
+            Pool(jobs, _init_process_worker, pool_initargs)
+            if backend in ("process", "hybrid")
+            else None
+        )
+        self._thread_pool: ThreadPool | None = (
+            ThreadPool(jobs, _init_worker, pool_initargs)
+            if backend in ("thread", "hybrid")
+            else None
+        )
+
+    def apply_async(  # noqa: PLR0913
+        self,
+        func: Callable,
+        args: tuple,
+        kwds: dict,
+        callback: Callable[[Any], None],
+        error_callback: Callable[[BaseException], None],
+        *,
+        threaded: bool = False,
+    ) -> None:
+        """Send a task to the thread pool if threaded and there is one."""
+        pool = self._process_pool or self._thread_pool
+        if threaded and self._thread_pool:
+            pool = self._thread_pool
+        pool.apply_async(  # type: ignore
+            _run,
+            (func, args, kwds),
+            callback=callback,
+            error_callback=error_callback,
+        )
+
+    def close(self) -> None:
+        """Stop accepting tasks."""
+        for pool in (self._process_pool, self._thread_pool):
+            if pool:
+                pool.close()
+
+    def join(self) -> None:
+        """Wait for the workers to exit."""
+        for pool in (self._process_pool, self._thread_pool):
+            if pool:
+                pool.join()
@@ -0,0 +1,128 @@
+"""Append only journal of finished files so an interrupted run can resume."""
+
+import json
+import os
+from pathlib import Path
+from time import monotonic, time
+from typing import TextIO
+
+from confuse.templates import AttrDict
+from termcolor import cprint
+
+from picopt import PROGRAM_NAME
+from picopt.config import TIMESTAMPS_CONFIG_KEYS
+from picopt.path import PathInfo
+
+JOURNAL_NAME = f".{PROGRAM_NAME}_journal"
+
+
+class RunJournal:
+    """Record files as they finish and replay them on the next run.
+
+    Entries are flushed and synced in batches. A torn last line from a crash is
+    ignored. A journal written with different optimization settings is
+    discarded.
+    """
+
+    BATCH_SIZE = 64
+    BATCH_SECONDS = 5.0
+
+    @staticmethod
+    def _get_config_key(config: AttrDict) -> str:
+        """Serialize the settings that change optimization results."""
+        settings = {key: config[key] for key in sorted(TIMESTAMPS_CONFIG_KEYS)}
+        return json.dumps(settings, default=str)
+
+    def __init__(self, config: AttrDict, dir_path: Path):
+        """Load the journal from an interrupted run."""
+        self._config = config
+        self.path = dir_path / JOURNAL_NAME
+        self._config_key = self._get_config_key(config)
+        # path: (finished time, bytes in, bytes out)
+        self.entries: dict[str, tuple[float, int, int]] = {}
+        self._buffer: list[str] = []
+        self._last_flush = monotonic()
+        self._file: TextIO | None = None
+        self._is_torn = False
+        self._is_valid = self._load()
+
+    def _load(self) -> bool:
+        """Read entries. Return if the journal exists and matches the config."""
+        if not self.path.exists():
+            return False
+        with self.path.open() as journal:
+            try:
+                header = json.loads(journal.readline())
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or (
+                header.get("config") != self._config_key
+            ):
+                if self._config.verbose > 1:
+                    cprint(f"Discarding journal with old settings: {self.path}")
+                return False
+            line = "\n"
+            for line in journal:
+                try:
+                    path, finished, bytes_in, bytes_out = json.loads(line)
+                except (ValueError, TypeError):
+                    # Torn write
+                    continue
+                self.entries[path] = (finished, bytes_in, bytes_out)
+            self._is_torn = not line.endswith("\n")
+        return True
+
+    def _open(self) -> TextIO:
+        """Open for appending, starting a new journal if needed."""
+        if self._file is None:
+            if self._is_valid:
+                self._file = self.path.open("a")
+                if self._is_torn:
+                    self._file.write("\n")
+            else:
+                self._file = self.path.open("w")
+                header = json.dumps({"config": self._config_key})
+                self._file.write(header + "\n")
+                self._is_valid = True
+        return self._file
+
+    def is_finished(self, path_info: PathInfo) -> bool:
+        """Whether the file finished in the interrupted run and hasn't changed."""
+        entry = self.entries.get(str(path_info.path))
+        return bool(entry and path_info.mtime() <= entry[0])
+
+    def record(self, path: Path, bytes_in: int, bytes_out: int) -> None:
+        """Record a finished file."""
+        finished = time()
+        path_str = str(path)
+        self.entries[path_str] = (finished, bytes_in, bytes_out)
+        self._buffer.append(json.dumps([path_str, finished, bytes_in, bytes_out]))
+        if (
+            len(self._buffer) >= self.BATCH_SIZE
+            or monotonic() - self._last_flush >= self.BATCH_SECONDS
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write and sync buffered entries."""
+        self._last_flush = monotonic()
+        if not self._buffer:
+            return
+        journal = self._open()
+        journal.write("\n".join(self._buffer) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+        self._buffer = []
+
+    def close(self) -> None:
+        """Flush and close, keeping the journal to resume from."""
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        """Delete the journal after a complete run."""
+        self._buffer = []
+        self.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,202 @@
+"""Remember the content hashes of files that need no more optimizing."""
+
+import hashlib
+import json
+import sqlite3
+from os import stat_result
+from pathlib import Path
+from typing import BinaryIO
+
+from confuse.templates import AttrDict
+
+from picopt.config import TIMESTAMPS_CONFIG_KEYS
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    hash TEXT NOT NULL,
+    config TEXT NOT NULL,
+    output_hash TEXT,
+    PRIMARY KEY (hash, config)
+);
+"""
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_stream(file: BinaryIO) -> str:
+    """Hash the rest of a file object."""
+    digest = hashlib.blake2b(digest_size=20)
+    while chunk := file.read(_HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    """Hash a file's contents."""
+    with path.open("rb") as file:
+        return hash_stream(file)
+
+
+def try_hash_file(path: Path) -> str | None:
+    """Hash a file's contents in a worker. None if it can't be read."""
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+
+
+def get_signature(stat: stat_result) -> tuple[int, int, int]:
+    """Size, mtime and inode. Changes when a file's content is replaced."""
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class Ledger:
+    """Outcomes of optimizing content, keyed by hash, config and tools.
+
+    A hash is done if optimizing it gained nothing or if it is the output of an
+    optimization. The hash of a path is reused while its size, mtime and inode
+    are unchanged. The ledger never reads files. The walk hashes new and
+    optimized files in the workers and adds the hashes.
+    """
+
+    COMMIT_EVERY = 256
+
+    @staticmethod
+    def _get_config_key(config: AttrDict) -> str:
+        """Serialize the settings and programs that change results."""
+        settings = {key: config[key] for key in sorted(TIMESTAMPS_CONFIG_KEYS)}
+        settings["programs"] = {
+            handler_class.__name__: stages
+            for handler_class, stages in config.computed.handler_stages.items()
+        }
+        return json.dumps(settings, sort_keys=True, default=str)
+
+    def __init__(self, config: AttrDict, path: Path | str):
+        """Open the ledger."""
+        self._config_key = self._get_config_key(config)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._uncommitted = 0
+        # Hashes of files in flight
+        self._hashes: dict[Path, str] = {}
+        # Input hashes of outputs being hashed
+        self._outputs: dict[Path, str] = {}
+
+    def _get_hash(self, path: Path, stat: stat_result) -> str | None:
+        """Get the hash from a record that matches the file."""
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?",
+            (str(path),),
+        ).fetchone()
+        if row and tuple(row[:3]) == get_signature(stat):
+            return row[3]
+        return None
+
+    def _set_hash(self, path: Path, stat: stat_result, content_hash: str) -> None:
+        """Record a path's hash."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (str(path), *get_signature(stat), content_hash),
+        )
+        self._maybe_commit()
+
+    def _maybe_commit(self) -> None:
+        """Commit in batches."""
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self.commit()
+
+    def _is_done_hash(self, path: Path, content_hash: str) -> bool:
+        """Whether the content is done. Remember its hash if not.
+
+        Content is done if it gained nothing or is itself an output. Content
+        that was optimized into something else still needs optimizing here.
+        """
+        row = self._conn.execute(
+            "SELECT 1 FROM outcomes WHERE hash = ? AND config = ? "
+            "AND (output_hash IS NULL OR output_hash = hash)",
+            (content_hash, self._config_key),
+        ).fetchone()
+        if row:
+            return True
+        self._hashes[path] = content_hash
+        return False
+
+    def is_done(self, path_info: PathInfo) -> bool:
+        """Whether the file's recorded content needs no more optimizing."""
+        path = path_info.path
+        stat = path_info.stat()
+        if not path or not isinstance(stat, stat_result):
+            return False
+        content_hash = self._get_hash(path, stat)
+        return bool(content_hash and self._is_done_hash(path, content_hash))
+
+    def is_hashed(self, path: Path | None) -> bool:
+        """Whether a file that isn't done has a known hash."""
+        return path in self._hashes
+
+    def add_hash(self, path_info: PathInfo, content_hash: str) -> bool:
+        """Record a file's hash from a worker. Return if it's done."""
+        path = path_info.path
+        stat = path_info.stat()
+        if not path or not isinstance(stat, stat_result):
+            return False
+        self._set_hash(path, stat, content_hash)
+        return self._is_done_hash(path, content_hash)
+
+    def _set_outcome(self, content_hash: str, output_hash: str | None) -> None:
+        """Record an outcome."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?)",
+            (content_hash, self._config_key, output_hash),
+        )
+        self._maybe_commit()
+
+    def record(self, path: Path | None, report: ReportStats) -> Path | None:
+        """Record the outcome of optimizing a file.
+
+        Return the output path to hash if the file was rewritten.
+        """
+        if path is None:
+            return None
+        content_hash = self._hashes.pop(path, None)
+        if content_hash is None or report.exc or report.test:
+            return None
+        if report.saved <= 0 and not report.bigger:
+            self._set_outcome(content_hash, None)
+            return None
+        if not report.path:
+            return None
+        self._outputs[report.path] = content_hash
+        return report.path
+
+    def record_output(self, output_path: Path, output_hash: str | None) -> None:
+        """Record the hash of an optimized file."""
+        content_hash = self._outputs.pop(output_path, None)
+        if content_hash is None or not isinstance(output_hash, str):
+            return
+        try:
+            stat = output_path.stat()
+        except OSError:
+            return
+        self._set_hash(output_path, stat, output_hash)
+        self._set_outcome(content_hash, output_hash)
+        self._set_outcome(output_hash, output_hash)
+
+    def commit(self) -> None:
+        """Commit pending records."""
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        """Commit and close."""
+        self.commit()
+        self._conn.close()
@@ -0,0 +1,53 @@
+"""Iterate directories with scandir, reusing its type and stat data."""
+
+import os
+from collections.abc import Generator
+from contextlib import suppress
+from pathlib import Path
+
+from picopt.path import PathInfo
+
+# Entries sorted and yielded at a time so huge directories start work early.
+SCANDIR_CHUNK_SIZE = 1024
+
+
+def _entry_sort_key(entry: os.DirEntry) -> str:
+    """Sort entries by name."""
+    return entry.name
+
+
+def _to_path_info(parent: PathInfo, entry: os.DirEntry) -> PathInfo:
+    """Create a PathInfo primed with the DirEntry's cached metadata."""
+    is_dir = entry.is_dir()
+    stat = None
+    if not is_dir:
+        # Vanished or a dangling symlink. Reported later by the skip checks.
+        with suppress(FileNotFoundError):
+            stat = entry.stat()
+    return PathInfo(
+        parent.top_path,
+        parent.container_mtime,
+        parent.convert,
+        parent.is_case_sensitive,
+        path=Path(entry.path),
+        stat=stat,
+        is_dir=is_dir,
+        is_symlink=entry.is_symlink(),
+    )
+
+
+def scandir_chunks(
+    dir_path_info: PathInfo, chunk_size: int = SCANDIR_CHUNK_SIZE
+) -> Generator[tuple[PathInfo, ...], None, None]:
+    """Yield sorted chunks of a directory's entries as PathInfos."""
+    chunk: list[os.DirEntry] = []
+    with os.scandir(dir_path_info.path) as entries:
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                chunk.sort(key=_entry_sort_key)
+                yield tuple(_to_path_info(dir_path_info, entry) for entry in chunk)
+                chunk = []
+    if chunk:
+        chunk.sort(key=_entry_sort_key)
+        yield tuple(_to_path_info(dir_path_info, entry) for entry in chunk)
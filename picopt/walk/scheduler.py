@@ -0,0 +1,386 @@
+"""Stream tasks through the pool without waiting on each directory."""
+
+import heapq
+from collections import deque
+from collections.abc import Callable
+from functools import partial
+from itertools import count
+from pathlib import Path
+from queue import SimpleQueue
+from time import monotonic
+from types import MappingProxyType
+from typing import Any
+
+from picopt.path import PathInfo
+from picopt.stats import QueueStats, ReportStats
+from picopt.thread_budget import ThreadBudget
+from picopt.walk.controller import ConcurrencyController
+from picopt.walk.executor import TaskExecutor
+
+
+def _largest_first_key(path_info: PathInfo) -> float:
+    """Longest processing time first. Keeps big files out of the tail."""
+    return -path_info.bytes_in()
+
+
+def _newest_first_key(path_info: PathInfo) -> float:
+    """Most recently modified first."""
+    return -path_info.mtime()
+
+
+# The "path" order has no key and submits in walk order.
+ORDER_KEYS: MappingProxyType[str, Callable[[PathInfo], float]] = MappingProxyType(
+    {"largest": _largest_first_key, "newest": _newest_first_key}
+)
+# The result of a task dropped before it was sent.
+_DROPPED = object()
+
+
+class TaskGroup:
+    """Count the outstanding tasks of a directory or container."""
+
+    def __init__(
+        self,
+        parent: "TaskGroup | None" = None,
+        on_done: Callable[[], None] | None = None,
+    ):
+        """Register with the parent group."""
+        self._parent = parent
+        self.on_done = on_done
+        self._pending: int = 0
+        self._closed: bool = False
+        if self._parent:
+            self._parent.add()
+
+    def add(self) -> None:
+        """Add an outstanding task."""
+        self._pending += 1
+
+    def _finish(self) -> None:
+        """Run the done callback once closed and empty."""
+        if not self._closed or self._pending:
+            return
+        # on_done first so anything it submits to the parent keeps it open.
+        if self.on_done:
+            self.on_done()
+        if self._parent:
+            self._parent.done()
+
+    def done(self) -> None:
+        """Remove a finished task."""
+        self._pending -= 1
+        self._finish()
+
+    def close(self) -> None:
+        """No more tasks will be added by the walker."""
+        self._closed = True
+        self._finish()
+
+
+class _Task:
+    """A submitted task's bookkeeping in the main process."""
+
+    __slots__ = (
+        "args",
+        "callback",
+        "func",
+        "group",
+        "kwds",
+        "memory",
+        "path_info",
+        "size",
+        "threaded",
+    )
+
+    def __init__(  # noqa: PLR0913
+        self,
+        group: TaskGroup,
+        callback: Callable[[Any], None],
+        path_info: PathInfo,
+        func: Callable,
+        args: tuple,
+        kwds: dict,
+        size: int,
+        memory: int,
+        threaded: bool,
+    ):
+        """Store bookkeeping."""
+        self.group = group
+        self.callback = callback
+        self.path_info = path_info
+        self.func = func
+        self.args = args
+        self.kwds = kwds
+        self.size = size
+        self.memory = memory
+        self.threaded = threaded
+
+    def error_report(self, exc: Exception) -> ReportStats:
+        """Create an error report for this task."""
+        path = self.path_info.path or Path(self.path_info.name())
+        return ReportStats(path, exc=exc, path_info=self.path_info)
+
+
+class Scheduler:
+    """Keep a bounded number of tasks in flight and finish them as they complete.
+
+    Tasks wait in an ordering window before they go to the pool so large or
+    new files can be sent first. The bytes of tasks in flight are kept under a
+    budget so queued data can't exhaust memory. A task larger than the budget
+    runs alone. The estimated memory to decode the images in flight is kept
+    under a ceiling too. Images too big for the ceiling go through a lane of
+    their own one at a time while smaller ones carry on beside them. With a
+    controller the tasks in flight follow its slots instead of a fixed limit.
+
+    Callbacks only run from the outermost submit, poll or join. Tasks
+    submitted by a callback queue behind it instead of running callbacks
+    inside it, so deep trees and many containers can't grow the stack.
+
+    Once stopped only the tasks in flight finish. Waiting and new tasks are
+    dropped without running their callbacks.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        executor: TaskExecutor,
+        max_in_flight: int,
+        order: str | None = None,
+        order_window: int = 0,
+        max_bytes: int = 0,
+        thread_budget: ThreadBudget | None = None,
+        max_memory: int = 0,
+        controller: ConcurrencyController | None = None,
+    ):
+        """Initialize."""
+        self._executor = executor
+        self._thread_budget = thread_budget
+        self._controller = controller
+        if controller:
+            max_in_flight = controller.slots
+        self._max_in_flight = max(1, max_in_flight)
+        self._max_bytes = max_bytes
+        self._max_memory = max_memory
+        self._in_flight: int = 0
+        self._in_flight_bytes: int = 0
+        self._in_flight_memory: int = 0
+        self._is_oversized_in_flight: bool = False
+        self.stats = QueueStats()
+        self._finished: SimpleQueue[tuple[_Task, Any]] = SimpleQueue()
+        self._done: deque[tuple[_Task, Any]] = deque()
+        self._is_running_callbacks: bool = False
+        self._order_key = ORDER_KEYS.get(order) if order else None
+        self._order_window = order_window if self._order_key else 0
+        self._waiting: list[tuple[float, int, _Task]] = []
+        self._seq = count()
+        self._stopping: bool = False
+
+    def _put_result(self, task: _Task, result: Any) -> None:
+        """Queue a result. Called from the pool's result thread."""
+        self._finished.put((task, result))
+
+    def _put_error(self, task: _Task, exc: BaseException) -> None:
+        """Queue an error report. Called from the pool's result thread."""
+        if not isinstance(exc, Exception):
+            exc = Exception(str(exc))
+        self._finished.put((task, task.error_report(exc)))
+
+    def _collect(self) -> None:
+        """Wait for the next task to complete and queue its callback."""
+        task, result = self._finished.get()
+        self._in_flight -= 1
+        self._in_flight_bytes -= task.size
+        if self._is_oversized(task):
+            self._is_oversized_in_flight = False
+        else:
+            self._in_flight_memory -= task.memory
+        if self._thread_budget:
+            self._thread_budget.set_in_flight(self._in_flight)
+        if self._controller:
+            self._max_in_flight = self._controller.update(task.size)
+        self._done.append((task, result))
+
+    def _run_callbacks(self) -> None:
+        """Run the callbacks of finished tasks unless already running them."""
+        if self._is_running_callbacks:
+            return
+        self._is_running_callbacks = True
+        try:
+            while self._done:
+                task, result = self._done.popleft()
+                try:
+                    if result is not _DROPPED:
+                        task.callback(result)
+                finally:
+                    task.group.done()
+        finally:
+            self._is_running_callbacks = False
+
+    def _apply(self, task: _Task) -> None:
+        """Send a task to the pool."""
+        try:
+            self._executor.apply_async(
+                task.func,
+                task.args,
+                task.kwds,
+                callback=partial(self._put_result, task),
+                error_callback=partial(self._put_error, task),
+                threaded=task.threaded,
+            )
+        except Exception as exc:
+            self._done.append((task, task.error_report(exc)))
+            return
+        self._in_flight += 1
+        self._in_flight_bytes += task.size
+        stats = self.stats
+        if self._is_oversized(task):
+            self._is_oversized_in_flight = True
+            stats.oversized += 1
+        else:
+            self._in_flight_memory += task.memory
+        if self._thread_budget:
+            self._thread_budget.set_in_flight(self._in_flight)
+        stats.tasks += 1
+        stats.peak_depth = max(stats.peak_depth, self._in_flight)
+        stats.peak_bytes = max(stats.peak_bytes, self._in_flight_bytes)
+        stats.peak_memory = max(stats.peak_memory, self._in_flight_memory)
+
+    def _is_over_bytes(self, task: _Task) -> bool:
+        """Would sending this task go over the byte budget."""
+        return bool(
+            self._max_bytes
+            and self._in_flight
+            and self._in_flight_bytes + task.size > self._max_bytes
+        )
+
+    def _is_oversized(self, task: _Task) -> bool:
+        """Is the task's image too big to share the decode memory ceiling."""
+        return bool(self._max_memory and task.memory > self._max_memory)
+
+    def _is_over_memory(self, task: _Task) -> bool:
+        """Would sending this task go over the decode memory ceiling."""
+        if self._is_oversized(task):
+            return self._is_oversized_in_flight
+        return bool(
+            self._max_memory and self._in_flight_memory + task.memory > self._max_memory
+        )
+
+    def _wait(self, *, over_bytes: bool = False, over_memory: bool = False) -> None:
+        """Collect a finished task while blocked from submitting."""
+        start = monotonic()
+        self._collect()
+        elapsed = monotonic() - start
+        self.stats.blocked_seconds += elapsed
+        if over_bytes:
+            self.stats.byte_blocks += 1
+            self.stats.byte_blocked_seconds += elapsed
+        elif over_memory:
+            self.stats.memory_blocks += 1
+            self.stats.memory_blocked_seconds += elapsed
+
+    def _drop_waiting(self) -> None:
+        """Drop the tasks not yet sent to the pool."""
+        waiting, self._waiting = self._waiting, []
+        self._done.extend((task, _DROPPED) for _, _, task in waiting)
+
+    def _dispatch(self, window: int) -> None:
+        """Send waiting tasks to the pool until only the window remains."""
+        while len(self._waiting) > window:
+            task = self._waiting[0][2]
+            if self._stopping:
+                self._drop_waiting()
+            elif self._in_flight >= self._max_in_flight:
+                self._wait()
+            elif self._is_over_bytes(task):
+                self._wait(over_bytes=True)
+            elif self._is_over_memory(task):
+                self._wait(over_memory=True)
+            else:
+                heapq.heappop(self._waiting)
+                self._apply(task)
+
+    def _order(self, path_info: PathInfo) -> float:
+        """Get the order key for a task."""
+        if not self._order_key:
+            return 0.0
+        try:
+            return self._order_key(path_info)
+        except Exception:
+            return 0.0
+
+    @staticmethod
+    def _size(path_info: PathInfo) -> int:
+        """Estimate the bytes a task holds while in flight."""
+        try:
+            return path_info.bytes_in()
+        except Exception:
+            return 0
+
+    def submit(  # noqa: PLR0913
+        self,
+        group: TaskGroup,
+        callback: Callable[[Any], None],
+        path_info: PathInfo,
+        func: Callable,
+        args: tuple = (),
+        kwds: dict | None = None,
+        size: int | None = None,
+        *,
+        memory: int = 0,
+        threaded: bool = False,
+    ) -> None:
+        """Submit a task, finishing others first if there are too many."""
+        if self._stopping:
+            return
+        group.add()
+        if size is None:
+            size = self._size(path_info)
+        task = _Task(
+            group,
+            callback,
+            path_info,
+            func,
+            args,
+            kwds if kwds else {},
+            size,
+            memory,
+            threaded,
+        )
+        entry = (self._order(path_info), next(self._seq), task)
+        heapq.heappush(self._waiting, entry)
+        self._dispatch(self._order_window)
+        self._run_callbacks()
+
+    def poll(self) -> None:
+        """Finish completed tasks and send waiting ones without blocking."""
+        while not self._finished.empty():
+            self._collect()
+        if self._stopping:
+            self._drop_waiting()
+        while self._waiting:
+            task = self._waiting[0][2]
+            if (
+                self._in_flight >= self._max_in_flight
+                or self._is_over_bytes(task)
+                or self._is_over_memory(task)
+            ):
+                break
+            heapq.heappop(self._waiting)
+            self._apply(task)
+        self._run_callbacks()
+
+    def step(self) -> bool:
+        """Send waiting tasks and finish one. Return if any are outstanding."""
+        self._dispatch(0)
+        if self._in_flight and not self._done:
+            self._collect()
+        self._run_callbacks()
+        return bool(self._waiting or self._in_flight)
+
+    def stop(self) -> None:
+        """Finish only the tasks in flight. Safe to call from a signal handler."""
+        self._stopping = True
+
+    def join(self) -> None:
+        """Finish all outstanding tasks."""
+        while self.step():
+            pass
@@ -0,0 +1,241 @@
+"""Timestamps in an indexed SQLite table for very large trees."""
+
+import json
+import sqlite3
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from time import monotonic, time
+
+from confuse.templates import AttrDict
+from termcolor import cprint
+from treestamps import Treestamps
+
+from picopt import PROGRAM_NAME
+from picopt.config import TIMESTAMPS_CONFIG_KEYS
+
+DB_NAME = f".{PROGRAM_NAME}_timestamps.sqlite"
+DB_FILENAMES = frozenset({DB_NAME, f"{DB_NAME}-journal"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stamps (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (dir, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+_UPSERT = (
+    "INSERT INTO stamps VALUES (?, ?, ?) ON CONFLICT (dir, name) "
+    "DO UPDATE SET mtime = max(mtime, excluded.mtime)"
+)
+
+
+def _max_none(*values: float | None) -> float | None:
+    """None aware max()."""
+    return max((value for value in values if value is not None), default=None)
+
+
+class SQLiteTreestamps:
+    """Timestamps for one tree in an indexed SQLite table.
+
+    Paths are stored as their directory relative to the root and their name.
+    A directory's timestamp covers everything below it, so each directory's
+    inherited cutoff is computed once and its files' timestamps are read with
+    one indexed query. Writes are batched and committed periodically.
+    Compacting a directory only touches the rows below it.
+    """
+
+    BATCH_SIZE = 1000
+    COMMIT_SECONDS = 10.0
+    MAX_CACHED_DIRS = 1024
+
+    def __init__(self, config: AttrDict, top_path: Path):
+        """Open the database."""
+        self._config = config
+        self.root_dir = Treestamps.get_dir(top_path).absolute()
+        self._conn = sqlite3.connect(self.root_dir / DB_NAME)
+        self._conn.executescript(_SCHEMA)
+        self._pending: list[tuple[str, str, float]] = []
+        self._last_commit = monotonic()
+        # dir: (inherited cutoff, timestamps by name)
+        self._dirs: OrderedDict[str, tuple[float | None, dict[str, float]]] = (
+            OrderedDict()
+        )
+        # Old timestamp files removed after a successful dump.
+        self._consumed_paths: set[Path] = set()
+        self._check_config()
+
+    def _check_config(self) -> None:
+        """Discard timestamps recorded with different settings."""
+        settings = {key: self._config[key] for key in sorted(TIMESTAMPS_CONFIG_KEYS)}
+        config_str = json.dumps(settings, default=str)
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'config'"
+        ).fetchone()
+        if row and row[0] == config_str:
+            return
+        if row and self._config.timestamps_check_config:
+            if self._config.verbose:
+                cprint(f"Discarding timestamps with old settings in {self.root_dir}")
+            self._conn.execute("DELETE FROM stamps")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('config', ?)", (config_str,)
+        )
+        self._conn.commit()
+
+    def _split(self, path: Path | str) -> tuple[str, str] | None:
+        """Get a path's directory key and name. The root is ('', '')."""
+        abs_path = Path(path).absolute()
+        if abs_path == self.root_dir or self.root_dir.is_relative_to(abs_path):
+            return "", ""
+        if not abs_path.is_relative_to(self.root_dir):
+            return None
+        rel_path = abs_path.relative_to(self.root_dir)
+        dir_key = rel_path.parent.as_posix()
+        return ("" if dir_key == "." else dir_key), rel_path.name
+
+    @staticmethod
+    def _split_dir_key(dir_key: str) -> tuple[str, str]:
+        """Get a directory's parent key and name."""
+        parent_key, _, name = dir_key.rpartition("/")
+        return parent_key, name
+
+    def _flush(self) -> None:
+        """Write pending timestamps."""
+        if self._pending:
+            self._conn.executemany(_UPSERT, self._pending)
+            self._pending = []
+
+    def _commit(self) -> None:
+        """Write pending timestamps and commit."""
+        self._flush()
+        self._conn.commit()
+        self._last_commit = monotonic()
+
+    def _load_dir(self, dir_key: str) -> tuple[float | None, dict[str, float]]:
+        """Get a directory's inherited cutoff and its entries' timestamps."""
+        cached = self._dirs.get(dir_key)
+        if cached is not None:
+            self._dirs.move_to_end(dir_key)
+            return cached
+        self._flush()
+        stamps = dict(
+            self._conn.execute(
+                "SELECT name, mtime FROM stamps WHERE dir = ?", (dir_key,)
+            ).fetchall()
+        )
+        if dir_key:
+            parent_key, name = self._split_dir_key(dir_key)
+            parent_cutoff, parent_stamps = self._load_dir(parent_key)
+            cutoff = _max_none(parent_cutoff, parent_stamps.get(name))
+        else:
+            # The root's own timestamp is in its listing.
+            cutoff = stamps.get("")
+        entry = (cutoff, stamps)
+        self._dirs[dir_key] = entry
+        if len(self._dirs) > self.MAX_CACHED_DIRS:
+            self._dirs.popitem(last=False)
+        return entry
+
+    def get(self, path: Path | str) -> float | None:
+        """Get the newest timestamp for the path or a directory above it."""
+        key = self._split(path)
+        if key is None:
+            return None
+        dir_key, name = key
+        cutoff, stamps = self._load_dir(dir_key)
+        return _max_none(cutoff, stamps.get(name))
+
+    def _forget_dirs_below(self, dir_key: str) -> None:
+        """Drop cached directories whose cutoff a directory timestamp changed."""
+        prefix = dir_key + "/"
+        for cached_key in tuple(self._dirs):
+            if not dir_key or cached_key == dir_key or cached_key.startswith(prefix):
+                del self._dirs[cached_key]
+
+    def _compact_below(self, dir_key: str, mtime: float) -> None:
+        """Delete timestamps below a directory that its timestamp covers."""
+        self._flush()
+        if dir_key:
+            self._conn.execute(
+                "DELETE FROM stamps WHERE (dir = ? OR (dir >= ? AND dir < ?)) "
+                "AND mtime < ?",
+                # '0' sorts right after '/'.
+                (dir_key, dir_key + "/", dir_key + "0", mtime),
+            )
+        else:
+            self._conn.execute(
+                "DELETE FROM stamps WHERE NOT (dir = '' AND name = '') AND mtime < ?",
+                (mtime,),
+            )
+        if self._config.verbose > 1:
+            cprint(f"Compacted timestamps under: {self.root_dir / dir_key}: {mtime}")
+
+    def set(
+        self,
+        path: Path | str,
+        mtime: float | None = None,
+        compact: bool = False,
+    ) -> float | None:
+        """Record the timestamp."""
+        key = self._split(path)
+        if key is None:
+            return None
+        if mtime is None:
+            mtime = time()
+        dir_key, name = key
+        self._pending.append((dir_key, name, mtime))
+        cached = self._dirs.get(dir_key)
+        if cached is not None:
+            stamps = cached[1]
+            stamps[name] = _max_none(stamps.get(name), mtime)  # type: ignore
+        full_key = f"{dir_key}/{name}" if dir_key else name
+        if compact or full_key in self._dirs:
+            self._forget_dirs_below(full_key)
+        if compact:
+            self._compact_below(full_key, mtime)
+        if (
+            len(self._pending) >= self.BATCH_SIZE
+            or monotonic() - self._last_commit >= self.COMMIT_SECONDS
+        ):
+            self._commit()
+        return mtime
+
+    def commit(self) -> None:
+        """Commit pending timestamps and keep the database open."""
+        self._commit()
+
+    def dump(self) -> None:
+        """Commit, close and remove consumed old timestamp files."""
+        self._commit()
+        self._conn.close()
+        for path in self._consumed_paths:
+            path.unlink(missing_ok=True)
+        self._consumed_paths = set()
+
+
+class SQLiteGrovestamps(dict):
+    """A dict of SQLiteTreestamps keyed by top directory."""
+
+    def __init__(self, config: AttrDict, top_paths: Iterable[Path]):
+        """Open a database for each top directory."""
+        super().__init__()
+        self._config = config
+        for top_path in top_paths:
+            root_dir = Treestamps.get_dir(top_path)
+            if root_dir not in self:
+                self[root_dir] = SQLiteTreestamps(config, top_path)
+
+    def commit(self) -> None:
+        """Commit all the databases and keep them open."""
+        for timestamps in self.values():
+            timestamps.commit()
+
+    def dump(self) -> None:
+        """Commit all the databases."""
+        for top_path, timestamps in self.items():
+            if self._config.verbose:
+                cprint(f"Saving timestamps for {top_path}")
+            timestamps.dump()
@@ -0,0 +1,924 @@
+"""Walk the directory trees and files and call the optimizers."""
+
+import os
+import shutil
+import signal
+import traceback
+from collections import deque
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+
+from confuse.templates import AttrDict
+from termcolor import cprint
+from treestamps import Grovestamps, GrovestampsConfig, Treestamps
+
+from picopt import PROGRAM_NAME
+from picopt.config import TIMESTAMPS_CONFIG_KEYS
+from picopt.exceptions import PicoptError
+from picopt.handlers.container import ContainerHandler
+from picopt.handlers.decode_memory import estimate_decode_memory
+from picopt.handlers.factory import create_handler
+from picopt.handlers.handler import Handler
+from picopt.handlers.image import ImageHandler
+from picopt.handlers.output_cache import get_output_cache
+from picopt.io_limit import get_io_limiter, set_io_limiter
+from picopt.old_timestamps import OLD_TIMESTAMPS_NAME, OldTimestamps
+from picopt.path import PathInfo, is_path_ignored
+from picopt.priority import set_config_priority
+from picopt.stats import ReportStats, Totals
+from picopt.thread_budget import ThreadBudget
+from picopt.walk.controller import ConcurrencyController
+from picopt.walk.distributed import QueueExecutor
+from picopt.walk.duplicates import (
+    Duplicates,
+    Original,
+    copy_result,
+    hash_unchanged,
+)
+from picopt.walk.executor import Executor, TaskExecutor
+from picopt.walk.journal import JOURNAL_NAME, RunJournal
+from picopt.walk.ledger import Ledger, get_signature, try_hash_file
+from picopt.walk.scandir import scandir_chunks
+from picopt.walk.scheduler import Scheduler, TaskGroup
+from picopt.walk.sqlite_timestamps import DB_FILENAMES, SQLiteGrovestamps
+from picopt.walk.worker import init_pool_worker, optimize_contents, optimize_file
+
+
+class Walk:
+    """Walk object for storing state of a walk run."""
+
+    TIMESTAMPS_FILENAMES = frozenset(
+        {
+            *Treestamps.get_filenames(PROGRAM_NAME),
+            *DB_FILENAMES,
+            OLD_TIMESTAMPS_NAME,
+            JOURNAL_NAME,
+        }
+    )
+    LOWERCASE_TESTNAME = ".picopt_case_sensitive_test"
+    UPPERCASE_TESTNAME = LOWERCASE_TESTNAME.upper()
+    # Tasks queued in the pool per worker so workers never wait on the walk.
+    TASKS_PER_JOB = 4
+    # Candidates considered per worker when ordering tasks.
+    ORDER_WINDOW_PER_JOB = 16
+
+    ########
+    # Init #
+    ########
+    def _init_run_timestamps(self) -> None:
+        """Init timestamps."""
+        if self._config.timestamps_backend == "sqlite":
+            self._timestamps = SQLiteGrovestamps(self._config, self._top_paths)
+            for timestamps in self._timestamps.values():
+                OldTimestamps(self._config, timestamps).import_old_timestamps()
+            return
+        config = GrovestampsConfig(
+            paths=self._top_paths,
+            program_name=PROGRAM_NAME,
+            verbose=self._config.verbose,
+            symlinks=self._config.symlinks,
+            ignore=self._config.ignore,
+            check_config=self._config.timestamps_check_config,
+            program_config=self._config,
+            program_config_keys=TIMESTAMPS_CONFIG_KEYS,
+        )
+        self._timestamps = Grovestamps(config)
+        for timestamps in self._timestamps.values():
+            OldTimestamps(self._config, timestamps).import_old_timestamps()
+
+    def _init_run_journals(self) -> None:
+        """Replay journals from an interrupted run."""
+        for top_path in self._top_paths:
+            dirpath = Treestamps.get_dir(top_path)
+            journal = RunJournal(self._config, dirpath)
+            self._journals[dirpath] = journal
+            for path_str, (finished, bytes_in, bytes_out) in journal.entries.items():
+                self._totals.bytes_in += bytes_in
+                self._totals.bytes_out += bytes_out
+                if self._config.timestamps:
+                    self._timestamps[dirpath].set(path_str, finished)
+            if journal.entries and self._config.verbose:
+                cprint(
+                    f"Resuming: {len(journal.entries)} files in {dirpath} "
+                    "already finished.",
+                    "cyan",
+                )
+
+    def _init_run(self):
+        """Init Run."""
+        # Validate top_paths
+        if not self._top_paths:
+            msg = "No paths to optimize."
+            raise PicoptError(msg)
+        for path in self._top_paths:
+            if not path.exists():
+                msg = f"Path does not exist: {path}"
+                raise PicoptError(msg)
+
+        # Init timestamps
+        if self._config.timestamps:
+            self._init_run_timestamps()
+
+        if self._config.journal and not (self._config.test or self._config.list_only):
+            self._init_run_journals()
+
+        if self._config.ledger:
+            self._ledger = Ledger(self._config, self._config.ledger)
+
+    ############
+    # Checkers #
+    ############
+    def _is_skippable(self, path_info: PathInfo) -> bool:
+        """Handle things that are not optimizable files."""
+        reason = None
+        color = "white"
+        attrs: list = ["dark"]
+
+        # File types
+        if path_info.zipinfo and path_info.is_dir():
+            reason = f"Skip archive directory {path_info.full_name()}"
+        elif not self._config.symlinks and path_info.is_symlink():
+            reason = f"Skip symlink {path_info.full_name()}"
+        elif path_info.name() in self.TIMESTAMPS_FILENAMES:
+            legacy = "legacy " if path_info.name() == OLD_TIMESTAMPS_NAME else ""
+            reason = f"Skip {legacy}timestamp {path_info.full_name()}"
+        elif not path_info.zipinfo and path_info.path and not path_info.exists():
+            reason = f"WARNING: {path_info.full_name()} not found."
+            color = "yellow"
+            attrs = []
+        elif is_path_ignored(self._config, Path(path_info.name())):
+            reason = f"Skip ignored {path_info.full_name()}"
+
+        if reason and self._config.verbose > 1:
+            cprint(reason, color, attrs=attrs)
+
+        return bool(reason)
+
+    def _is_older_than_timestamp(
+        self,
+        path_info: PathInfo,
+    ) -> bool:
+        """Is the file older than the timestamp."""
+        if self._config.after is not None:
+            walk_after = self._config.after
+        elif path_info.path and self._config.timestamps:
+            timestamps = self._timestamps.get(path_info.top_path, {})
+            walk_after = timestamps.get(path_info.path)
+        else:
+            walk_after = None
+
+        if walk_after is None:
+            return False
+
+        mtime = path_info.mtime()
+        return bool(mtime <= walk_after)
+
+    def _is_journaled(self, path_info: PathInfo) -> bool:
+        """Did the file finish in an interrupted run."""
+        journal = self._journals.get(path_info.top_path)
+        return bool(journal and journal.entries and journal.is_finished(path_info))
+
+    def _is_in_ledger(self, path_info: PathInfo) -> bool:
+        """Was the file's content already optimized or found incompressible."""
+        return bool(
+            self._ledger
+            and not path_info.is_container_child()
+            and self._ledger.is_done(path_info)
+        )
+
+    def _clean_up_working_files(self, path: Path) -> None:
+        """Auto-clean old working temp files if encountered."""
+        try:
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            if self._config.verbose > 1:
+                cprint(f"Deleted {path}", "yellow")
+        except Exception as exc:
+            cprint(str(exc), "red")
+
+    ###########
+    # Walkers #
+    ###########
+    def _finish_result(
+        self,
+        top_path: Path,
+        container_mtime: float | None,
+        final_result: ReportStats | None,
+    ) -> None:
+        """Total a finished result."""
+        if final_result is None:
+            # Not an image or container picopt handles.
+            return
+        if final_result.exc:
+            final_result.report()
+
+            self._totals.errors.append(final_result)
+        else:
+            self._totals.bytes_in += final_result.bytes_in
+            if final_result.saved > 0 and not self._config.bigger:
+                bytes_out = final_result.bytes_out
+            else:
+                bytes_out = final_result.bytes_in
+            self._totals.bytes_out += bytes_out
+            journal = None if container_mtime else self._journals.get(top_path)
+            if journal and final_result.path:
+                journal.record(final_result.path, final_result.bytes_in, bytes_out)
+        if self._config.timestamps and not container_mtime:
+            timestamps = self._timestamps[top_path]
+            timestamps.set(final_result.path)
+
+    def _finish_ledger_result(
+        self,
+        group: TaskGroup,
+        path_info: PathInfo,
+        callback: Callable[[ReportStats | None], None],
+        final_result: ReportStats | None,
+    ) -> None:
+        """Record a finished file in the ledger and hash its output in a worker."""
+        ledger = self._ledger
+        if (
+            ledger
+            and final_result is not None
+            and (output_path := ledger.record(path_info.path, final_result))
+        ):
+            self._scheduler.submit(
+                group,
+                partial(ledger.record_output, output_path),
+                path_info,
+                try_hash_file,
+                (output_path,),
+                size=final_result.bytes_out,
+                threaded=True,
+            )
+        callback(final_result)
+
+    def _finish_original(
+        self,
+        original: Original,
+        callback: Callable[[ReportStats | None], None],
+        final_result: ReportStats | None,
+    ) -> None:
+        """Finish a file, then the duplicates that waited for it."""
+        original.finished = True
+        original.result = final_result
+        callback(final_result)
+        waiting, original.waiting = original.waiting, []
+        for path_info, group, dupe_callback in waiting:
+            self._handle_duplicate(original, path_info, group, dupe_callback)
+            group.done()
+        self._duplicates.finish(original)
+
+    def _finish_dir(self, top_path: Path, dir_path: Path) -> None:
+        """Compact timestamps after every file in a directory completes."""
+        # Files skipped by stopping early must not be covered.
+        if self._config.timestamps and not self._stopping:
+            timestamps = self._timestamps[top_path]
+            timestamps.set(dir_path, compact=True)
+
+    def walk_dir(self, path_info: PathInfo, group: TaskGroup) -> None:
+        """Recursively optimize a directory."""
+        if (
+            not self._config.recurse
+            or path_info.is_container_child()
+            or not path_info.is_dir()
+        ):
+            # Skip
+            return
+
+        dir_path: Path = path_info.path  # type: ignore
+        dir_group = TaskGroup(
+            group, partial(self._finish_dir, path_info.top_path, dir_path)
+        )
+        callback = partial(
+            self._finish_result, path_info.top_path, path_info.container_mtime
+        )
+
+        # Walk subdirectories after the scandir iterator is closed so open
+        # directory handles don't pile up with depth.
+        subdir_path_infos = []
+        for chunk in scandir_chunks(path_info):
+            for entry_path_info in chunk:
+                if self._stopping:
+                    break
+                if entry_path_info.is_dir():
+                    subdir_path_infos.append(entry_path_info)
+                else:
+                    self.walk_file(entry_path_info, dir_group, callback)
+                    self._walk_pending_containers()
+
+        for subdir_path_info in subdir_path_infos:
+            if self._stopping:
+                break
+            self.walk_file(subdir_path_info, dir_group, callback)
+
+        dir_group.close()
+
+    def _finish_container(
+        self,
+        handler: ContainerHandler,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        memory: int,
+        exc: Exception | None = None,
+    ) -> None:
+        """Repack a container after all of its contents finish."""
+        if self._stopping:
+            # Some contents were dropped. Repack it next run.
+            handler.discard()
+            handler.release_memory()
+            return
+        if exc:
+            func, args = handler.error, (exc,)
+        else:
+            # at this point the handler's optimized contents are buffers not tasks
+            func, args = handler.repack, ()
+        # The handler carries its in memory contents to the worker.
+        size = handler.path_info.bytes_in() + handler.get_memory_used()
+        self._scheduler.submit(
+            group,
+            partial(self._finish_repack, handler, callback),
+            handler.path_info,
+            func,
+            args,
+            size=size,
+            memory=memory,
+            threaded=handler.is_threadable(),
+        )
+
+    @staticmethod
+    def _finish_repack(
+        handler: ContainerHandler,
+        callback: Callable[[ReportStats | None], None],
+        result: ReportStats | None,
+    ) -> None:
+        """Free a repacked container's share of the contents memory."""
+        handler.release_memory()
+        callback(result)
+
+    def _walk_container(
+        self,
+        handler: ContainerHandler,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        memory: int,
+    ) -> None:
+        """Optimize a container."""
+        container_group = TaskGroup(
+            group, partial(self._finish_container, handler, group, callback, memory)
+        )
+        try:
+            for path_info in handler.unpack():
+                if self._stopping:
+                    break
+                if handler.add_member(path_info):
+                    # Reuses the result of an identical member.
+                    continue
+                if not self.walk_file(
+                    path_info, container_group, partial(handler.set_task, path_info)
+                ):
+                    handler.set_task(path_info, None)
+        except Exception as exc:
+            traceback.print_exc()
+            container_group.on_done = partial(
+                self._finish_container, handler, group, callback, memory, exc
+            )
+        container_group.close()
+
+    def _walk_pending_containers(self) -> None:
+        """Walk the containers the workers identified."""
+        while self._pending_containers:
+            handler, group, callback, memory = self._pending_containers.popleft()
+            try:
+                if not self._stopping:
+                    self._walk_container(handler, group, callback, memory)
+            finally:
+                group.done()
+
+    def _skip_older_than_timestamp(self, path) -> None:
+        """Report on skipping files older than the timestamp."""
+        color = "green"
+        if self._config.verbose == 1:
+            cprint(".", color, end="")
+        elif self._config.verbose > 1:
+            cprint(f"Skip older than timestamp: {path}", color)
+
+    def _skip_in_ledger(self, path_info: PathInfo) -> None:
+        """Report on skipping files the ledger has seen."""
+        color = "green"
+        if self._config.verbose == 1:
+            cprint(".", color, end="")
+        elif self._config.verbose > 1:
+            cprint(f"Skip already optimized content: {path_info.path}", color)
+
+    def _skip_journaled(self, path_info: PathInfo) -> None:
+        """Report on skipping files finished in an interrupted run."""
+        color = "green"
+        if self._config.verbose == 1:
+            cprint(".", color, end="")
+        elif self._config.verbose > 1:
+            cprint(f"Skip finished before interruption: {path_info.path}", color)
+
+    def _is_walk_file_skip(
+        self,
+        path_info: PathInfo,
+    ) -> bool:
+        """Decide on skip the file or not."""
+        if self._is_skippable(path_info):
+            if self._config.verbose == 1:
+                cprint(".", "white", attrs=["dark"], end="")
+            return True
+
+        path = path_info.path
+        if path and path.name.rfind(Handler.WORKING_SUFFIX) > -1:
+            self._clean_up_working_files(path)
+            if self._config.verbose == 1:
+                cprint(".", "yellow", end="")
+            return True
+        return False
+
+    def _finish_file(
+        self,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        memory: int,
+        result: ReportStats | Handler | None,
+    ) -> None:
+        """Finish a file identified in a worker or carry on with its handler."""
+        if isinstance(result, Handler):
+            self._handle_file(result, group, callback, memory)
+        else:
+            callback(result)
+
+    def _estimate_memory(self, path_info: PathInfo) -> int:
+        """Estimate the memory to decode an image if there's a ceiling."""
+        if not self._config.decode_memory:
+            return 0
+        return estimate_decode_memory(path_info)
+
+    def _submit_file(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> None:
+        """Identify, verify and optimize a file in the pool."""
+        memory = self._estimate_memory(path_info)
+        self._scheduler.submit(
+            group,
+            partial(self._finish_file, group, callback, memory),
+            path_info,
+            optimize_file,
+            (self._config, path_info, self._is_hybrid),
+            memory=memory,
+            threaded=self._is_hybrid,
+        )
+
+    def _handle_file(
+        self,
+        handler: Handler,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        memory: int,
+    ) -> None:
+        """Call the correct walk or pool apply for the handler."""
+        if isinstance(handler, ContainerHandler):
+            # Walked by the main loop like dirs, never inside a task callback.
+            group.add()
+            self._pending_containers.append((handler, group, callback, memory))
+        elif isinstance(handler, ImageHandler):
+            self._scheduler.submit(
+                group,
+                callback,
+                handler.path_info,
+                handler.optimize_wrapper,
+                memory=memory,
+                threaded=handler.is_threadable(),
+            )
+        else:
+            msg = f"Bad picopt handler {handler}"
+            raise TypeError(msg)
+
+    def _handle_duplicate(
+        self,
+        original: Original,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> None:
+        """Reuse the original's result or wait for it."""
+        if not original.finished:
+            group.add()
+            original.waiting.append((path_info, group, callback))
+        elif original.result is None:
+            # Not a file picopt handles either.
+            callback(None)
+        elif original.result.exc:
+            # Optimize the duplicate on its own.
+            self._submit_file(path_info, group, callback)
+        else:
+            self._scheduler.submit(
+                group,
+                callback,
+                path_info,
+                copy_result,
+                (self._config, path_info, original.result),
+                threaded=True,
+            )
+
+    def _walk_original(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> None:
+        """Optimize a loose file once for all files with the same content."""
+        duplicates = self._duplicates
+        group_key = duplicates.get_group_key(path_info)
+        if group_key is None:
+            self._submit_file(path_info, group, callback)
+            return
+        if original := duplicates.add_first(path_info, group_key):
+            callback = partial(self._finish_original, original, callback)
+            self._submit_file(path_info, group, callback)
+            return
+        # Another unfinished file has the same size. Hash in a worker.
+        files = [(path_info.path, get_signature(path_info.stat()))]  # type: ignore
+        unhashed = duplicates.get_unhashed(group_key)
+        if unhashed:
+            files.append((unhashed.path, unhashed.signature))
+        self._scheduler.submit(
+            group,
+            partial(
+                self._walk_hashed_original,
+                path_info,
+                group,
+                callback,
+                group_key,
+                unhashed,
+            ),
+            path_info,
+            hash_unchanged,
+            (tuple(files),),
+            threaded=True,
+        )
+
+    def _walk_hashed_original(  # noqa: PLR0913
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        group_key: tuple[int, str],
+        unhashed: Original | None,
+        hashes: tuple[str, ...] | ReportStats,
+    ) -> None:
+        """Match a file hashed in a worker, after the first file it was hashed with."""
+        if not isinstance(hashes, tuple):
+            # The pool couldn't hash them.
+            hashes = ("", "")
+        if unhashed:
+            for waiting in self._duplicates.set_hash(unhashed, hashes[1]):
+                self._match_original(*waiting)
+                waiting[1].done()
+        self._match_original(path_info, group, callback, group_key, hashes[0])
+
+    def _match_original(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        group_key: tuple[int, str],
+        content_hash: str,
+    ) -> None:
+        """Optimize a hashed file or reuse the result of the same content."""
+        if not content_hash:
+            # Rewritten since it was walked.
+            self._submit_file(path_info, group, callback)
+            return
+        if hashing := self._duplicates.get_hashing(group_key):
+            # Compare once the first file of the size is hashed.
+            group.add()
+            hashing.hash_waiting.append(
+                (path_info, group, callback, group_key, content_hash)
+            )
+            return
+        original, is_duplicate = self._duplicates.match(
+            path_info, group_key, content_hash
+        )
+        if is_duplicate:
+            self._handle_duplicate(original, path_info, group, callback)
+        else:
+            callback = partial(self._finish_original, original, callback)
+            self._submit_file(path_info, group, callback)
+
+    def _is_finished_before(self, path_info: PathInfo) -> bool:
+        """Skip files older than the timestamp or finished by an earlier run."""
+        if self._is_older_than_timestamp(path_info):
+            self._skip_older_than_timestamp(path_info)
+        elif self._is_journaled(path_info):
+            self._skip_journaled(path_info)
+        elif self._is_in_ledger(path_info):
+            self._skip_in_ledger(path_info)
+        else:
+            return False
+        return True
+
+    def _walk_optimize(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> None:
+        """Send a file to the workers to identify, verify and optimize."""
+        if path_info.is_lazy_member():
+            # Decompress or read archived files in the workers too.
+            self._scheduler.submit(
+                group,
+                callback,
+                path_info,
+                optimize_contents,
+                (self._config, path_info),
+            )
+        elif path_info.is_container_child() or not self._config.duplicates:
+            self._submit_file(path_info, group, callback)
+        else:
+            self._walk_original(path_info, group, callback)
+
+    def walk_file(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> bool:
+        """Optimize an individual file. Return if a task was submitted."""
+        try:
+            if path_info.frame is None:
+                if self._is_walk_file_skip(path_info):
+                    return False
+
+                if path_info.is_dir():
+                    self.walk_dir(path_info, group)
+                    return False
+
+                if self._is_finished_before(path_info):
+                    return False
+
+                if self._ledger and not path_info.is_container_child():
+                    if not self._ledger.is_hashed(path_info.path):
+                        self._submit_hash(path_info, group, callback)
+                        return True
+                    callback = partial(
+                        self._finish_ledger_result, group, path_info, callback
+                    )
+
+            return self._walk_unfinished(path_info, group, callback)
+        except Exception as exc:
+            self._submit_error(path_info, group, callback, exc)
+        return True
+
+    def _walk_unfinished(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> bool:
+        """List or optimize a file. Return if a task was submitted."""
+        if self._config.list_only:
+            create_handler(self._config, path_info)
+            return False
+        self._walk_optimize(path_info, group, callback)
+        return True
+
+    def _submit_error(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        exc: Exception,
+    ) -> None:
+        """Report an error walking a file through the pool."""
+        traceback.print_exc()
+        apply_kwargs = {
+            "path": path_info.path,
+            "bytes_in": path_info.bytes_in(),
+            "exc": exc,
+            "config": self._config,
+            "path_info": path_info,
+        }
+        self._scheduler.submit(
+            group,
+            callback,
+            path_info,
+            ReportStats,
+            (),
+            apply_kwargs,
+            threaded=True,
+        )
+
+    def _submit_hash(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> None:
+        """Hash a file the ledger doesn't know in a worker, then walk it."""
+        self._scheduler.submit(
+            group,
+            partial(self._walk_hashed, path_info, group, callback),
+            path_info,
+            try_hash_file,
+            (path_info.path,),
+            threaded=True,
+        )
+
+    def _walk_hashed(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+        content_hash: str | None,
+    ) -> None:
+        """Skip a hashed file the ledger has done, otherwise walk it on."""
+        ledger = self._ledger
+        if ledger and isinstance(content_hash, str):
+            if ledger.add_hash(path_info, content_hash):
+                self._skip_in_ledger(path_info)
+                return
+            callback = partial(self._finish_ledger_result, group, path_info, callback)
+        try:
+            self._walk_unfinished(path_info, group, callback)
+        except Exception as exc:
+            self._submit_error(path_info, group, callback, exc)
+
+    ################
+    # Init and run #
+    ################
+    def __init__(self, config: AttrDict) -> None:
+        """Initialize."""
+        self._config = config
+        self._totals = Totals(config)
+        top_paths = []
+        paths: list[Path] = sorted(frozenset(self._config.paths))
+        for path in paths:
+            if path.is_symlink() and not self._config.symlinks:
+                continue
+            top_paths.append(path)
+        self._top_paths: tuple[Path, ...] = tuple(top_paths)
+        self._journals: dict[Path, RunJournal] = {}
+        self._ledger: Ledger | None = None
+        self._duplicates = Duplicates()
+        self._pending_containers: deque[
+            tuple[
+                ContainerHandler,
+                TaskGroup,
+                Callable[[ReportStats | None], None],
+                int,
+            ]
+        ] = deque()
+        self._case_sensitivity: dict[Path, bool] = {}
+        self._stopping: bool = False
+        jobs = self._config.jobs if self._config.jobs else os.cpu_count() or 1
+        # The pools and the programs they run inherit the priority.
+        set_config_priority(self._config)
+        thread_budget = ThreadBudget(jobs, self._config.computed.cpus)
+        io_limiter = get_io_limiter(self._config)
+        # The walk reads containers and headers itself.
+        set_io_limiter(io_limiter)
+        self._totals.io = io_limiter
+        # Queued runs keep tasks that need the walk's state in local threads.
+        executor = Executor(
+            "thread" if self._config.queue else self._config.executor,
+            jobs,
+            init_pool_worker,
+            (thread_budget.initargs, io_limiter),
+        )
+        self._executor: TaskExecutor = (
+            QueueExecutor(self._config, executor) if self._config.queue else executor
+        )
+        # Hybrid identifies in a thread and moves GIL bound files to a process.
+        self._is_hybrid = executor.backend == "hybrid"
+        controller = (
+            ConcurrencyController(
+                self._config.min_jobs,
+                jobs,
+                self._config.computed.cpus,
+                self._config.verbose,
+            )
+            if self._config.adaptive_jobs
+            else None
+        )
+        self._scheduler = Scheduler(
+            self._executor,
+            jobs * self.TASKS_PER_JOB,
+            self._config.order,
+            jobs * self.ORDER_WINDOW_PER_JOB,
+            self._config.queue_memory * ContainerHandler.MB,
+            thread_budget,
+            self._config.decode_memory * ContainerHandler.MB,
+            controller,
+        )
+
+    @classmethod
+    def _is_case_sensitive(cls, dirpath: Path) -> bool:
+        """Determine if a path is on a case sensitive filesystem."""
+        lowercase_path = dirpath / cls.LOWERCASE_TESTNAME
+        result = False
+        try:
+            lowercase_path.touch()
+            uppercase_path = dirpath / cls.UPPERCASE_TESTNAME
+            result = not uppercase_path.exists()
+        finally:
+            lowercase_path.unlink(missing_ok=True)
+        return result
+
+    def _stop(self, signum: int, _frame) -> None:
+        """Stop walking and finish the running tasks."""
+        self._stopping = True
+        self._scheduler.stop()
+        # A second signal stops immediately.
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        name = signal.Signals(signum).name
+        cprint(f"\n{name}: Finishing running tasks before stopping...", "yellow")
+
+    def _install_signal_handlers(self) -> dict:
+        """Drain and checkpoint on SIGINT and SIGTERM. Return the old handlers."""
+        old_handlers = {}
+        try:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                old_handlers[signum] = signal.signal(signum, self._stop)
+        except ValueError:
+            # Not the main thread.
+            pass
+        return old_handlers
+
+    def _finish_journals(self) -> None:
+        """Keep journals to resume from if stopped, otherwise remove them."""
+        for journal in self._journals.values():
+            if self._stopping:
+                journal.close()
+            else:
+                journal.remove()
+
+    def _walk_top_path(
+        self, path: Path, top_path: Path, parent: TaskGroup | None = None
+    ) -> None:
+        """Walk a top path or a path below it."""
+        dirpath = Treestamps.get_dir(top_path)
+        is_case_sensitive = self._case_sensitivity.get(dirpath)
+        if is_case_sensitive is None:
+            is_case_sensitive = self._is_case_sensitive(dirpath)
+            self._case_sensitivity[dirpath] = is_case_sensitive
+        path_info = PathInfo(dirpath, 0.0, True, is_case_sensitive, path=path)
+        group = TaskGroup(parent)
+        callback = partial(self._finish_result, dirpath, None)
+        self.walk_file(path_info, group, callback)
+        group.close()
+        self._walk_pending_containers()
+
+    def _join(self) -> None:
+        """Finish all tasks, walking containers as the workers identify them."""
+        while True:
+            self._walk_pending_containers()
+            if not self._scheduler.step() and not self._pending_containers:
+                break
+
+    def _finish_run(self, old_signal_handlers: dict) -> Totals:
+        """Finish running tasks, shut down and save."""
+        self._join()
+        for signum, handler in old_signal_handlers.items():
+            signal.signal(signum, handler)
+        self._totals.queue = self._scheduler.stats
+
+        # Shut down multiprocessing
+        self._executor.close()
+        self._executor.join()
+
+        cprint("done.")
+
+        if self._config.timestamps:
+            self._timestamps.dump()
+        self._finish_journals()
+        if self._ledger:
+            self._ledger.close()
+        if output_cache := get_output_cache(self._config):
+            output_cache.evict()
+        if self._stopping and (self._journals or self._config.timestamps):
+            cprint("Stopped early. Run again to resume.", "yellow")
+
+        return self._totals
+
+    def run(self) -> Totals:
+        """Optimize all configured files."""
+        self._init_run()
+        old_signal_handlers = self._install_signal_handlers()
+
+        # Walk each top file
+        for top_path in self._top_paths:
+            if self._stopping:
+                break
+            self._walk_top_path(top_path, top_path)
+
+        return self._finish_run(old_signal_handlers)
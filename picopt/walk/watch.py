@@ -0,0 +1,414 @@
+"""Watch the paths and optimize files as they land."""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from functools import partial
+from pathlib import Path
+from time import monotonic, sleep
+
+from confuse.templates import AttrDict
+from termcolor import cprint
+
+from picopt.handlers.handler import Handler
+from picopt.path import PathInfo, is_path_ignored
+from picopt.stats import ReportStats, Totals
+from picopt.walk.scheduler import TaskGroup
+from picopt.walk.sqlite_timestamps import SQLiteGrovestamps
+from picopt.walk.walk import Walk
+
+# inotify(7) masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class Watcher(ABC):
+    """Report paths that changed under the watched paths."""
+
+    def __init__(self, config: AttrDict, top_paths: Iterable[Path]):
+        """Store the paths to watch."""
+        self._config = config
+        self._top_paths = tuple(top_paths)
+
+    def _iter_dirs(self, path: Path) -> Iterable[Path]:
+        """Yield a directory and, when recursing, its subdirectories."""
+        if not path.is_dir():
+            return
+        yield path
+        if not self._config.recurse:
+            return
+        for root, dirnames, _ in os.walk(path, followlinks=self._config.symlinks):
+            dirnames[:] = [
+                dirname
+                for dirname in dirnames
+                if not is_path_ignored(self._config, Path(dirname))
+            ]
+            for dirname in dirnames:
+                yield Path(root) / dirname
+
+    @abstractmethod
+    def read(self, timeout: float) -> set[Path]:
+        """Wait up to timeout for changed paths."""
+
+    def close(self) -> None:  # noqa: B027
+        """Release resources."""
+
+
+class InotifyWatcher(Watcher):
+    """Watch directories with inotify through libc."""
+
+    def __init__(self, config: AttrDict, top_paths: Iterable[Path]):
+        """Create the inotify instance and watch the directories."""
+        super().__init__(config, top_paths)
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._dirs: dict[int, Path] = {}
+        try:
+            for top_path in self._top_paths:
+                watch_path = top_path if top_path.is_dir() else top_path.parent
+                self._watch_tree(watch_path)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, dir_path: Path) -> None:
+        """Watch one directory."""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(dir_path))
+        self._dirs[wd] = dir_path
+
+    def _watch_tree(self, path: Path) -> None:
+        """Watch a directory and its subdirectories."""
+        for dir_path in self._iter_dirs(path):
+            self._watch(dir_path)
+
+    def _handle_event(self, wd: int, mask: int, name: str, paths: set[Path]) -> None:
+        """Add an event's path to the changed paths."""
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost. Rewalk everything.
+            paths.update(self._top_paths)
+            return
+        if mask & IN_IGNORED:
+            self._dirs.pop(wd, None)
+            return
+        dir_path = self._dirs.get(wd)
+        if dir_path is None or not name:
+            return
+        path = dir_path / name
+        if mask & IN_ISDIR:
+            if not self._config.recurse or not mask & (IN_CREATE | IN_MOVED_TO):
+                return
+            # Files may land before the watch does. Walking the dir finds them.
+            try:
+                self._watch_tree(path)
+            except OSError as exc:
+                cprint(f"WARNING: Can't watch {path}: {exc}", "yellow")
+        paths.add(path)
+
+    def read(self, timeout: float) -> set[Path]:
+        """Wait up to timeout for changed paths."""
+        paths: set[Path] = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return paths
+        buf = os.read(self._fd, _READ_SIZE)
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buf[offset : offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            self._handle_event(wd, mask, name, paths)
+        return paths
+
+    def close(self) -> None:
+        """Close the inotify instance."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher(Watcher):
+    """Find changed files by comparing directory listings."""
+
+    POLL_SECONDS = 5.0
+
+    def __init__(self, config: AttrDict, top_paths: Iterable[Path]):
+        """Take the first snapshot."""
+        super().__init__(config, top_paths)
+        self._snapshot = self._scan()
+        self._next_scan = monotonic() + self.POLL_SECONDS
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        """Get the size and mtime of every file."""
+        snapshot = {}
+        for top_path in self._top_paths:
+            if not top_path.is_dir():
+                try:
+                    stat = top_path.stat()
+                except OSError:
+                    continue
+                snapshot[top_path] = (stat.st_size, stat.st_mtime_ns)
+                continue
+            for dir_path in self._iter_dirs(top_path):
+                try:
+                    with os.scandir(dir_path) as entries:
+                        for entry in entries:
+                            if entry.is_dir():
+                                continue
+                            stat = entry.stat()
+                            snapshot[Path(entry.path)] = (
+                                stat.st_size,
+                                stat.st_mtime_ns,
+                            )
+                except OSError:
+                    continue
+        return snapshot
+
+    def read(self, timeout: float) -> set[Path]:
+        """Wait up to timeout, rescanning when due."""
+        wait = self._next_scan - monotonic()
+        if wait > timeout:
+            sleep(timeout)
+            return set()
+        if wait > 0:
+            sleep(wait)
+        self._next_scan = monotonic() + self.POLL_SECONDS
+        snapshot = self._scan()
+        old_snapshot = self._snapshot
+        self._snapshot = snapshot
+        return {path for path, sig in snapshot.items() if old_snapshot.get(path) != sig}
+
+
+def create_watcher(config: AttrDict, top_paths: Iterable[Path]) -> Watcher:
+    """Use inotify if available, otherwise poll."""
+    try:
+        return InotifyWatcher(config, top_paths)
+    except (OSError, AttributeError) as exc:
+        if config.verbose:
+            cprint(f"inotify unavailable, polling for changes: {exc}", "yellow")
+        return PollingWatcher(config, top_paths)
+
+
+class Debouncer:
+    """Hold changed paths until they stop changing."""
+
+    def __init__(self, seconds: float):
+        """Initialize."""
+        self._seconds = seconds
+        # path: (deadline, size & mtime when touched)
+        self._pending: dict[Path, tuple[float, tuple[int, int] | None]] = {}
+
+    @staticmethod
+    def _get_signature(path: Path) -> tuple[int, int] | None:
+        """Get the size and mtime."""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def touch(self, path: Path) -> None:
+        """Restart a path's quiet period."""
+        self._pending[path] = (
+            monotonic() + self._seconds,
+            self._get_signature(path),
+        )
+
+    def pop_ready(self) -> list[Path]:
+        """Return paths that haven't changed for the quiet period."""
+        now = monotonic()
+        ready = []
+        for path, (deadline, signature) in tuple(self._pending.items()):
+            if deadline > now:
+                continue
+            new_signature = self._get_signature(path)
+            if new_signature is None:
+                del self._pending[path]
+            elif new_signature != signature:
+                # Still being written without events, like on network shares.
+                self._pending[path] = (now + self._seconds, new_signature)
+            else:
+                del self._pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+
+class Watch(Walk):
+    """Walk the paths, then keep optimizing files as they change."""
+
+    DEBOUNCE_SECONDS = 2.0
+    EVENT_TIMEOUT = 0.5
+    MAX_OPTIMIZED_MTIMES = 65536
+
+    def __init__(self, config: AttrDict) -> None:
+        """Initialize."""
+        super().__init__(config)
+        # Files picopt wrote itself. Their events are ignored.
+        self._optimized_mtimes: dict[Path, int] = {}
+        # Files being optimized. A dir walk and a file event can both find one.
+        self._running_paths: set[Path] = set()
+
+    def _init_run_journals(self) -> None:
+        """Watching relies on timestamps, not a journal that would never finish."""
+
+    def _finish_result(
+        self,
+        top_path: Path,
+        container_mtime: float | None,
+        final_result: ReportStats | None,
+    ) -> None:
+        """Remember written files so their events don't loop."""
+        super()._finish_result(top_path, container_mtime, final_result)
+        if (
+            container_mtime
+            or final_result is None
+            or final_result.exc
+            or not final_result.path
+        ):
+            return
+        try:
+            mtime = final_result.path.stat().st_mtime_ns
+        except OSError:
+            return
+        self._optimized_mtimes.pop(final_result.path, None)
+        self._optimized_mtimes[final_result.path] = mtime
+        if len(self._optimized_mtimes) > self.MAX_OPTIMIZED_MTIMES:
+            # Forget the oldest.
+            del self._optimized_mtimes[next(iter(self._optimized_mtimes))]
+
+    def _finish_running(
+        self,
+        path: Path,
+        callback: Callable[[ReportStats | None], None],
+        final_result: ReportStats | None,
+    ) -> None:
+        """Finish a file and allow it to run again."""
+        self._running_paths.discard(path)
+        callback(final_result)
+
+    def walk_file(
+        self,
+        path_info: PathInfo,
+        group: TaskGroup,
+        callback: Callable[[ReportStats | None], None],
+    ) -> bool:
+        """Optimize a file unless it's already running."""
+        path = path_info.path
+        if not path or path_info.is_container_child():
+            return super().walk_file(path_info, group, callback)
+        if path in self._running_paths or self._is_own_write(path):
+            return False
+        callback = partial(self._finish_running, path, callback)
+        submitted = super().walk_file(path_info, group, callback)
+        if submitted:
+            self._running_paths.add(path)
+        return submitted
+
+    def _is_ignored_change(self, path: Path, top_path: Path) -> bool:
+        """Is the path ignored, a working file or a picopt file."""
+        if any(Handler.WORKING_SUFFIX in part for part in path.parts):
+            return True
+        if path != top_path and any(
+            is_path_ignored(self._config, Path(part))
+            for part in path.relative_to(top_path).parts
+        ):
+            return True
+        return path.name in self.TIMESTAMPS_FILENAMES or path.name in (
+            self.LOWERCASE_TESTNAME,
+            self.UPPERCASE_TESTNAME,
+        )
+
+    def _is_own_write(self, path: Path) -> bool:
+        """Is the file unchanged since picopt wrote it."""
+        mtime = self._optimized_mtimes.get(path)
+        if mtime is None:
+            return False
+        try:
+            return path.stat().st_mtime_ns == mtime
+        except OSError:
+            return True
+
+    def _get_top_path(self, path: Path) -> Path | None:
+        """Find the top path a changed path belongs to."""
+        for top_path in self._top_paths:
+            if path == top_path or path.is_relative_to(top_path):
+                return top_path
+        return None
+
+    def _walk_changed(self, path: Path, group: TaskGroup) -> None:
+        """Optimize a changed file or directory."""
+        top_path = self._get_top_path(path)
+        if top_path is None or self._is_ignored_change(path, top_path):
+            return
+        self._walk_top_path(path, top_path, group)
+
+    def _checkpoint(self) -> None:
+        """Save timestamps and the ledger so a crash doesn't lose the batch."""
+        if self._stopping:
+            # Saved when the run finishes.
+            return
+        if self._config.timestamps:
+            if isinstance(self._timestamps, SQLiteGrovestamps):
+                self._timestamps.commit()
+            else:
+                self._timestamps.dump()
+        if self._ledger:
+            self._ledger.commit()
+
+    def _walk_batch(self, paths: Iterable[Path]) -> None:
+        """Optimize debounced paths and checkpoint once they all finish."""
+        batch_group = TaskGroup(on_done=self._checkpoint)
+        for path in paths:
+            self._walk_changed(path, batch_group)
+        batch_group.close()
+
+    def _watch(self) -> None:
+        """Feed changed files to the workers until stopped."""
+        watcher = create_watcher(self._config, self._top_paths)
+        debouncer = Debouncer(self.DEBOUNCE_SECONDS)
+        if self._config.verbose:
+            cprint(f"\nWatching with {type(watcher).__name__}...", "cyan")
+        try:
+            while not self._stopping:
+                for path in watcher.read(self.EVENT_TIMEOUT):
+                    debouncer.touch(path)
+                if ready := debouncer.pop_ready():
+                    self._walk_batch(ready)
+                self._scheduler.poll()
+                self._walk_pending_containers()
+        finally:
+            watcher.close()
+
+    def run(self) -> Totals:
+        """Optimize all configured files, then watch for changes."""
+        self._init_run()
+        old_signal_handlers = self._install_signal_handlers()
+
+        for top_path in self._top_paths:
+            if self._stopping:
+                break
+            self._walk_top_path(top_path, top_path)
+
+        self._watch()
+
+        return self._finish_run(old_signal_handlers)
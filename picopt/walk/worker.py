@@ -0,0 +1,84 @@
+"""Tasks that identify and optimize files inside the worker processes."""
+
+import traceback
+
+from confuse.templates import AttrDict
+
+from picopt.handlers.container import ContainerHandler
+from picopt.handlers.factory import create_handler
+from picopt.handlers.handler import Handler
+from picopt.io_limit import IOLimiter, set_io_limiter
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from picopt.thread_budget import init_worker
+
+
+def init_pool_worker(thread_budget_args: tuple, io_limiter: IOLimiter | None) -> None:
+    """Attach a pool worker to the run's shared budgets and limits."""
+    init_worker(*thread_budget_args)
+    set_io_limiter(io_limiter)
+
+
+def _error_report(config: AttrDict, path_info: PathInfo, exc: Exception) -> ReportStats:
+    """Report an exception raised identifying or optimizing a file."""
+    traceback.print_exc()
+    return ReportStats(
+        path_info.path,
+        bytes_in=path_info.bytes_in(),
+        exc=exc,
+        config=config,
+        path_info=path_info,
+    )
+
+
+def _optimize_container_inline(
+    config: AttrDict, handler: ContainerHandler
+) -> ReportStats:
+    """Optimize a container found inside an archive entirely in this worker."""
+    for path_info in handler.unpack():
+        if handler.add_member(path_info):
+            continue
+        report = optimize_contents(config, path_info)
+        handler.set_task(path_info, report)
+    return handler.repack()
+
+
+def optimize_contents(config: AttrDict, path_info: PathInfo) -> ReportStats | None:
+    """Decompress, identify and optimize an archived file.
+
+    Returns None if picopt doesn't handle the file.
+    """
+    try:
+        handler = create_handler(config, path_info)
+        if handler is None:
+            return None
+        if isinstance(handler, ContainerHandler):
+            return _optimize_container_inline(config, handler)
+        return handler.optimize_wrapper()
+    except Exception as exc:
+        return _error_report(config, path_info, exc)
+
+
+def optimize_file(
+    config: AttrDict,
+    path_info: PathInfo,
+    in_thread: bool = False,
+) -> ReportStats | Handler | None:
+    """Identify, verify and optimize a file.
+
+    Returns the handler instead of optimizing for containers, which the walk
+    unpacks so their contents spread over the pool, and for handlers that
+    hold the GIL when running in a thread, which belong in a process.
+    Returns None if picopt doesn't handle the file.
+    """
+    try:
+        handler = create_handler(config, path_info)
+        if (
+            handler is None
+            or isinstance(handler, ContainerHandler)
+            or (in_thread and not handler.is_threadable())
+        ):
+            return handler
+        return handler.optimize_wrapper()
+    except Exception as exc:
+        return _error_report(config, path_info, exc)
@@ -80,3 +80,14 @@ class TestContainersDir:
         cli.main(args)
         assert old_ts_path.exists()
         self._assert_sizes(0, root=child_root)
+
+    def test_old_timestamp_imported_once(self) -> None:
+        """Test old timestamps are only searched for on the first run."""
+        child_root = TMP_ROOT / "child"
+        child_root.mkdir(exist_ok=True)
+        args = (PROGRAM_NAME, "-rt", "--timestamps-backend", "sqlite", str(TMP_ROOT))
+        cli.main(args)
+        old_ts_path = child_root / OLD_TIMESTAMPS_NAME
+        old_ts_path.touch()
+        cli.main(args)
+        assert old_ts_path.exists()
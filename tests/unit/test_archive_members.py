@@ -0,0 +1,117 @@
+"""Test reading archive members."""
+
+import shutil
+from io import BytesIO
+from zipfile import ZipFile
+
+import pytest
+from rarfile import RarFile
+
+from picopt.handlers.zip import Rar
+from picopt.path import MAX_OPEN_ARCHIVES, PathInfo, open_archive
+from tests import CONTAINER_DIR, IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+ZIP_PATH = TMP_ROOT / "test_zip.zip"
+RAR_PATH = CONTAINER_DIR / "test_rar.rar"
+RAR_MEMBER_PATH = IMAGES_DIR / "test_jpg.jpg"
+
+
+class TestArchiveMembers:
+    """Test lazy members share an open archive."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        shutil.copy(CONTAINER_DIR / "test_zip.zip", ZIP_PATH)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def _members() -> list[PathInfo]:
+        with ZipFile(ZIP_PATH) as archive:
+            return [
+                PathInfo(
+                    TMP_ROOT, 0.0, True, True, zipinfo=zipinfo, archive_path=ZIP_PATH
+                )
+                for zipinfo in archive.infolist()
+                if not zipinfo.is_dir()
+            ]
+
+    def test_open_archive(self) -> None:
+        """Test members are read through one open archive per process."""
+        with open_archive(ZIP_PATH) as archive:
+            pass
+        with ZipFile(ZIP_PATH) as expected:
+            for path_info in self._members():
+                assert path_info.data() == expected.read(path_info.name())
+        with open_archive(ZIP_PATH) as same_archive:
+            assert same_archive is archive
+
+    def test_replaced_archive(self) -> None:
+        """Test a rewritten archive is opened again."""
+        with open_archive(ZIP_PATH) as archive:
+            pass
+        new_path = TMP_ROOT / "new.zip"
+        with ZipFile(new_path, "w") as new_archive:
+            new_archive.writestr("new.txt", b"new")
+        new_path.replace(ZIP_PATH)
+        with open_archive(ZIP_PATH) as new_archive:
+            assert new_archive is not archive
+            assert new_archive.read("new.txt") == b"new"
+
+    def test_evicted_archive(self) -> None:
+        """Test evicted archives close once their last read is done."""
+        paths = []
+        for index in range(MAX_OPEN_ARCHIVES + 1):
+            path = TMP_ROOT / f"{index}.zip"
+            shutil.copy(ZIP_PATH, path)
+            paths.append(path)
+        with open_archive(paths[0]) as in_use:
+            with open_archive(paths[1]) as idle:
+                pass
+            for path in paths[2:]:
+                with open_archive(path):
+                    pass
+            with open_archive(ZIP_PATH):
+                pass
+            assert idle.fp is None
+            assert in_use.fp is not None
+        assert in_use.fp is None
+
+
+def test_rar_compress_size() -> None:
+    """Test RAR members charge their compressed size to the read limit."""
+    with RarFile(RAR_PATH) as archive:
+        for archive_info in archive.infolist():
+            zipinfo = Rar.to_zipinfo(archive_info)
+            assert zipinfo.compress_size == archive_info.compress_size
+            assert zipinfo.compress_size > 0
+
+
+def test_split_members() -> None:
+    """Test splitting a solid archive's printed members."""
+    shutil.rmtree(TMP_ROOT, ignore_errors=True)
+    TMP_ROOT.mkdir(parents=True)
+    paths = iter(TMP_ROOT / str(index) for index in range(4))
+    data = RAR_MEMBER_PATH.read_bytes()
+    with RarFile(RAR_PATH) as archive:
+        archive_infos = archive.infolist()
+    try:
+        members = list(Rar.split_members(BytesIO(data), archive_infos, paths.__next__))
+        assert [zipinfo.filename for zipinfo, _ in members] == ["test_jpg.jpg"]
+        assert members[0][1].read_bytes() == data
+        with pytest.raises(ValueError, match="test_jpg.jpg"):
+            list(
+                Rar.split_members(
+                    BytesIO(data[1:] + b"x"), archive_infos, paths.__next__
+                )
+            )
+        with pytest.raises(ValueError, match="test_jpg.jpg"):
+            list(Rar.split_members(BytesIO(data[:-1]), archive_infos, paths.__next__))
+    finally:
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
@@ -0,0 +1,147 @@
+"""Test containers spilling optimized contents to disk."""
+
+import shutil
+from argparse import Namespace
+from pathlib import Path
+from zipfile import ZipFile
+
+from picopt import PROGRAM_NAME, cli
+from picopt.config import get_config
+from picopt.handlers.container import ContainerHandler, get_contents_memory_used
+from picopt.handlers.factory import create_handler
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from tests import CONTAINER_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+FN = "test_zip.zip"
+ZIP_PATH = TMP_ROOT / FN
+MEMORY_DIR = TMP_ROOT / "memory"
+SPILL_DIR = TMP_ROOT / "spill"
+
+
+def _read_members(path: Path) -> dict[str, bytes]:
+    with ZipFile(path) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def _create_handler(container_memory: int, path: Path = ZIP_PATH) -> ContainerHandler:
+    """Create a zip handler with a contents memory budget."""
+    args = Namespace(
+        picopt=Namespace(
+            config=None, extra_formats=["ZIP"], container_memory=container_memory
+        )
+    )
+    handler = create_handler(
+        get_config(args), PathInfo(TMP_ROOT, 0.0, True, True, path=path)
+    )
+    assert isinstance(handler, ContainerHandler)
+    return handler
+
+
+def _set_member(handler: ContainerHandler, size: int) -> PathInfo:
+    """Set new data of a size for the first member."""
+    path_info = next(iter(handler.unpack()))
+    report = ReportStats(
+        Path(path_info.name()),
+        bytes_in=path_info.bytes_in(),
+        bytes_out=size,
+        data=b"x" * size,
+    )
+    handler.set_task(path_info, report)
+    return path_info
+
+
+def _spill_all() -> tuple[ContainerHandler, dict[str, bytes]]:
+    """Unpack the zip with no memory budget and spill new data for each member."""
+    handler = _create_handler(0)
+    contents = {}
+    for path_info in handler.unpack():
+        data = f"new {path_info.name()}".encode()
+        contents[path_info.name()] = data
+        report = ReportStats(
+            Path(path_info.name()),
+            bytes_in=path_info.bytes_in(),
+            bytes_out=len(data),
+            data=data,
+        )
+        handler.set_task(path_info, report)
+    assert not handler.get_memory_used()
+    return handler, contents
+
+
+class TestContainerSpill:
+    """Test spilled contents repack and clean up."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        shutil.copy(CONTAINER_DIR / FN, ZIP_PATH)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_repack(self) -> None:
+        """Test spilled contents are repacked in order and the scratch removed."""
+        handler, contents = _spill_all()
+        report = handler.repack()
+        assert not report.exc
+        assert report.path
+        assert list(_read_members(report.path).items()) == list(contents.items())
+        assert list(TMP_ROOT.iterdir()) == [report.path]
+
+    def test_error(self) -> None:
+        """Test a failed repack leaves the original and no working files."""
+        original = ZIP_PATH.read_bytes()
+        handler, _ = _spill_all()
+        assert len(list(TMP_ROOT.iterdir())) > 1
+
+        def _fail(*_args) -> None:
+            reason = "pack failed"
+            raise OSError(reason)
+
+        handler._pack_member = _fail  # type: ignore[method-assign]
+        report = handler.repack()
+        assert isinstance(report.exc, OSError)
+        assert list(TMP_ROOT.iterdir()) == [ZIP_PATH]
+        assert ZIP_PATH.read_bytes() == original
+
+    def test_shared_budget(self) -> None:
+        """Test open containers share one memory budget."""
+        other_path = TMP_ROOT / "other.zip"
+        shutil.copy(ZIP_PATH, other_path)
+        size = ContainerHandler.MB
+        first = _create_handler(1)
+        second = _create_handler(1, other_path)
+        try:
+            _set_member(first, size)
+            assert first.get_memory_used() == size
+            assert get_contents_memory_used() == size
+            _set_member(second, size)
+            assert not second.get_memory_used()
+            assert get_contents_memory_used() == size
+            first.release_memory()
+            assert not get_contents_memory_used()
+            _set_member(second, size)
+            assert second.get_memory_used() == size
+        finally:
+            first.discard()
+            second.discard()
+            first.release_memory()
+            second.release_memory()
+        assert not get_contents_memory_used()
+
+    def test_cli(self) -> None:
+        """Test a run that spills everything matches one held in memory."""
+        for path, memory in ((MEMORY_DIR, "256"), (SPILL_DIR, "0")):
+            path.mkdir()
+            shutil.copy(ZIP_PATH, path)
+            cli.main(
+                (PROGRAM_NAME, "-x", "ZIP", "--container-memory", memory, str(path))
+            )
+        assert _read_members(MEMORY_DIR / FN) == _read_members(SPILL_DIR / FN)
+        assert list(SPILL_DIR.iterdir()) == [SPILL_DIR / FN]
+        assert not get_contents_memory_used()
@@ -0,0 +1,50 @@
+"""Test the adaptive concurrency controller."""
+
+from picopt.walk.controller import ConcurrencyController
+
+__all__ = ()  # hides module from pydocstring
+MIN_SLOTS = 2
+MAX_SLOTS = 6
+
+
+def _controller() -> ConcurrencyController:
+    return ConcurrencyController(MIN_SLOTS, MAX_SLOTS, cpus=8)
+
+
+def _step(controller: ConcurrencyController, score: float, saturated=False) -> int:
+    controller.slots = controller._climb(score, saturated)
+    return controller.slots
+
+
+def test_climb() -> None:
+    """Test slots grow while throughput improves and back off when it drops."""
+    controller = _controller()
+    assert controller.slots == 4  # noqa: PLR2004
+    assert _step(controller, 100.0) == 5  # noqa: PLR2004
+    assert _step(controller, 120.0) == MAX_SLOTS
+    assert _step(controller, 80.0) == 5  # noqa: PLR2004
+    assert _step(controller, 90.0) == 4  # noqa: PLR2004
+
+
+def test_bounds() -> None:
+    """Test slots stay in range and turn around at the bounds."""
+    controller = _controller()
+    for score in (1.0, 2.0, 3.0):
+        assert MIN_SLOTS <= _step(controller, score) <= MAX_SLOTS
+    assert controller.slots == MAX_SLOTS
+    assert _step(controller, 4.0) == MAX_SLOTS - 1
+
+
+def test_saturated() -> None:
+    """Test overloaded cpus or io shrink the slots."""
+    controller = _controller()
+    assert controller._is_saturated(iowait=0.9, load=None)
+    assert controller._is_saturated(iowait=None, load=16.0)
+    assert not controller._is_saturated(iowait=0.1, load=4.0)
+    assert _step(controller, 100.0, saturated=True) == 3  # noqa: PLR2004
+
+
+def test_update_waits_for_interval() -> None:
+    """Test slots don't change before an interval's worth of tasks."""
+    controller = _controller()
+    assert controller.update(1000) == controller.slots
@@ -0,0 +1,76 @@
+"""Test estimating decode memory from image headers."""
+
+from argparse import Namespace
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from picopt.config import DECODE_MEMORY_AUTO, get_config
+from picopt.handlers.decode_memory import estimate_decode_memory
+from picopt.path import PathInfo
+from tests import IMAGES_DIR
+
+__all__ = ()  # hides module from pydocstring
+BIG_SIZE = (1000, 750)
+WEBP_OPTIONS = ({"quality": 95}, {"lossless": True})
+
+
+def _estimate(name: str) -> int:
+    path_info = PathInfo(IMAGES_DIR, 0.0, True, True, path=IMAGES_DIR / name)
+    return estimate_decode_memory(path_info)
+
+
+def _estimate_data(data: bytes) -> int:
+    path_info = PathInfo(Path(), 0.0, True, True, data=data)
+    return estimate_decode_memory(path_info)
+
+
+def test_still() -> None:
+    """Test still images are held decoded and converted."""
+    assert _estimate("test_png.png") == 256 * 256 * 4 * 2
+    assert _estimate("test_gif.gif") == 600 * 399 * 1 * 2
+
+
+def test_animated() -> None:
+    """Test animated images hold every frame."""
+    assert _estimate("test_animated_png.png") == 100 * 100 * 4 * 21
+    # Frames past the header aren't counted.
+    assert _estimate("test_animated_gif.gif") == 109 * 159 * 1 * 3
+
+
+def test_webp_header() -> None:
+    """Test large lossy, lossless and extended WebPs are read from the header."""
+    with Image.open(IMAGES_DIR / "test_jpg.jpg") as image:
+        big_image = image.resize(BIG_SIZE)
+    exif = Image.Exif()
+    exif[0x010E] = "picopt"  # ImageDescription makes an extended VP8X file
+    for options in (*WEBP_OPTIONS, {"exif": exif.tobytes()}):
+        buffer = BytesIO()
+        big_image.save(buffer, "WEBP", **options)
+        data = buffer.getvalue()
+        assert _estimate_data(data) == BIG_SIZE[0] * BIG_SIZE[1] * 4 * 2, options
+
+
+def test_unsniffed() -> None:
+    """Test formats the sniffer doesn't know are read by Pillow."""
+    assert _estimate("eight.tif") == 308 * 242 * 1 * 2
+    # Multi page TIFFs hold a page and the canvas beside the first.
+    assert _estimate("mri.tif") == 128 * 128 * 1 * 3
+    assert _estimate("test_bmp.bmp") == 250 * 188 * 4 * 2
+    assert _estimate("test_pnm.pnm") == 96 * 96 * 4 * 2
+
+
+def test_unhandled() -> None:
+    """Test files Pillow can't open."""
+    assert _estimate("test_txt.txt") == 0
+    assert _estimate("test_svg.svg") == 0
+
+
+def test_config() -> None:
+    """Test the ceiling is off unless asked for."""
+    assert get_config(Namespace(picopt=Namespace(config=None))).decode_memory == 0
+    config = get_config(
+        Namespace(picopt=Namespace(config=None, decode_memory=DECODE_MEMORY_AUTO))
+    )
+    assert isinstance(config.decode_memory, int)
@@ -0,0 +1,116 @@
+"""Test duplicate detection."""
+
+import shutil
+from argparse import Namespace
+
+from picopt.config import get_config
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from picopt.walk.duplicates import Duplicates, copy_result, hash_unchanged
+from picopt.walk.ledger import get_signature
+from tests import IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+PNG_PATH = TMP_ROOT / "test_png.png"
+COPY_PATH = TMP_ROOT / "copy.png"
+OTHER_PATH = TMP_ROOT / "other.png"
+
+
+class TestDuplicates:
+    """Test grouping and reusing results."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+        shutil.copy(PNG_PATH, COPY_PATH)
+        data = bytearray(PNG_PATH.read_bytes())
+        data[-1] ^= 0xFF
+        OTHER_PATH.write_bytes(data)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def _path_info(path) -> PathInfo:
+        return PathInfo(TMP_ROOT, 0.0, True, True, path=path)
+
+    @staticmethod
+    def _hash(path) -> str:
+        return hash_unchanged(((path, get_signature(path.stat())),))[0]
+
+    def test_add(self) -> None:
+        """Test the first file of a size isn't hashed and later ones are matched."""
+        duplicates = Duplicates()
+        path_info = self._path_info(PNG_PATH)
+        group_key = duplicates.get_group_key(path_info)
+        assert group_key
+        original = duplicates.add_first(path_info, group_key)
+        assert original
+        assert original.content_hash is None
+
+        other_info = self._path_info(OTHER_PATH)
+        assert not duplicates.add_first(other_info, group_key)
+        unhashed = duplicates.get_unhashed(group_key)
+        assert unhashed is original
+        assert duplicates.get_unhashed(group_key) is None
+        assert duplicates.get_hashing(group_key) is original
+
+        waiting = ("waiting",)
+        original.hash_waiting.append(waiting)
+        assert duplicates.set_hash(original, self._hash(PNG_PATH)) == [waiting]
+        assert duplicates.get_hashing(group_key) is None
+        other, is_duplicate = duplicates.match(
+            other_info, group_key, self._hash(OTHER_PATH)
+        )
+        assert other is not original
+        assert not is_duplicate
+        copy_info = self._path_info(COPY_PATH)
+        assert duplicates.match(copy_info, group_key, self._hash(COPY_PATH)) == (
+            original,
+            True,
+        )
+
+    def test_rewritten(self) -> None:
+        """Test files rewritten since they were walked hash to nothing."""
+        signature = get_signature(PNG_PATH.stat())
+        PNG_PATH.write_bytes(b"rewritten")
+        assert hash_unchanged(((PNG_PATH, signature),)) == ("",)
+
+    def test_finish(self) -> None:
+        """Test finished originals are forgotten."""
+        duplicates = Duplicates()
+        path_info = self._path_info(PNG_PATH)
+        group_key = duplicates.get_group_key(path_info)
+        assert group_key
+        original = duplicates.add_first(path_info, group_key)
+        assert original
+        duplicates.finish(original)
+        copy = duplicates.add_first(self._path_info(COPY_PATH), group_key)
+        assert copy
+        assert copy is not original
+        assert duplicates.get_unhashed(group_key) is copy
+        duplicates.set_hash(copy, self._hash(COPY_PATH))
+        other, _ = duplicates.match(
+            self._path_info(OTHER_PATH), group_key, self._hash(OTHER_PATH)
+        )
+        for unfinished in (other, copy):
+            duplicates.finish(unfinished)
+        assert not duplicates._originals
+
+    def test_copy_result(self) -> None:
+        """Test a duplicate gets the original's output."""
+        config = get_config(
+            Namespace(picopt=Namespace(hardlink_duplicates=True, config=None))
+        )
+        bytes_in = PNG_PATH.stat().st_size
+        PNG_PATH.write_bytes(b"optimized")
+        result = ReportStats(PNG_PATH, bytes_in=bytes_in, bytes_out=9)
+        report = copy_result(config, self._path_info(COPY_PATH), result)
+        assert report.path == COPY_PATH
+        assert report.saved == bytes_in - 9
+        assert COPY_PATH.read_bytes() == b"optimized"
+        assert COPY_PATH.stat().st_ino == PNG_PATH.stat().st_ino
@@ -0,0 +1,27 @@
+"""Test the external program runner."""
+
+import shutil
+from subprocess import CalledProcessError
+
+import pytest
+
+from picopt.handlers.ext_runner import get_ext_runner
+
+__all__ = ()  # hides module from pydocstring
+
+
+def test_run_pipe() -> None:
+    """Test piping data through a program."""
+    runner = get_ext_runner(2)
+    cat = shutil.which("cat")
+    assert cat
+    assert runner.run_pipe((cat,), b"picopt") == b"picopt"
+
+
+def test_run_fs_error() -> None:
+    """Test a failing program raises."""
+    runner = get_ext_runner(2)
+    false = shutil.which("false")
+    assert false
+    with pytest.raises(CalledProcessError):
+        runner.run_fs((false,))
@@ -0,0 +1,102 @@
+"""Test the format cache."""
+
+import os
+import shutil
+
+from PIL.TiffImagePlugin import IFDRational
+
+from picopt.formats import FileFormat
+from picopt.handlers.format_cache import FormatCache
+from picopt.path import PathInfo
+from tests import IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+DB_PATH = TMP_ROOT / "formats.sqlite"
+PNG_FORMAT = FileFormat("PNG", lossless=True, animated=False)
+METADATA = {
+    "animated": False,
+    "dpi": (IFDRational(72, 1), IFDRational(144, 2)),
+    "exif": b"Exif\x00\x00",
+    "mpinfo": {45056: b"0100", 45058: [{"Size": 10}]},
+    "gamma": 0.45455,
+    "comment": None,
+}
+
+
+class TestFormatCache:
+    """Test storing and validating cached formats."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        self.path = TMP_ROOT / "test_png.png"
+        shutil.copy(IMAGES_DIR / "test_png.png", self.path)
+        self.cache = FormatCache(DB_PATH)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def _path_info(self, path=None) -> PathInfo:
+        path = path or self.path
+        return PathInfo(TMP_ROOT, 0.0, True, True, path=path)
+
+    def test_round_trip(self) -> None:
+        """Test an unchanged file hits."""
+        self.cache.put(
+            self._path_info(), "full", PNG_FORMAT, {"animated": False}, False
+        )
+        assert self.cache.get(self._path_info(), "full", False) == (
+            PNG_FORMAT,
+            {"animated": False},
+        )
+
+    def test_metadata(self) -> None:
+        """Test kept metadata round trips and only serves runs that keep it."""
+        self.cache.put(self._path_info(), "full", PNG_FORMAT, METADATA, True)
+        assert self.cache.get(self._path_info(), "full", True) == (
+            PNG_FORMAT,
+            METADATA,
+        )
+        assert self.cache.get(self._path_info(), "full", False) is None
+
+    def test_old_schema(self) -> None:
+        """Test a cache from an older version is rebuilt."""
+        self.cache._conn.execute("DROP TABLE formats")
+        self.cache._conn.execute("CREATE TABLE formats (dev INTEGER)")
+        cache = FormatCache(DB_PATH)
+        cache.put(self._path_info(), "full", PNG_FORMAT, {}, False)
+        assert cache.get(self._path_info(), "full", False) == (PNG_FORMAT, {})
+
+    def test_unstorable_info(self) -> None:
+        """Test files with info JSON can't hold aren't cached."""
+        self.cache.put(self._path_info(), "full", PNG_FORMAT, {"x": object()}, True)
+        assert self.cache.get(self._path_info(), "full", True) is None
+
+    def test_unidentified(self) -> None:
+        """Test files without a format hit too."""
+        self.cache.put(self._path_info(), "full", None, {}, False)
+        assert self.cache.get(self._path_info(), "full", False) == (None, {})
+
+    def test_changed_mtime(self) -> None:
+        """Test a touched file misses."""
+        self.cache.put(self._path_info(), "full", PNG_FORMAT, {}, False)
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        assert self.cache.get(self._path_info(), "full", False) is None
+
+    def test_renamed_suffix(self) -> None:
+        """Test a file renamed to another suffix misses."""
+        self.cache.put(self._path_info(), "full", PNG_FORMAT, {}, False)
+        new_path = self.path.with_suffix(".webp")
+        self.path.rename(new_path)
+        assert self.cache.get(self._path_info(new_path), "full", False) is None
+
+    def test_weaker_verify(self) -> None:
+        """Test entries only satisfy the same or weaker verify settings."""
+        self.cache.put(self._path_info(), "header", PNG_FORMAT, {}, False)
+        assert self.cache.get(self._path_info(), "full", False) is None
+        assert self.cache.get(self._path_info(), "header", False)
+        assert self.cache.get(self._path_info(), "none", False)
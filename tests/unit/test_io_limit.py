@@ -0,0 +1,49 @@
+"""Test the shared io rate limiter."""
+
+from time import monotonic
+
+from picopt.io_limit import IOLimiter, open_read, set_io_limiter
+from tests import IMAGES_DIR
+
+__all__ = ()  # hides module from pydocstring
+MB = 1024 * 1024
+IOPS = 20
+
+
+def test_bytes_limit() -> None:
+    """Test reads past the burst wait for the rate."""
+    limiter = IOLimiter(read_mbps=1)
+    start = monotonic()
+    limiter.read(MB)
+    assert monotonic() - start < 0.1  # noqa: PLR2004
+    limiter.read(MB // 4)
+    assert monotonic() - start >= 0.2  # noqa: PLR2004
+    read_wait, read_bytes, write_wait, write_bytes = limiter._stats[:]
+    assert read_wait >= 0.2  # noqa: PLR2004
+    assert read_bytes == MB + MB // 4
+    assert not write_wait
+    assert not write_bytes
+
+
+def test_iops_limit() -> None:
+    """Test operations past the burst wait for the rate."""
+    limiter = IOLimiter(write_iops=IOPS)
+    for _ in range(IOPS):
+        limiter.write(1)
+    assert limiter._stats[2] < 0.1  # noqa: PLR2004
+    limiter.write(1)
+    limiter.write(1)
+    assert limiter._stats[2] > 0
+
+
+def test_open_read() -> None:
+    """Test file reads are counted."""
+    limiter = IOLimiter(read_mbps=100)
+    path = IMAGES_DIR / "test_png.png"
+    set_io_limiter(limiter)
+    try:
+        with open_read(path) as fp:
+            data = fp.read()
+    finally:
+        set_io_limiter(None)
+    assert limiter._stats[1] == len(data) == path.stat().st_size
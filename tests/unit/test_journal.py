@@ -0,0 +1,53 @@
+"""Test the run journal."""
+
+import shutil
+from argparse import Namespace
+
+from picopt.config import get_config
+from picopt.path import PathInfo
+from picopt.walk.journal import RunJournal
+from tests import IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+PNG_PATH = TMP_ROOT / "test_png.png"
+
+
+class TestRunJournal:
+    """Test journal replay."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_replay(self) -> None:
+        """Test entries survive a torn write and are replayed."""
+        config = get_config()
+        journal = RunJournal(config, TMP_ROOT)
+        journal.record(PNG_PATH, 100, 50)
+        journal.close()
+        with journal.path.open("a") as journal_file:
+            journal_file.write('["torn')
+
+        journal = RunJournal(config, TMP_ROOT)
+        assert journal.entries[str(PNG_PATH)][1:] == (100, 50)
+        path_info = PathInfo(TMP_ROOT, 0.0, True, True, path=PNG_PATH)
+        assert journal.is_finished(path_info)
+        journal.record(TMP_ROOT / "other.png", 10, 10)
+        journal.close()
+        assert len(RunJournal(config, TMP_ROOT).entries) == 2  # noqa: PLR2004
+
+        journal.remove()
+        assert not journal.path.exists()
+
+    def test_opt_in(self) -> None:
+        """Test runs only keep a journal when asked."""
+        assert not get_config().journal
+        args = Namespace(picopt=Namespace(config=None, journal=True))
+        assert get_config(args).journal
@@ -0,0 +1,74 @@
+"""Test the content hash ledger."""
+
+import shutil
+
+from picopt.config import get_config
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from picopt.walk.ledger import Ledger, hash_file
+from tests import IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+LEDGER_PATH = TMP_ROOT / "ledger.sqlite"
+PNG_PATH = TMP_ROOT / "test_png.png"
+COPY_PATH = TMP_ROOT / "copy.png"
+
+
+class TestLedger:
+    """Test ledger lookups."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def _path_info(path) -> PathInfo:
+        return PathInfo(TMP_ROOT, 0.0, True, True, path=path)
+
+    def test_no_gain(self) -> None:
+        """Test content that gained nothing is skipped at any path."""
+        config = get_config()
+        ledger = Ledger(config, LEDGER_PATH)
+        assert not ledger.is_done(self._path_info(PNG_PATH))
+        assert not ledger.is_hashed(PNG_PATH)
+        assert not ledger.add_hash(self._path_info(PNG_PATH), hash_file(PNG_PATH))
+        assert ledger.is_hashed(PNG_PATH)
+        bytes_in = PNG_PATH.stat().st_size
+        report = ReportStats(PNG_PATH, bytes_in=bytes_in, bytes_out=bytes_in)
+        assert ledger.record(PNG_PATH, report) is None
+        ledger.close()
+
+        shutil.copy(PNG_PATH, COPY_PATH)
+        ledger = Ledger(config, LEDGER_PATH)
+        assert ledger.is_done(self._path_info(PNG_PATH))
+        # An unknown path is only done once a worker hashes it.
+        assert not ledger.is_done(self._path_info(COPY_PATH))
+        assert ledger.add_hash(self._path_info(COPY_PATH), hash_file(COPY_PATH))
+        assert ledger.is_done(self._path_info(COPY_PATH))
+        ledger.close()
+
+    def test_optimized(self) -> None:
+        """Test optimized output is skipped and its unoptimized input is not."""
+        config = get_config()
+        shutil.copy(PNG_PATH, COPY_PATH)
+        ledger = Ledger(config, LEDGER_PATH)
+        ledger.add_hash(self._path_info(PNG_PATH), hash_file(PNG_PATH))
+        bytes_in = PNG_PATH.stat().st_size
+        PNG_PATH.write_bytes(PNG_PATH.read_bytes()[:-1])
+        report = ReportStats(PNG_PATH, bytes_in=bytes_in, bytes_out=bytes_in - 1)
+        assert ledger.record(PNG_PATH, report) == PNG_PATH
+        assert not ledger.is_done(self._path_info(PNG_PATH))
+        ledger.record_output(PNG_PATH, hash_file(PNG_PATH))
+        assert ledger.is_done(self._path_info(PNG_PATH))
+        assert not ledger.add_hash(self._path_info(COPY_PATH), hash_file(COPY_PATH))
+
+        PNG_PATH.write_bytes(b"changed")
+        assert not ledger.is_done(self._path_info(PNG_PATH))
+        ledger.close()
@@ -0,0 +1,50 @@
+"""Test the optimized output cache."""
+
+import os
+import shutil
+from io import BytesIO
+
+from picopt.handlers.output_cache import OutputCache
+from tests import get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+
+
+class TestOutputCache:
+    """Test cache entries and eviction."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_key(self) -> None:
+        """Test keys depend on the settings and the input."""
+        buffer = BytesIO(b"input")
+        key = OutputCache.get_key("a", buffer)
+        assert buffer.tell() == 0
+        assert key == OutputCache.get_key("a", BytesIO(b"input"))
+        assert key != OutputCache.get_key("b", BytesIO(b"input"))
+        assert key != OutputCache.get_key("a", BytesIO(b"other"))
+
+    def test_lru(self) -> None:
+        """Test the least recently used entries are evicted."""
+        cache = OutputCache(TMP_ROOT, 250)
+        cache.put("aa1", b"x" * 100)
+        cache.put("bb2", b"y" * 100)
+        for index, key in enumerate(("aa1", "bb2")):
+            path = TMP_ROOT / key[:2] / key
+            os.utime(path, (index, index))
+        assert cache.get("aa1") == b"x" * 100
+        cache.put("cc3", b"")
+        assert cache.get("cc3") == b""
+        assert cache.evict() == 0
+        cache.put("dd4", b"z" * 100)
+        assert cache.get("bb2") is None
+        assert cache.get("aa1") == b"x" * 100
+        assert cache.get("missing") is None
@@ -0,0 +1,45 @@
+"""Test the background priority options."""
+
+import os
+from argparse import Namespace
+
+import pytest
+
+from picopt.config import get_config
+from picopt.exceptions import PicoptError
+from picopt.priority import parse_cpu_list, set_priority
+
+__all__ = ()  # hides module from pydocstring
+
+
+def test_parse_cpu_list() -> None:
+    """Test taskset style cpu lists."""
+    assert parse_cpu_list("0") == frozenset({0})
+    assert parse_cpu_list("0-3,8") == frozenset({0, 1, 2, 3, 8})
+    assert parse_cpu_list(" 2, 4-5") == frozenset({2, 4, 5})
+
+
+def test_bad_cpu_list() -> None:
+    """Test malformed cpu lists are config errors."""
+    for cpu_list in ("x", "1-", "3-1"):
+        with pytest.raises(PicoptError):
+            parse_cpu_list(cpu_list)
+
+
+def test_bad_ionice_level() -> None:
+    """Test out of range io priority levels."""
+    with pytest.raises(PicoptError):
+        set_priority(None, None, "best-effort", 8)
+
+
+def test_unset() -> None:
+    """Test nothing changes by default."""
+    assert set_priority(None, None, None, None) == []
+
+
+def test_config_is_inert() -> None:
+    """Test building a config leaves the process priority alone."""
+    nice = os.getpriority(os.PRIO_PROCESS, 0)
+    config = get_config(Namespace(picopt=Namespace(config=None, nice=nice + 1)))
+    assert config.nice == nice + 1
+    assert os.getpriority(os.PRIO_PROCESS, 0) == nice
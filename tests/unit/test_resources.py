@@ -0,0 +1,81 @@
+"""Test detecting cgroup CPU and memory limits."""
+
+import os
+import shutil
+
+from picopt.resources import detect_resources
+from tests import get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+CGROUP_ROOT = TMP_ROOT / "cgroup"
+PROC_CGROUP = TMP_ROOT / "proc_cgroup"
+QUOTA_CPUS = 4
+MEMORY_LIMIT = 512 * 1024 * 1024
+V1_UNLIMITED = "9223372036854771712"
+
+
+def _write(rel_path: str, text: str) -> None:
+    path = CGROUP_ROOT / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text + "\n")
+
+
+def _affinity_cpus() -> int:
+    return len(os.sched_getaffinity(0))
+
+
+class TestResources:
+    """Test cgroup v1 and v2 trees."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        CGROUP_ROOT.mkdir(parents=True)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_v2(self) -> None:
+        """Test the unified hierarchy with limits on a parent."""
+        PROC_CGROUP.write_text("0::/pod/container\n")
+        _write("cgroup.controllers", "cpu memory")
+        _write("pod/cpu.max", f"{QUOTA_CPUS * 100000} 100000")
+        _write("pod/memory.max", str(MEMORY_LIMIT))
+        _write("pod/container/cpu.max", "max 100000")
+        _write("pod/container/memory.max", "max")
+        resources = detect_resources(CGROUP_ROOT, PROC_CGROUP)
+        assert resources.cpus == min(QUOTA_CPUS, _affinity_cpus())
+        assert resources.memory_limit == MEMORY_LIMIT
+
+    def test_v1(self) -> None:
+        """Test v1 controllers seen from inside a container."""
+        PROC_CGROUP.write_text(
+            "4:memory:/kubepods/pod1\n2:cpu,cpuacct:/kubepods/pod1\n1:pids:/\n"
+        )
+        _write("cpu,cpuacct/cpu.cfs_quota_us", "150000")
+        _write("cpu,cpuacct/cpu.cfs_period_us", "100000")
+        _write("memory/memory.limit_in_bytes", str(MEMORY_LIMIT))
+        resources = detect_resources(CGROUP_ROOT, PROC_CGROUP)
+        assert resources.cpus == min(2, _affinity_cpus())
+        assert resources.memory_limit == MEMORY_LIMIT
+
+    def test_unlimited(self) -> None:
+        """Test no limits fall back to the CPU affinity."""
+        PROC_CGROUP.write_text("2:cpu:/\n1:memory:/\n")
+        _write("cpu/cpu.cfs_quota_us", "-1")
+        _write("cpu/cpu.cfs_period_us", "100000")
+        _write("memory/memory.limit_in_bytes", V1_UNLIMITED)
+        resources = detect_resources(CGROUP_ROOT, PROC_CGROUP)
+        assert resources.cpus == _affinity_cpus()
+        assert resources.cpu_source == "CPU affinity"
+        assert resources.memory_limit is None
+
+    def test_affinity(self) -> None:
+        """Test a configured affinity is counted before it's set."""
+        PROC_CGROUP.write_text("0::/\n")
+        _write("cgroup.controllers", "cpu memory")
+        resources = detect_resources(CGROUP_ROOT, PROC_CGROUP, frozenset({0}))
+        assert resources.cpus == 1
+        assert resources.cpu_source == "CPU affinity"
@@ -0,0 +1,44 @@
+"""Test scandir walk module."""
+
+import shutil
+
+from picopt.path import PathInfo
+from picopt.walk.scandir import scandir_chunks
+from tests import IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+FNS = ("c.png", "a.png", "b.png")
+
+
+class TestScandir:
+    """Test scandir chunks."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        (TMP_ROOT / "subdir").mkdir(parents=True)
+        for fn in FNS:
+            shutil.copy(IMAGES_DIR / "test_png.png", TMP_ROOT / fn)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_scandir_chunks(self) -> None:
+        """Test chunks are sorted and primed with stat data."""
+        dir_path_info = PathInfo(TMP_ROOT, 0.0, True, True, path=TMP_ROOT)
+        chunks = tuple(scandir_chunks(dir_path_info, chunk_size=2))
+        assert len(chunks) == 2  # noqa: PLR2004
+        path_infos = [pi for chunk in chunks for pi in chunk]
+        for chunk in chunks:
+            names = [pi.path.name for pi in chunk]  # type: ignore
+            assert names == sorted(names)
+        for path_info in path_infos:
+            if path_info.path.name == "subdir":  # type: ignore
+                assert path_info.is_dir()
+                continue
+            assert not path_info.is_dir()
+            assert not path_info.is_symlink()
+            assert path_info._stat
+            assert path_info.bytes_in() == path_info.path.stat().st_size  # type: ignore
@@ -0,0 +1,271 @@
+"""Test the walk scheduler."""
+
+from pathlib import Path
+from threading import Lock
+from time import sleep
+
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from picopt.walk.executor import Executor
+from picopt.walk.scheduler import Scheduler, TaskGroup
+
+__all__ = ()  # hides module from pydocstring
+SIZES = (3, 10, 1, 7)
+MEMORIES = (3, 20, 1, 25, 7, 30, 2)
+MAX_MEMORY = 10
+MAX_IN_FLIGHT = 2
+# Deeper than the recursion limit if callbacks ran inside submit.
+CHAIN_LENGTH = 3000
+
+
+def _identity(value):
+    return value
+
+
+def _path_info(name: str) -> PathInfo:
+    return PathInfo(Path(), 0.0, True, True, path=Path(name))
+
+
+def _run(order: str) -> tuple[list[int], list[str]]:
+    results = []
+    done = []
+    executor = Executor("thread", 1)
+    try:
+        scheduler = Scheduler(executor, 1, order, order_window=len(SIZES))
+        top_group = TaskGroup(on_done=lambda: done.append("top"))
+        group = TaskGroup(top_group, on_done=lambda: done.append("dir"))
+        for size in SIZES:
+            path_info = PathInfo(
+                Path(), 0.0, True, True, path=Path(f"{size}.png"), data=b"x" * size
+            )
+            path_info._stat = True
+            scheduler.submit(group, results.append, path_info, _identity, (size,))
+        group.close()
+        top_group.close()
+        assert not done
+        scheduler.join()
+    finally:
+        executor.close()
+        executor.join()
+    return results, done
+
+
+def test_path_order() -> None:
+    """Test walk order."""
+    results, done = _run("path")
+    assert results == list(SIZES)
+    assert done == ["dir", "top"]
+
+
+def test_largest_order() -> None:
+    """Test largest first order."""
+    results, done = _run("largest")
+    assert results == sorted(SIZES, reverse=True)
+    assert done == ["dir", "top"]
+
+
+def test_byte_budget() -> None:
+    """Test tasks over the byte budget wait for others to finish."""
+    results = []
+    executor = Executor("thread", 4)
+    try:
+        scheduler = Scheduler(executor, 4, max_bytes=10)
+        group = TaskGroup()
+        for size in SIZES:
+            path_info = PathInfo(Path(), 0.0, True, True, path=Path(f"{size}.png"))
+            scheduler.submit(
+                group, results.append, path_info, _identity, (size,), size=size
+            )
+        group.close()
+        scheduler.join()
+    finally:
+        executor.close()
+        executor.join()
+    assert sorted(results) == sorted(SIZES)
+    assert scheduler.stats.tasks == len(SIZES)
+    assert scheduler.stats.peak_bytes <= max(10, *SIZES)
+    assert scheduler.stats.byte_blocks
+
+
+class _OversizedCounter:
+    """Record how many oversized tasks run at once."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._running = 0
+        self.peak = 0
+
+    def run(self, memory: int) -> int:
+        oversized = memory > MAX_MEMORY
+        if oversized:
+            with self._lock:
+                self._running += 1
+                self.peak = max(self.peak, self._running)
+        sleep(0.01)
+        if oversized:
+            with self._lock:
+                self._running -= 1
+        return memory
+
+
+def test_decode_memory() -> None:
+    """Test the decode memory ceiling and the oversized lane."""
+    results = []
+    counter = _OversizedCounter()
+    executor = Executor("thread", 4)
+    try:
+        scheduler = Scheduler(executor, 4, max_memory=MAX_MEMORY)
+        group = TaskGroup()
+        for memory in MEMORIES:
+            path_info = PathInfo(Path(), 0.0, True, True, path=Path(f"{memory}.png"))
+            scheduler.submit(
+                group,
+                results.append,
+                path_info,
+                counter.run,
+                (memory,),
+                size=0,
+                memory=memory,
+            )
+        group.close()
+        scheduler.join()
+    finally:
+        executor.close()
+        executor.join()
+    assert sorted(results) == sorted(MEMORIES)
+    assert counter.peak == 1
+    assert scheduler.stats.oversized == 3  # noqa: PLR2004
+    assert scheduler.stats.peak_memory <= MAX_MEMORY
+    assert scheduler.stats.memory_blocks
+
+
+class _RunningCounter:
+    """Record how many tasks run at once."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._running = 0
+        self.peak = 0
+
+    def run(self, value: int) -> int:
+        with self._lock:
+            self._running += 1
+            self.peak = max(self.peak, self._running)
+        sleep(0.005)
+        with self._lock:
+            self._running -= 1
+        return value
+
+
+def test_back_pressure() -> None:
+    """Test no more than the maximum tasks are in flight."""
+    results = []
+    counter = _RunningCounter()
+    executor = Executor("thread", 8)
+    try:
+        scheduler = Scheduler(executor, MAX_IN_FLIGHT)
+        group = TaskGroup()
+        for value in range(20):
+            scheduler.submit(
+                group, results.append, _path_info(f"{value}.png"), counter.run, (value,)
+            )
+        group.close()
+        scheduler.join()
+    finally:
+        executor.close()
+        executor.join()
+    assert sorted(results) == list(range(20))
+    assert counter.peak <= MAX_IN_FLIGHT
+    assert scheduler.stats.peak_depth <= MAX_IN_FLIGHT
+    assert scheduler.stats.blocked_seconds > 0
+
+
+class _Chain:
+    """Submit the next task from each callback like a container walk does."""
+
+    def __init__(self, scheduler: Scheduler, group: TaskGroup):
+        self._scheduler = scheduler
+        self._group = group
+        self._depth = 0
+        self.peak_depth = 0
+        self.results = []
+
+    def submit(self, value: int) -> None:
+        self._scheduler.submit(
+            self._group, self.callback, _path_info(f"{value}.png"), _identity, (value,)
+        )
+
+    def callback(self, value: int) -> None:
+        self._depth += 1
+        self.peak_depth = max(self.peak_depth, self._depth)
+        self.results.append(value)
+        if value < CHAIN_LENGTH:
+            self.submit(value + 1)
+        self._depth -= 1
+
+
+def test_callbacks_not_reentrant() -> None:
+    """Test callbacks never run inside another callback."""
+    done = []
+    executor = Executor("thread", 1)
+    try:
+        scheduler = Scheduler(executor, 1)
+        group = TaskGroup(on_done=lambda: done.append(True))
+        chain = _Chain(scheduler, group)
+        chain.submit(1)
+        group.close()
+        scheduler.join()
+    finally:
+        executor.close()
+        executor.join()
+    assert chain.results == list(range(1, CHAIN_LENGTH + 1))
+    assert chain.peak_depth == 1
+    assert done == [True]
+
+
+class _BrokenExecutor:
+    """An executor that can't accept tasks."""
+
+    def apply_async(self, *_args, **_kwargs) -> None:
+        reason = "pool closed"
+        raise ValueError(reason)
+
+
+def test_apply_error() -> None:
+    """Test a task the pool rejects finishes with an error instead of hanging."""
+    results = []
+    done = []
+    scheduler = Scheduler(_BrokenExecutor(), 1)  # type: ignore[arg-type]
+    group = TaskGroup(on_done=lambda: done.append(True))
+    scheduler.submit(group, results.append, _path_info("a.png"), _identity, (1,))
+    group.close()
+    scheduler.join()
+    assert len(results) == 1
+    assert isinstance(results[0], ReportStats)
+    assert isinstance(results[0].exc, ValueError)
+    assert done == [True]
+    assert not scheduler.stats.tasks
+
+
+def test_stop() -> None:
+    """Test stopping finishes the tasks in flight and drops the waiting ones."""
+    results = []
+    done = []
+    executor = Executor("thread", 4)
+    try:
+        scheduler = Scheduler(executor, 4, "largest", order_window=MAX_IN_FLIGHT)
+        group = TaskGroup(on_done=lambda: done.append(True))
+        for value in range(MAX_IN_FLIGHT + 1):
+            scheduler.submit(
+                group, results.append, _path_info(f"{value}.png"), _identity, (value,)
+            )
+        scheduler.stop()
+        scheduler.submit(group, results.append, _path_info("new.png"), _identity, (-1,))
+        group.close()
+        scheduler.join()
+    finally:
+        executor.close()
+        executor.join()
+    assert results == [0]
+    assert scheduler.stats.tasks == 1
+    assert done == [True]
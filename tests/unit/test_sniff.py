@@ -0,0 +1,40 @@
+"""Test header format sniffing."""
+
+from io import BytesIO
+
+from picopt.handlers.sniff import Sniffed, sniff_format
+from tests import CONTAINER_DIR, IMAGES_DIR
+
+__all__ = ()  # hides module from pydocstring
+
+FNS = {
+    IMAGES_DIR / "test_png.png": Sniffed("PNG", True, False),
+    IMAGES_DIR / "test_animated_png.png": Sniffed("PNG", True, True, 20),
+    IMAGES_DIR / "test_jpg.jpg": Sniffed("JPEG", False, False),
+    IMAGES_DIR / "test_gif.gif": Sniffed("GIF"),
+    IMAGES_DIR / "test_animated_gif.gif": Sniffed("GIF", True, True),
+    IMAGES_DIR / "test_webp_lossy.webp": Sniffed("WEBP", False, False),
+    IMAGES_DIR / "test_webp_lossless.webp": Sniffed("WEBP", True, False),
+    IMAGES_DIR / "test_animated_webp.webp": Sniffed("WEBP", True, True, 4),
+    IMAGES_DIR / "test_svg.svg": Sniffed("SVG", is_image=False),
+    IMAGES_DIR / "test_bmp.bmp": None,
+    IMAGES_DIR / "test_txt.txt": None,
+    CONTAINER_DIR / "test_cbz.cbz": Sniffed("ZIP", is_image=False),
+    CONTAINER_DIR / "test_rar.rar": Sniffed("RAR", is_image=False),
+}
+
+
+def test_sniff_format() -> None:
+    """Test formats are read from headers."""
+    for path, sniffed in FNS.items():
+        with path.open("rb") as fp:
+            assert sniff_format(fp) == sniffed, path
+
+
+def test_sniff_buffer() -> None:
+    """Test sniffing an in memory buffer."""
+    path = IMAGES_DIR / "test_animated_webp.webp"
+    sniffed = sniff_format(BytesIO(path.read_bytes()))
+    assert sniffed
+    assert sniffed.is_complete()
+    assert sniffed.get_info() == {"animated": True, "n_frames": 4}
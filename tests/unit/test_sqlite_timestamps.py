@@ -0,0 +1,55 @@
+"""Test the SQLite timestamps backend."""
+
+import shutil
+import sqlite3
+
+from picopt.config import get_config
+from picopt.walk.sqlite_timestamps import DB_NAME, SQLiteTreestamps
+from tests import get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+SUB_DIR = TMP_ROOT / "a" / "b"
+
+
+class TestSQLiteTreestamps:
+    """Test timestamp inheritance, compaction and persistence."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        SUB_DIR.mkdir(parents=True)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def _count_rows(self) -> int:
+        conn = sqlite3.connect(TMP_ROOT / DB_NAME)
+        try:
+            return conn.execute("SELECT count(*) FROM stamps").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_inherit_and_compact(self) -> None:
+        """Test directory timestamps cover the files below them."""
+        config = get_config()
+        timestamps = SQLiteTreestamps(config, TMP_ROOT)
+        assert timestamps.get(SUB_DIR / "x.png") is None
+        timestamps.set(SUB_DIR / "x.png", 10.0)
+        timestamps.set(SUB_DIR / "y.png", 30.0)
+        assert timestamps.get(SUB_DIR / "x.png") == 10.0  # noqa: PLR2004
+        timestamps.set(TMP_ROOT / "a", 20.0, compact=True)
+        assert timestamps.get(SUB_DIR / "x.png") == 20.0  # noqa: PLR2004
+        assert timestamps.get(SUB_DIR / "y.png") == 30.0  # noqa: PLR2004
+        assert timestamps.get(TMP_ROOT / "z.png") is None
+        timestamps.dump()
+        # x.png was compacted away
+        assert self._count_rows() == 2  # noqa: PLR2004
+
+        timestamps = SQLiteTreestamps(config, TMP_ROOT)
+        assert timestamps.get(SUB_DIR / "x.png") == 20.0  # noqa: PLR2004
+        timestamps.set(TMP_ROOT, 40.0, compact=True)
+        assert timestamps.get(SUB_DIR / "y.png") == 40.0  # noqa: PLR2004
+        timestamps.dump()
+        assert self._count_rows() == 1
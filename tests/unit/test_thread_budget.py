@@ -0,0 +1,24 @@
+"""Test the thread budget."""
+
+from picopt import thread_budget
+from picopt.thread_budget import ThreadBudget, init_worker
+
+__all__ = ()  # hides module from pydocstring
+
+
+def test_threads_budget() -> None:
+    """Test spare cores go to stages only while workers are idle."""
+    budget = ThreadBudget(2, cpus=4)
+    assert budget.threads_per_job == 2  # noqa: PLR2004
+    init_worker(*budget.initargs)
+    try:
+        budget.set_in_flight(8)
+        with thread_budget.threads(4) as threads:
+            assert threads == 3  # noqa: PLR2004
+            with thread_budget.threads(4) as more_threads:
+                assert more_threads == 1
+        budget.set_in_flight(1)
+        with thread_budget.threads(8) as threads:
+            assert threads == 4  # noqa: PLR2004
+    finally:
+        thread_budget._free_threads = None
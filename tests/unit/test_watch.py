@@ -0,0 +1,82 @@
+"""Test watch mode helpers."""
+
+import shutil
+import sqlite3
+from argparse import Namespace
+from time import sleep
+
+import pytest
+
+from picopt.config import get_config
+from picopt.walk.sqlite_timestamps import DB_NAME
+from picopt.walk.watch import Debouncer, PollingWatcher, Watch
+from tests import IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+PNG_PATH = TMP_ROOT / "test_png.png"
+
+
+class _PollingWatcher(PollingWatcher):
+    POLL_SECONDS = 0
+
+
+class TestWatch:
+    """Test change detection."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_polling_watcher(self) -> None:
+        """Test polling finds new files."""
+        watcher = _PollingWatcher(get_config(), (TMP_ROOT,))
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+        assert watcher.read(0) == {PNG_PATH}
+        assert watcher.read(0) == set()
+
+    def test_debouncer(self) -> None:
+        """Test paths are held until they stop changing."""
+        debouncer = Debouncer(0.01)
+        PNG_PATH.write_bytes(b"partial")
+        debouncer.touch(PNG_PATH)
+        assert debouncer.pop_ready() == []
+        sleep(0.02)
+        PNG_PATH.write_bytes(b"partial and more")
+        assert debouncer.pop_ready() == []
+        sleep(0.02)
+        assert debouncer.pop_ready() == [PNG_PATH]
+
+    @pytest.mark.parametrize("backend", ["yaml", "sqlite"])
+    def test_checkpoint(self, backend: str) -> None:
+        """Test timestamps are saved after each batch, not only at exit."""
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+        args = Namespace(
+            picopt=Namespace(
+                config=None,
+                paths=[str(TMP_ROOT)],
+                timestamps=True,
+                timestamps_backend=backend,
+                watch=True,
+                jobs=1,
+            )
+        )
+        watch = Watch(get_config(args))
+        watch._init_run()
+        try:
+            watch._walk_batch((PNG_PATH,))
+            watch._join()
+            if backend == "yaml":
+                saved = (TMP_ROOT / ".picopt_treestamps.yaml").read_text()
+                assert PNG_PATH.name in saved
+            else:
+                with sqlite3.connect(TMP_ROOT / DB_NAME) as conn:
+                    names = conn.execute("SELECT name FROM stamps").fetchall()
+                assert (PNG_PATH.name,) in names
+        finally:
+            watch._finish_run({})
@@ -0,0 +1,149 @@
+"""Test the distributed work queue."""
+
+import json
+import shutil
+from argparse import Namespace
+from zipfile import ZipFile
+
+import pytest
+
+from picopt.config import get_config
+from picopt.exceptions import PicoptError
+from picopt.path import PathInfo
+from picopt.walk.distributed import (
+    DONE,
+    ERROR,
+    WorkQueue,
+    _decode_path_info,
+    _encode_path_info,
+    get_config_fingerprint,
+    work,
+)
+from tests import CONTAINER_DIR, IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+QUEUE_PATH = TMP_ROOT / "queue.sqlite"
+PNG_PATH = TMP_ROOT / "test_png.png"
+ZIP_PATH = CONTAINER_DIR / "test_zip.zip"
+
+
+def _get_config(**kwargs):
+    return get_config(
+        Namespace(
+            picopt=Namespace(
+                config=None, formats=["PNG"], queue=str(QUEUE_PATH), **kwargs
+            )
+        )
+    )
+
+
+def _put_file(queue: WorkQueue, fingerprint: str) -> int:
+    path_info = PathInfo(TMP_ROOT, 0.0, True, True, path=PNG_PATH)
+    task = {
+        "config": fingerprint,
+        "task": "file",
+        "path_info": _encode_path_info(path_info),
+    }
+    return queue.put(json.dumps(task).encode())
+
+
+class TestWorkQueue:
+    """Test leasing tasks."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    def test_expired_lease_requeued(self) -> None:
+        """Test a task from a dead worker is leased again."""
+        queue = WorkQueue(QUEUE_PATH, lease_seconds=-1)
+        queue.reset()
+        task_id = queue.put(b"task")
+        assert queue.lease("dead") == (task_id, b"task")
+        assert queue.lease("alive") == (task_id, b"task")
+        queue.finish(task_id, "dead", DONE, b"late")
+        queue.finish(task_id, "alive", DONE, b"result")
+        assert queue.take_finished() == [(task_id, DONE, b"result")]
+        assert queue.lease("alive") is None
+
+    def test_work(self) -> None:
+        """Test a worker rebuilds tasks from paths until the queue is closed."""
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+        config = _get_config()
+        queue = WorkQueue(QUEUE_PATH)
+        queue.reset()
+        task_id = _put_file(queue, get_config_fingerprint(config))
+        queue.close()
+        assert work(config) == 1
+        [(finished_id, state, result)] = WorkQueue(QUEUE_PATH).take_finished()
+        assert (finished_id, state) == (task_id, DONE)
+        report = json.loads(result)
+        assert report["type"] == "report"
+        assert report["path"] == str(PNG_PATH)
+        assert not report["error"]
+        assert report["bytes_out"] == PNG_PATH.stat().st_size
+
+    def test_other_config(self) -> None:
+        """Test a worker refuses tasks from a coordinator with other settings."""
+        shutil.copy(IMAGES_DIR / "test_png.png", PNG_PATH)
+        original = PNG_PATH.read_bytes()
+        queue = WorkQueue(QUEUE_PATH)
+        queue.reset()
+        fingerprint = get_config_fingerprint(_get_config(keep_metadata=False))
+        _put_file(queue, fingerprint)
+        queue.close()
+        assert work(_get_config(keep_metadata=True)) == 1
+        [(_, state, result)] = WorkQueue(QUEUE_PATH).take_finished()
+        assert state == ERROR
+        assert "differ" in json.loads(result)["error"]
+        assert PNG_PATH.read_bytes() == original
+
+    def test_coordinator_gone(self) -> None:
+        """Test a worker stops when the coordinator stops beating."""
+        queue = WorkQueue(QUEUE_PATH)
+        queue.reset()
+        assert work(_get_config(), coordinator_timeout=0) == 0
+
+    def test_untrusted(self) -> None:
+        """Test queues other users can write are refused."""
+        WorkQueue(QUEUE_PATH)
+        assert not QUEUE_PATH.stat().st_mode & 0o077
+        QUEUE_PATH.chmod(0o666)
+        with pytest.raises(PicoptError):
+            WorkQueue(QUEUE_PATH)
+        QUEUE_PATH.chmod(0o600)
+        TMP_ROOT.chmod(0o777)
+        try:
+            with pytest.raises(PicoptError):
+                WorkQueue(QUEUE_PATH)
+        finally:
+            TMP_ROOT.chmod(0o755)
+
+
+def test_archived_path_info() -> None:
+    """Test archived files are sent to workers by archive path and member."""
+    with ZipFile(ZIP_PATH) as archive:
+        zipinfo = archive.infolist()[-1]
+        data = archive.read(zipinfo)
+    path_info = PathInfo(
+        TMP_ROOT,
+        1.0,
+        True,
+        True,
+        zipinfo=zipinfo,
+        container_paths=(str(ZIP_PATH),),
+        archive_path=ZIP_PATH,
+    )
+    encoded = json.loads(json.dumps(_encode_path_info(path_info)))
+    decoded = _decode_path_info(encoded)
+    assert decoded.name() == path_info.name()
+    assert decoded.container_paths == path_info.container_paths
+    assert decoded.mtime() == path_info.mtime()
+    assert decoded.bytes_in() == zipinfo.file_size
+    assert decoded.data() == data
@@ -0,0 +1,56 @@
+"""Test identifying and optimizing in the workers."""
+
+import shutil
+from argparse import Namespace
+
+from picopt.config import get_config
+from picopt.handlers.zip import Zip
+from picopt.path import PathInfo
+from picopt.stats import ReportStats
+from picopt.walk.worker import optimize_file
+from tests import CONTAINER_DIR, IMAGES_DIR, get_test_dir
+
+__all__ = ()  # hides module from pydocstring
+TMP_ROOT = get_test_dir()
+
+
+class TestOptimizeFile:
+    """Test the worker task for loose files."""
+
+    def setup_method(self) -> None:
+        """Set up method."""
+        self.teardown_method()
+        TMP_ROOT.mkdir(parents=True)
+        for path in (
+            IMAGES_DIR / "test_png.png",
+            IMAGES_DIR / "test_txt.txt",
+            CONTAINER_DIR / "test_zip.zip",
+        ):
+            shutil.copy(path, TMP_ROOT)
+
+    def teardown_method(self) -> None:
+        """Tear down method."""
+        shutil.rmtree(TMP_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def _optimize(name: str, **kwargs):
+        config = get_config(
+            Namespace(picopt=Namespace(config=None, formats=["PNG", "ZIP"], **kwargs))
+        )
+        path_info = PathInfo(TMP_ROOT, 0.0, True, True, path=TMP_ROOT / name)
+        return optimize_file(config, path_info)
+
+    def test_image(self) -> None:
+        """Test images are identified and optimized."""
+        for verify in ("full", "header", "none"):
+            report = self._optimize("test_png.png", verify=verify, keep_metadata=False)
+            assert isinstance(report, ReportStats)
+            assert not report.exc
+
+    def test_container(self) -> None:
+        """Test containers come back to the walk to unpack."""
+        assert isinstance(self._optimize("test_zip.zip"), Zip)
+
+    def test_unhandled(self) -> None:
+        """Test files picopt doesn't handle."""
+        assert self._optimize("test_txt.txt") is None